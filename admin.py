@@ -6,7 +6,12 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from helpers import *
-from constants import LEVELS
+from db import db_session, async_db_session, pool
+from cache import CACHES
+from render import RENDER_SERVICE
+from assets import ASSETS
+from constants import MAX_LEVEL
+from levels import exp_for_level
 
 # ID администратора
 ADMIN_ID = [
@@ -61,7 +66,8 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "💰 `/admin_money` - деньги\n"
         "⭐ `/admin_level` - уровень\n"
         "✨ `/admin_talent` - таланты\n"
-        "🏢 `/admin_biz` - бизнесы"
+        "🏢 `/admin_biz` - бизнесы\n"
+        "📊 `/admin_stats` - пул БД и кэши"
     )
 
     if update.message:
@@ -117,7 +123,7 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "• `/admin_level 100` (ответом) - установить 100 lvl\n\n"
             "*Примечание:*\n"
             "Уровень устанавливается через опыт.\n"
-            f"Максимальный уровень: {max(lvl for lvl, _ in LEVELS)}"
+            f"Максимальный уровень: {MAX_LEVEL}"
         )
 
     elif action == "admin_help_talents":
@@ -138,8 +144,8 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from constants import BUSINESS_LIST
 
         biz_list = "\n".join([
-            f"`{i + 1}` - {biz['name']}"
-            for i, biz in enumerate(BUSINESS_LIST[:10])  # Первые 10
+            f"`{biz['id']}` - {biz['name']}"
+            for biz in BUSINESS_LIST[:10]  # Первые 10
         ])
 
         text = (
@@ -163,6 +169,8 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Установить уровень таланта\n\n"
             "🏢 `/admin_biz <кому> <id>`\n"
             "Выдать бизнес\n\n"
+            "📊 `/admin_stats`\n"
+            "Состояние пула БД и кэшей\n\n"
             "*Указать игрока:*\n"
             "• `@username` - по имени\n"
             "• Ответ на сообщение - по контексту"
@@ -226,11 +234,9 @@ async def admin_give_money(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Некорректная сумма")
         return
 
-    # Выдаём/забираем деньги
-    current_balance = get_balance(target_id, None)
-    new_balance = current_balance + amount
-
-    set_balance(target_id, new_balance)
+    # Выдаём/забираем деньги одним UPDATE (админ может увести баланс в минус)
+    adjust_balance(target_id, amount, None)
+    new_balance = get_balance(target_id, None)
 
     action = "выдано" if amount > 0 else "забрано"
 
@@ -289,21 +295,19 @@ async def admin_set_level(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Находим опыт для этого уровня
-    target_exp = next((exp for lvl, exp in LEVELS if lvl == level), None)
-
-    if target_exp is None:
-        await update.message.reply_text(f"❌ Уровень {level} не существует (макс {max(lvl for lvl, _ in LEVELS)})")
+    if not 1 <= level <= MAX_LEVEL:
+        await update.message.reply_text(f"❌ Уровень {level} не существует (макс {MAX_LEVEL})")
         return
 
-    # Устанавливаем опыт
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
+    target_exp = exp_for_level(level)
 
-    cursor.execute(
-        "UPDATE users SET experience = %s, level = %s WHERE telegram_id = %s",
-        (target_exp, level, target_id)
-    )
-    conn.commit()
+    # Устанавливаем опыт
+    async with async_db_session() as session:
+        await session.execute(
+            "UPDATE users SET experience = %s, level = %s WHERE telegram_id = %s",
+            (target_exp, level, target_id)
+        )
+        await session.commit()
 
     await update.message.reply_text(
         f"✅ *Готово!*\n\n"
@@ -393,14 +397,14 @@ async def admin_set_talent(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Устанавливаем талант
     ensure_talent_exists(target_id)
 
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
+    async with async_db_session() as session:
+        await session.execute(
+            f"UPDATE talents SET {talent} = %s WHERE user_id = %s",
+            (level, target_id)
+        )
+        await session.commit()
 
-    cursor.execute(
-        f"UPDATE talents SET {talent} = %s WHERE user_id = %s",
-        (level, target_id)
-    )
-    conn.commit()
+    invalidate_user_talents(target_id)
 
     await update.message.reply_text(
         f"✅ *Готово!*\n\n"
@@ -417,14 +421,14 @@ async def admin_give_business(update: Update, context: ContextTypes.DEFAULT_TYPE
     /admin_biz @username 1
     /admin_biz (ответом) 5
     """
-    from constants import BUSINESS_LIST
+    from constants import BUSINESS_LIST, BUSINESS_BY_ID
     from helpers import add_user_business
 
     if not context.args:
         # Показываем список бизнесов
         biz_list = "\n".join([
-            f"`{i + 1}` - {biz['name']}"
-            for i, biz in enumerate(BUSINESS_LIST)
+            f"`{biz['id']}` - {biz['name']}"
+            for biz in BUSINESS_LIST
         ])
 
         await update.message.reply_text(
@@ -466,7 +470,7 @@ async def admin_give_business(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❌ Укажи пользователя")
         return
 
-    if biz_id < 1 or biz_id > len(BUSINESS_LIST):
+    if biz_id not in BUSINESS_BY_ID:
         await update.message.reply_text(
             f"❌ Бизнес #{biz_id} не существует\n"
             f"Доступны: 1-{len(BUSINESS_LIST)}"
@@ -480,7 +484,7 @@ async def admin_give_business(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❌ У игрока уже есть этот бизнес")
         return
 
-    biz = BUSINESS_LIST[biz_id - 1]
+    biz = BUSINESS_BY_ID[biz_id]
 
     await update.message.reply_text(
         f"✅ *Готово!*\n\n"
@@ -491,19 +495,59 @@ async def admin_give_business(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
 
+@admin_only
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/admin_stats - состояние пула соединений, кэшей и отрисовки"""
+    db_stats = pool.stats()
+
+    text = (
+        f"📊 *Статистика*\n\n"
+        f"🗄 Пул БД: открыто {db_stats['opened']}/{db_stats['size']}, "
+        f"свободно {db_stats['idle']}, выдано {db_stats['checked_out']}\n"
+    )
+
+    for name, cache in CACHES.items():
+        stats = cache.stats()
+        text += (
+            f"🧠 Кэш `{name}`: {stats['size']}/{stats['maxsize']}, "
+            f"попаданий {stats['hits']}, промахов {stats['misses']} ({stats['hit_rate']:.0%})\n"
+        )
+
+    assets = ASSETS.report()
+    mapped = sum(row['mapped'] for row in assets)
+    decoded = sum(row['decoded'] for row in assets)
+    text += (
+        f"🗂 Картинки: {len(assets)} файлов, mmap {mapped // 1024} КБ, "
+        f"декодировано {decoded // 1024} КБ\n"
+    )
+    for row in assets[:5]:
+        if row['mapped'] or row['decoded']:
+            text += f"   `{row['name']}`: mmap {row['mapped'] // 1024} КБ, декод. {row['decoded'] // 1024} КБ\n"
+
+    render_stats = RENDER_SERVICE.stats()
+    text += (
+        f"🖼 Отрисовка ({render_stats['executor']}, {render_stats['workers']}): "
+        f"ждут {render_stats['waiting']}, лимит очереди {render_stats['queue_size']}\n"
+    )
+    for name, stats in render_stats['renders'].items():
+        text += (
+            f"   `{name}`: {stats['count']} шт., среднее {stats['avg_ms']} мс, "
+            f"макс {stats['max_ms']} мс, ошибок {stats['errors']}\n"
+        )
+
+    await update.message.reply_text(text, parse_mode="Markdown")
+
+
 # ======================= ВСПОМОГАТЕЛЬНЫЕ =======================
 
 def find_user_by_username(username: str) -> int:
     """Поиск ID по username"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT telegram_id FROM users WHERE username = %s",
-        (username,)
-    )
+    with db_session() as session:
+        result = session.fetchone(
+            "SELECT telegram_id FROM users WHERE username = %s",
+            (username,)
+        )
 
-    result = cursor.fetchone()
     return result['telegram_id'] if result else None
 
 
@@ -515,5 +559,6 @@ __all__ = [
     'admin_give_money',
     'admin_set_level',
     'admin_set_talent',
-    'admin_give_business'
+    'admin_give_business',
+    'admin_stats'
 ]
@@ -0,0 +1,133 @@
+"""
+Картинки бота (images/, sprites/, roulette/)
+При старте только составляется список файлов. Файл отображается в память
+(mmap) при первом обращении, а PIL-картинка декодируется при первой отрисовке,
+поэтому импорт хэндлеров почти ничего не стоит. Занимаемая память видна
+через report() и /admin_stats
+
+    ASSETS.image("sprites/bell.png", "RGBA")  # декодированная картинка
+    ASSETS["images/start.jpg"]                # Asset для send_photo
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from PIL import Image
+
+ASSET_DIRS = ("images", "sprites", "roulette")
+
+
+class Asset:
+    """Один файл: содержимое через mmap, декодированные варианты по режиму PIL"""
+
+    def __init__(self, name: str, path: str, size: int):
+        self.name = name
+        self.path = path
+        self.size = size
+
+        self._map: Optional[mmap.mmap] = None
+        self._images: Dict[str, Image.Image] = {}
+        self._key: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def raw(self) -> mmap.mmap:
+        """Содержимое файла (страницы читаются из page cache по требованию)"""
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    with open(self.path, "rb") as f:
+                        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def read(self) -> bytes:
+        """Копия содержимого (нужна только для загрузки в Telegram)"""
+        return self.raw[:]
+
+    @property
+    def key(self) -> str:
+        """SHA-256 содержимого (ключ реестра file_id)"""
+        if self._key is None:
+            self._key = hashlib.sha256(self.raw).hexdigest()
+        return self._key
+
+    def image(self, mode: str) -> Image.Image:
+        """Декодированная картинка в режиме mode (декодируется один раз)"""
+        image = self._images.get(mode)
+        if image is None:
+            with self._lock:
+                image = self._images.get(mode)
+                if image is None:
+                    # mmap открывается отдельно: у общего объекта одна позиция чтения
+                    with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        image = Image.open(data).convert(mode)
+                    self._images[mode] = image
+        return image
+
+    def footprint(self) -> Dict[str, int]:
+        """Память: отображённый файл и декодированные картинки (байт)"""
+        decoded = sum(
+            image.width * image.height * len(image.getbands())
+            for image in list(self._images.values())
+        )
+        return {
+            "mapped": self.size if self._map is not None else 0,
+            "decoded": decoded
+        }
+
+
+class AssetManager:
+    """Индекс файлов по имени вида 'папка/файл'"""
+
+    def __init__(self, directories: Iterable[str]):
+        self._assets: Dict[str, Asset] = {}
+
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    name = f"{directory}/{entry.name}"
+                    self._assets[name] = Asset(name, entry.path, entry.stat().st_size)
+
+    def __getitem__(self, name: str) -> Asset:
+        return self._assets[name]
+
+    def names(self, directory: str) -> List[str]:
+        """Имена файлов папки (без пути)"""
+        prefix = f"{directory}/"
+        return sorted(name[len(prefix):] for name in self._assets if name.startswith(prefix))
+
+    def image(self, name: str, mode: str) -> Image.Image:
+        return self._assets[name].image(mode)
+
+    def report(self) -> List[Dict]:
+        """Память по файлам, начиная с самых тяжёлых"""
+        rows = []
+        for asset in self._assets.values():
+            footprint = asset.footprint()
+            rows.append({
+                "name": asset.name,
+                "size": asset.size,
+                "mapped": footprint["mapped"],
+                "decoded": footprint["decoded"]
+            })
+
+        rows.sort(key=lambda row: row["mapped"] + row["decoded"], reverse=True)
+        return rows
+
+
+ASSETS = AssetManager(ASSET_DIRS)
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'Asset',
+    'AssetManager',
+    'ASSETS'
+]
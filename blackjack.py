@@ -3,15 +3,16 @@ import random
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from constants import BLACKJACK, MIN_BET, LEVELS
-from helpers import (
-    get_balance, set_balance, spaced_num,
+from constants import BLACKJACK, MIN_BET
+from helpers import spaced_num, calculate_exp_multiplier
+from repository import (
+    get_balance, adjust_balance,
     get_experience, update_experience,
     get_user_bonuses, ensure_user_exists, parse_bet_amount,
-    calculate_exp_multiplier, create_blackjack_session,
+    create_blackjack_session,
     get_blackjack_session, delete_blackjack_session
 )
-from helpers import get_user_business_bonuses
+from repository import get_user_business_bonuses
 
 # Извлекаем константы из словаря
 RANKS = BLACKJACK["ranks"]
@@ -108,7 +109,7 @@ def calculate_game_result(
     }
 
 
-def calculate_exp_reward(result: str, bet: int, user_id: int) -> float:
+async def calculate_exp_reward(result: str, bet: int, user_id: int) -> float:
     """Расчёт опыта за игру с учётом множителей"""
     # Базовый опыт от результата
     base_exp = {
@@ -119,8 +120,8 @@ def calculate_exp_reward(result: str, bet: int, user_id: int) -> float:
     }.get(result, EXP_LOSS)
 
     # Бонусы от талантов и бизнесов
-    mastery_bonus = get_user_bonuses(user_id, 'mastery')
-    biz_bonuses = get_user_business_bonuses(user_id)
+    mastery_bonus = await get_user_bonuses(user_id, 'mastery')
+    biz_bonuses = await get_user_business_bonuses(user_id)
     business_bonus = biz_bonuses.get('game_mastery', 0)
 
     # Множитель от ставки
@@ -129,12 +130,12 @@ def calculate_exp_reward(result: str, bet: int, user_id: int) -> float:
     return round(base_exp * exp_mult, 1)
 
 
-def apply_luck_cashback(user_id: int, username: str, bet: int) -> Tuple[int, str]:
+async def apply_luck_cashback(user_id: int, username: str, bet: int) -> Tuple[int, str]:
     """
     Проверка и применение кэшбэка от таланта "Удача"
     Возвращает: (cashback_amount, bonus_text)
     """
-    luck_bonus = get_user_bonuses(user_id, 'luck')
+    luck_bonus = await get_user_bonuses(user_id, 'luck')
 
     if not luck_bonus:
         return 0, ''
@@ -142,8 +143,7 @@ def apply_luck_cashback(user_id: int, username: str, bet: int) -> Tuple[int, str
     # Проверка срабатывания (процент от luck_bonus)
     if random.randint(0, 100) < luck_bonus:
         cashback = round(bet * 0.2)
-        current_balance = get_balance(user_id, username)
-        set_balance(user_id, current_balance + cashback)
+        await adjust_balance(user_id, cashback)
 
         bonus_text = f"\n🍀 Тебе повезло! Возвращено 20% ({spaced_num(cashback)} $miles) от ставки!"
         return cashback, bonus_text
@@ -159,10 +159,10 @@ async def blackjack(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     username = user.username
 
-    ensure_user_exists(user)
+    await ensure_user_exists(user)
 
     # Проверка наличия активной сессии
-    if get_blackjack_session(user_id):
+    if await get_blackjack_session(user_id):
         await update.message.reply_text(
             "❌ У тебя уже есть активная игра. Заверши её, чтобы начать новую."
         )
@@ -178,34 +178,30 @@ async def blackjack(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Парсинг ставки
-    bet = parse_bet_amount(context.args[0], user_id, username)
+    bet = await parse_bet_amount(context.args[0], user_id, username)
 
     if bet is None:
         await update.message.reply_text("❌ Некорректная ставка")
         return
 
     # Проверка лимитов
-    balance = get_balance(user_id, username)
-
     if bet < MIN_BET:
         await update.message.reply_text(f"❌ Минимальная ставка: {spaced_num(MIN_BET)} $miles")
         return
 
-    if bet > balance:
+    # Снимаем ставку
+    if not await adjust_balance(user_id, -bet):
         await update.message.reply_text(
-            f"❌ Недостаточно средств.\n💰 Твой баланс: {spaced_num(balance)} $miles"
+            f"❌ Недостаточно средств.\n💰 Твой баланс: {spaced_num(await get_balance(user_id, username))} $miles"
         )
         return
 
-    # Снимаем ставку
-    set_balance(user_id, balance - bet)
-
     # Раздача карт
     player_cards = [deal_card(), deal_card()]
     dealer_cards = [deal_card(), deal_card()]
 
     # Создаём сессию
-    create_blackjack_session(user_id, bet, player_cards, dealer_cards)
+    await create_blackjack_session(user_id, bet, player_cards, dealer_cards)
 
     # Отображаем начальное состояние
     await send_blackjack_state(update, context, user_id)
@@ -218,7 +214,7 @@ async def send_blackjack_state(
         is_callback: bool = False
 ):
     """Отправка текущего состояния игры"""
-    session = get_blackjack_session(user_id)
+    session = await get_blackjack_session(user_id)
 
     if not session:
         if is_callback:
@@ -279,7 +275,7 @@ async def handle_blackjack_action(update: Update, context: ContextTypes.DEFAULT_
         return
 
     # Получение сессии
-    session = get_blackjack_session(user_id)
+    session = await get_blackjack_session(user_id)
 
     if not session:
         await query.answer("⚠️ Сессия не найдена или завершена", show_alert=True)
@@ -299,14 +295,14 @@ async def handle_blackjack_action(update: Update, context: ContextTypes.DEFAULT_
         # Проверка перебора
         if player_score > 21:
             # Игра окончена - перебор
-            exp_gained = calculate_exp_reward('loss', bet, user_id)
-            update_experience(user_id, exp_gained)
+            exp_gained = await calculate_exp_reward('loss', bet, user_id)
+            await update_experience(user_id, exp_gained)
 
             # Кэшбэк от удачи
-            cashback, bonus_text = apply_luck_cashback(user_id, username, bet)
+            cashback, bonus_text = await apply_luck_cashback(user_id, username, bet)
 
             # Информация об уровне
-            level_info = get_experience(user_id, username)
+            level_info = await get_experience(user_id, username)
             current_level = level_info[0]
             current_xp = level_info[1]
             next_level_xp = level_info[2]
@@ -317,15 +313,15 @@ async def handle_blackjack_action(update: Update, context: ContextTypes.DEFAULT_
                 f"❌ Ты проиграл {spaced_num(bet)}{bonus_text} $miles\n"
                 f"✨ Получено: {exp_gained} EXP\n"
                 f"⭐️ Уровень: {current_level} ({current_xp}/{next_level_xp})\n"
-                f"💰 Баланс: {spaced_num(get_balance(user_id, username))} $miles"
+                f"💰 Баланс: {spaced_num(await get_balance(user_id, username))} $miles"
             )
 
-            delete_blackjack_session(user_id)
+            await delete_blackjack_session(user_id)
             await query.edit_message_text(text, parse_mode="Markdown")
             return
 
         # Обновляем сессию и показываем состояние
-        create_blackjack_session(user_id, bet, player_cards, dealer_cards)
+        await create_blackjack_session(user_id, bet, player_cards, dealer_cards)
         await send_blackjack_state(update, context, user_id, is_callback=True)
 
     # ============= STAND - Остановиться =============
@@ -344,15 +340,14 @@ async def handle_blackjack_action(update: Update, context: ContextTypes.DEFAULT_
         win_bonus_amount = 0
         # Начисляем выигрыш
         if winnings > 0:
-            win_bonus = get_user_business_bonuses(user_id).get("win_multiplier", 0)
+            win_bonus = (await get_user_business_bonuses(user_id)).get("win_multiplier", 0)
             win_bonus_amount = int(winnings * win_bonus)
-            current_balance = get_balance(user_id, username)
-            set_balance(user_id, current_balance + winnings + win_bonus_amount)
+            await adjust_balance(user_id, winnings + win_bonus_amount)
 
         bonus_text = f"\n❇️ Бонус: {spaced_num(win_bonus_amount)} $miles" if win_bonus_amount else ""
         # Начисляем опыт
-        exp_gained = calculate_exp_reward(result, bet, user_id)
-        update_experience(user_id, exp_gained)
+        exp_gained = await calculate_exp_reward(result, bet, user_id)
+        await update_experience(user_id, exp_gained)
 
         # Формируем сообщение о результате
         result_messages = {
@@ -367,10 +362,10 @@ async def handle_blackjack_action(update: Update, context: ContextTypes.DEFAULT_
         # Кэшбэк от удачи (только при проигрыше)
         bonus_text = ''
         if result == 'loss':
-            cashback, bonus_text = apply_luck_cashback(user_id, username, bet)
+            cashback, bonus_text = await apply_luck_cashback(user_id, username, bet)
 
         # Информация об уровне
-        level_info = get_experience(user_id, username)
+        level_info = await get_experience(user_id, username)
         current_level = level_info[0]
         current_xp = level_info[1]
         next_level_xp = level_info[2]
@@ -381,10 +376,10 @@ async def handle_blackjack_action(update: Update, context: ContextTypes.DEFAULT_
             f"👤 Ты: {format_cards(player_cards)} (Очки: {player_score})\n\n"
             f"✨ Получено: {exp_gained} EXP\n"
             f"⭐️ Уровень: {current_level} ({current_xp}/{next_level_xp})\n"
-            f"💰 Баланс: {spaced_num(get_balance(user_id, username))} $miles"
+            f"💰 Баланс: {spaced_num(await get_balance(user_id, username))} $miles"
         )
 
-        delete_blackjack_session(user_id)
+        await delete_blackjack_session(user_id)
         await query.edit_message_text(text, parse_mode="Markdown")
 
 
@@ -0,0 +1,86 @@
+"""
+In-process кэши
+LRU с ограничением размера и временем жизни записей, счётчики попаданий/промахов
+доступны через stats() (все кэши - в CACHES, их показывает /admin_stats)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Все созданные кэши по имени
+CACHES: Dict[str, "LRUCache"] = {}
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш с TTL
+    Используется и из event loop, и из потоков executor'а БД
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+
+        # key -> (value, время записи)
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        CACHES[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+
+            if entry is not _MISSING and self.ttl is not None and time.monotonic() - entry[1] >= self.ttl:
+                del self._data[key]
+                entry = _MISSING
+
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Размер и счётчики попаданий"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'CACHES',
+    'LRUCache'
+]
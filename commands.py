@@ -1,29 +1,43 @@
 import json
 import random
 import asyncio
-import os
 from math import floor
 from datetime import datetime
 import io
+import itertools
+from typing import Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from PIL import Image
 from constants import (
-    SLOTS, LUCKY_WHEEL, MIN_BET, LEVELS,
+    SLOTS, LUCKY_WHEEL, MIN_BET,
     DEPOSITS, STEAL, HACK,
-    LUCKY_WHEEL_COOLDOWN, STEAL_COOLDOWN, BUSINESS_LIST, REF_SYSTEM, EXP_CASE_COOLDOWN, EXP_CASE
+    LUCKY_WHEEL_COOLDOWN, STEAL_COOLDOWN, REF_SYSTEM, EXP_CASE_COOLDOWN, EXP_CASE,
+    SPIN_IMAGE_CACHE
 )
 from helpers import (
-    get_balance, set_balance, spaced_num, cropped_num,
+    spaced_num, cropped_num, calculate_exp_multiplier,
+    safe_reply_text, check_promocode_requirements
+)
+from repository import (
+    get_balance, set_balance, adjust_balance, transfer,
     get_experience, update_experience, user_exists,
-    ensure_user_exists, ensure_talent_exists, get_user_talents,
-    get_user_bonuses, parse_bet_amount, calculate_exp_multiplier,
+    ensure_user_exists, get_player_snapshot,
+    get_user_bonuses, parse_bet_amount,
     check_lucky_wheel_availability, check_steal_availability,
-    get_cursor, update_user, check_deposit_ready, update_bank_balance, claim_bank_balance, get_all_users_with_deposit,
-    safe_reply_text, check_promocode, check_promocode_requirements, activate_promocode,
-    get_user_by_username, try_activate_promocode, check_exp_case_availability, calculate_total_income
+    check_deposit_ready, update_bank_balance, claim_bank_balance, take_due_deposits,
+    check_promocode, activate_promocode,
+    try_activate_promocode, check_exp_case_availability
 )
-from helpers import get_user_business_profile, get_user_business_bonuses
+from repository import get_user_business_bonuses
+from unit_of_work import unit_of_work
+from levels import exp_for_level
+from notifications import notify
+from cache import LRUCache
+from media import Frame, send_photo
+from render import RENDER_SERVICE
+from assets import ASSETS
+from leaderboard import BALANCE_TOP, LEVEL_TOP, get_balance_place
 
 # Извлекаем константы
 SLOTS_SYMBOLS = SLOTS["symbols"]
@@ -33,20 +47,15 @@ EXP_CASE_PRIZES = EXP_CASE["prizes"]
 
 # Константы вкладов
 DEPOSIT_OPTIONS = DEPOSITS
-# Кэширование изображений
-SPRITES_CACHE = {
-    symbol: Image.open(f'sprites/{SLOTS_EMOJI[symbol]}').convert("RGBA")
-    for symbol in SLOTS_EMOJI
-}
-STATE_CACHE = {
-    s: Image.open(f'sprites/{s}.jpg')
-    for s in ["jackpot", "win", "lose"]
+# Состояния /spin: фон sprites/{state}.jpg
+SPIN_STATES = ("jackpot", "win", "lose")
+# (барабан, состояние) -> Frame (JPEG и его хэш)
+SPIN_IMAGES = LRUCache("spin_images", SPIN_IMAGE_CACHE['maxsize'])
+# Картинки из images/ (читаются при первой отправке): START_IMG, HELP_IMG, ...
+IMAGE_CACHE = {
+    name.replace(".jpg", "").upper() + "_IMG": ASSETS[f"images/{name}"]
+    for name in ASSETS.names("images")
 }
-IMAGE_CACHE = {}
-for imgs in os.listdir("images"):
-    with open(os.path.join("images", imgs), 'rb') as f:
-        name = imgs.replace(".jpg", "").upper() + "_IMG"
-        IMAGE_CACHE[name] = f.read()
 
 
 # ======================= START & HELP =======================
@@ -56,15 +65,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     ref_id = update.message.text.split()[1] if len(update.message.text.split()) > 1 else None
 
-    played_before = ensure_user_exists(user)
+    played_before = await ensure_user_exists(user)
 
     # Обработка реферальной ссылки
-    if ref_id and user_exists(int(ref_id)):
+    if ref_id and await user_exists(int(ref_id)):
         if str(ref_id) != str(user.id):
             if not played_before:
                 # Новый пользователь по реферальной ссылке
-                set_balance(user.id, REF_SYSTEM["ref_get"]["balance"])
-                update_experience(user.id, REF_SYSTEM["ref_get"]["xp"])
+                await set_balance(user.id, REF_SYSTEM["ref_get"]["balance"])
+                await update_experience(user.id, REF_SYSTEM["ref_get"]["xp"])
 
                 await safe_reply_text(update.message,
                                       '✅ Добро пожаловать!\\n'
@@ -74,9 +83,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                       )
 
                 # Награда рефереру
-                ref_balance = get_balance(int(ref_id), None)
-                set_balance(int(ref_id), ref_balance + REF_SYSTEM["user_get"]["balance"])
-                update_experience(int(ref_id), REF_SYSTEM["user_get"]["xp"])
+                await adjust_balance(int(ref_id), REF_SYSTEM["user_get"]["balance"])
+                await update_experience(int(ref_id), REF_SYSTEM["user_get"]["xp"])
 
                 await context.bot.send_message(
                     chat_id=ref_id,
@@ -100,19 +108,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                   )
 
     # Приветственное сообщение
-    balance = get_balance(user.id, user.username)
-    player_level = get_experience(user.id, user.username)
+    balance = await get_balance(user.id, user.username)
+    player_level = await get_experience(user.id, user.username)
     current_level = player_level[0]
     current_xp = player_level[1]
     next_level_xp = player_level[2]
 
-    await update.message.reply_photo(photo=IMAGE_CACHE["START_IMG"],
-                                     caption="🎰 <b>Добро пожаловать в Smily!</b>\n\n"
-                                             f"💰 Твой баланс: {spaced_num(balance)} $miles\n"
-                                             f"⭐️ Твой уровень: {current_level} ({current_xp}/{next_level_xp})\n\n"
-                                             f"🎮 Используй /help для справки",
-                                     parse_mode="HTML"
-                                     )
+    await send_photo(update.message.reply_photo, IMAGE_CACHE["START_IMG"],
+                     caption="🎰 <b>Добро пожаловать в Smily!</b>\n\n"
+                             f"💰 Твой баланс: {spaced_num(balance)} $miles\n"
+                             f"⭐️ Твой уровень: {current_level} ({current_xp}/{next_level_xp})\n\n"
+                             f"🎮 Используй /help для справки",
+                     parse_mode="HTML"
+                     )
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -160,8 +168,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]]
 
     if update.message:
-        await update.message.reply_photo(
-            photo=IMAGE_CACHE["HELP_IMG"],
+        await send_photo(
+            update.message.reply_photo,
+            IMAGE_CACHE["HELP_IMG"],
             caption=text,
             parse_mode="Markdown",
             reply_markup=InlineKeyboardMarkup(keyboard)
@@ -235,16 +244,10 @@ async def help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /stats - моя статистика"""
     user = update.effective_user
-    ensure_user_exists(user)
-    ensure_talent_exists(user.id)
-
-    bal = get_balance(user.id, user.username)
-    player_level = get_experience(user.id, user.username)
-    current_level = player_level[0]
-    current_xp = player_level[1]
+    player = await get_player_snapshot(user.id, user.username, user.first_name, seen=True)
 
     # Таланты
-    talents = get_user_talents(user.id)
+    talents = player.talents
     text_talents = (
         f"⛓️ Неприкасаемость: {talents['untouchable']} LVL\n"
         f"✳️ Ловкость: {talents['agility']} LVL\n"
@@ -253,12 +256,10 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Бизнесы
-    profile = get_user_business_profile(user.id)
-
-    if not profile['businesses_ids']:
+    if not player.businesses_ids:
         biz_text = "⚠️ У вас нет бизнесов"
     else:
-        count = len(profile['businesses_ids'])
+        count = len(player.businesses_ids)
         if count == 1:
             biz_text = f"📍 У вас {count} бизнес:\n"
         elif 1 < count < 5:
@@ -266,16 +267,12 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             biz_text = f"📍 У вас {count} бизнесов:\n"
 
-        passive_income = calculate_total_income(user.id)
-
-        biz_text += f"\n🤑 Пассивный доход: {spaced_num(passive_income)} $miles/час"
-
-    next_level_xp = player_level[2]
+        biz_text += f"\n🤑 Пассивный доход: {spaced_num(player.passive_income)} $miles/час"
 
     await safe_reply_text(update.message,
                           f"👤 *{user.first_name}*\n\n"
-                          f"💰 Баланс: {spaced_num(bal)} $miles\n"
-                          f"⭐️ Уровень: {current_level} ({current_xp}/{next_level_xp})\n\n"
+                          f"💰 Баланс: {spaced_num(player.balance)} $miles\n"
+                          f"⭐️ Уровень: {player.level} ({player.experience}/{player.next_level_xp})\n\n"
                           f"*Таланты:*\n{text_talents}\n\n"
                           f"{biz_text}",
                           parse_mode="Markdown"
@@ -285,7 +282,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /check - проверка игрока (ответом на сообщение или упоминанием @username)"""
     reply = update.message.reply_to_message
-    ensure_user_exists(update.effective_user)
+    await ensure_user_exists(update.effective_user)
 
     if (not reply or reply.from_user.is_bot) and not context.args:
         await safe_reply_text(update.message,
@@ -295,24 +292,17 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if reply:
         target = reply.from_user
-        ensure_user_exists(target)
-        ensure_talent_exists(target.id)
+        player = await get_player_snapshot(target.id, target.username, target.first_name)
     else:
-        target = get_user_by_username(context.args[0])
-        if target.id == -1:
+        player = await get_player_snapshot(username=context.args[0].lstrip('@'))
+        if player is None:
             await safe_reply_text(update.message,
                                   "❌ Этот пользователь еще не зарегистрирован в боте"
                                   )
             return
 
-    # Основная информация
-    bal = get_balance(target.id, target.username)
-    player_level = get_experience(target.id, target.username)
-    current_level = player_level[0]
-    current_xp = player_level[1]
-
     # Таланты
-    talents = get_user_talents(target.id)
+    talents = player.talents
     text_talents = (
         f"⛓️ Неприкасаемость: {talents['untouchable']} LVL\n"
         f"✳️ Ловкость: {talents['agility']} LVL\n"
@@ -321,12 +311,10 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Бизнесы
-    profile = get_user_business_profile(target.id)
-
-    if not profile['businesses_ids']:
+    if not player.businesses_ids:
         biz_text = "⚠️ У игрока нет бизнесов"
     else:
-        count = len(profile['businesses_ids'])
+        count = len(player.businesses_ids)
         if count == 1:
             biz_text = f"📍 У игрока {count} бизнес:\n"
         elif 1 < count < 5:
@@ -335,19 +323,16 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
             biz_text = f"📍 У игрока {count} бизнесов:\n"
 
         passive_income = 0
-        for biz_id in profile['businesses_ids']:
-            biz = BUSINESS_LIST[biz_id - 1]
+        for biz in player.businesses:
             biz_text += f"  🏬 {biz['name']}\n"
             passive_income += biz['income']
 
         biz_text += f"\n🤑 Пассивный доход: {spaced_num(passive_income)} $miles/час"
 
-    next_level_xp = player_level[2]
-
     await safe_reply_text(update.message,
-                          f"👤 *{target.first_name}*\n\n"
-                          f"💰 Баланс: {spaced_num(bal)} $miles\n"
-                          f"⭐️ Уровень: {current_level} ({current_xp}/{next_level_xp})\n\n"
+                          f"👤 *{player.first_name}*\n\n"
+                          f"💰 Баланс: {spaced_num(player.balance)} $miles\n"
+                          f"⭐️ Уровень: {player.level} ({player.experience}/{player.next_level_xp})\n\n"
                           f"*Таланты:*\n{text_talents}\n\n"
                           f"{biz_text}",
                           parse_mode="Markdown"
@@ -358,66 +343,27 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /top - топ 10 игроков по балансу"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT username, balance, first_name, telegram_id "
-        "FROM users ORDER BY balance DESC"
-    )
-    players = cursor.fetchall()
+    caption = await BALANCE_TOP.caption()
+    user_place, user_balance = await get_balance_place(update.effective_user.id, update.effective_user.username)
 
-    leaderboard_lines = []
-    for i, p in enumerate(players[:10], 1):
-        # HTML автоматически экранирует опасные символы
-        if p['username']:
-            name = f"<a href='tg://user?id=0'>{p['username']}</a>"
-        else:
-            name = f"<a href='tg://user?id=0'>{p['first_name']}</a>"
-
-        balance_short = await cropped_num(p['balance'])
-        leaderboard_lines.append(f"{i}. {name} | <i>{balance_short} $miles</i>")
-
-    leaderboard = "\n".join(leaderboard_lines)
-    user_place = next((i + 1 for i, p in enumerate(players) if p.get('telegram_id') == update.effective_user.id), None)
     if update.effective_user.username:
         user_name = update.effective_user.username
     else:
         user_name = update.effective_user.first_name
-    await update.message.reply_photo(
-        photo=IMAGE_CACHE["BALANCE_TOP_IMG"],
-        caption=f"🏆 <b>Топ 10 игроков по балансу:</b>\n\n{leaderboard}\n\n<blockquote>{user_place}. {user_name} | <i>{await cropped_num(get_balance(update.effective_user.id))} $miles</i></blockquote>",
+    await send_photo(
+        update.message.reply_photo,
+        IMAGE_CACHE["BALANCE_TOP_IMG"],
+        caption=f"{caption}\n\n<blockquote>{user_place}. {user_name} | <i>{await cropped_num(user_balance)} $miles</i></blockquote>",
         parse_mode="HTML"
     )
 
 
 async def top_lvl(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /top_lvl - топ 100 игроков по уровню"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT username, experience, level, first_name, telegram_id "
-        "FROM users ORDER BY experience DESC LIMIT 100"
-    )
-    players = cursor.fetchall()
-
-    leaderboard_lines = []
-    for i, p in enumerate(players, 1):
-        if p['username']:
-            name = f"@{p['username']}"
-        else:
-            name = p['first_name']
-
-        leaderboard_lines.append(
-            f"{i}. {name} — ⭐️{p['level']} ({p['experience']} EXP)"
-        )
-
-    leaderboard = "\n".join(leaderboard_lines)
-
-    await update.message.reply_photo(
-        photo=IMAGE_CACHE["XP_TOP_IMG"],
-        caption=f"🏆 <b>Топ 100 игроков по уровню:</b>\n\n{leaderboard}",
+    await send_photo(
+        update.message.reply_photo,
+        IMAGE_CACHE["XP_TOP_IMG"],
+        caption=await LEVEL_TOP.caption(),
         parse_mode="HTML"
     )
 
@@ -446,7 +392,7 @@ async def ref(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def give(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /give - передать деньги игроку (ответом)"""
-    ensure_user_exists(update.effective_user)
+    await ensure_user_exists(update.effective_user)
 
     if not context.args:
         await safe_reply_text(update.message,
@@ -472,42 +418,48 @@ async def give(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Парсинг суммы
-    amount = parse_bet_amount(context.args[0], user.id, user.username)
+    amount = await parse_bet_amount(context.args[0], user.id, user.username)
 
     if amount is None or amount <= 0:
         await safe_reply_text(update.message, "❌ Некорректная сумма")
         return
 
-    user_balance = get_balance(user.id, user.username)
+    # Передача денег
+    await ensure_user_exists(target)
 
-    if amount > user_balance:
+    if not await transfer(user.id, target.id, amount):
         await safe_reply_text(update.message,
                               f"❌ Недостаточно средств.\n"
-                              f"💰 Твой баланс: {spaced_num(user_balance)} $miles",
+                              f"💰 Твой баланс: {spaced_num(await get_balance(user.id, user.username))} $miles",
                               parse_mode="Markdown"
                               )
         return
 
-    # Передача денег
-    target_balance = get_balance(target.id, target.username)
-
-    set_balance(user.id, user_balance - amount)
-    set_balance(target.id, target_balance + amount)
-
     await safe_reply_text(update.message,
                           f"✅ Передано {spaced_num(amount)} $miles → {target.full_name}\n"
-                          f"💰 Твой баланс: {spaced_num(get_balance(user.id, user.username))} $miles",
+                          f"💰 Твой баланс: {spaced_num(await get_balance(user.id, user.username))} $miles",
                           parse_mode="Markdown"
                           )
 
 
 # ======================= СЛОТЫ =======================
 
-def generate_spin_image(reel: list, state: str) -> io.BytesIO:
-    """Генерация изображения результата слотов"""
+async def generate_spin_image(reel: list, state: str) -> Frame:
+    """JPEG результата слотов (из кэша, промах рисуется вне event loop)"""
+    key = (tuple(reel), state)
+    frame = SPIN_IMAGES.get(key)
 
-    images = [SPRITES_CACHE[symbol] for symbol in reel]
-    main_img = STATE_CACHE[state]
+    if frame is None:
+        frame = Frame.of(await RENDER_SERVICE.render(render_spin_image, key[0], state))
+        SPIN_IMAGES.set(key, frame)
+
+    return frame
+
+
+def render_spin_image(reel: Tuple[str, ...], state: str) -> bytes:
+    """Отрисовка и JPEG-кодирование результата слотов"""
+    images = [ASSETS.image(f"sprites/{SLOTS_EMOJI[symbol]}", "RGBA") for symbol in reel]
+    main_img = ASSETS.image(f"sprites/{state}.jpg", "RGB")
 
     result = Image.new('RGB', (1350, 730), (255, 255, 255))
     result.paste(main_img, (0, 0))
@@ -518,10 +470,15 @@ def generate_spin_image(reel: list, state: str) -> io.BytesIO:
         x_offset += 365
     result = result.convert('RGB')
     bio = io.BytesIO()
-    bio.name = f'temp_spin_{random.randint(1000000, 9999999)}.jpeg'
     result.save(bio, 'JPEG', quality=60)
-    bio.seek(0)
-    return bio
+    return bio.getvalue()
+
+
+async def warm_spin_images() -> None:
+    """Предварительная отрисовка всех вариантов /spin (SPIN_IMAGE_WARMUP=1)"""
+    for reel in itertools.product(SLOTS_EMOJI, repeat=3):
+        for state in SPIN_STATES:
+            await generate_spin_image(list(reel), state)
 
 
 async def spin(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -529,8 +486,6 @@ async def spin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     username = update.effective_user.username
 
-    ensure_user_exists(update.effective_user)
-
     # Проверка аргументов
     if not context.args:
         await safe_reply_text(update.message,
@@ -540,70 +495,69 @@ async def spin(update: Update, context: ContextTypes.DEFAULT_TYPE):
                               )
         return
 
-    # Парсинг ставки
-    bet = parse_bet_amount(context.args[0], user_id, username)
+    # Ставка списывается сразу, остальные изменения игрока - одним commit'ом после ответа
+    async with unit_of_work(update.effective_user) as uow:
+        # Парсинг ставки
+        bet = await parse_bet_amount(context.args[0], user_id, username)
 
-    if bet is None:
-        await safe_reply_text(update.message, "❌ Некорректная ставка")
-        return
-
-    balance = get_balance(user_id, username)
+        if bet is None:
+            await safe_reply_text(update.message, "❌ Некорректная ставка")
+            return
 
-    if bet < MIN_BET:
-        await safe_reply_text(update.message, f"💸 Минимальная ставка: {spaced_num(MIN_BET)} $miles")
-        return
+        if bet < MIN_BET:
+            await safe_reply_text(update.message, f"💸 Минимальная ставка: {spaced_num(MIN_BET)} $miles")
+            return
 
-    if bet > balance:
-        await safe_reply_text(update.message,
-                              f"💸 Недостаточно средств.\n💰 Баланс: {spaced_num(balance)} $miles"
-                              )
-        return
+        # Снимаем ставку
+        if not await uow.debit(bet):
+            await safe_reply_text(update.message,
+                                  f"💸 Недостаточно средств.\n"
+                                  f"💰 Баланс: {spaced_num(uow.balance)} $miles"
+                                  )
+            return
 
-    # Снимаем ставку
-    set_balance(user_id, balance - bet)
-
-    # Получаем бонусы
-    biz_bonuses = get_user_business_bonuses(user_id)
-
-    # Крутим барабаны
-    reel = [random.choice(SLOTS_SYMBOLS) for _ in range(3)]
-
-    # Бонус на джекпот от завода слотов
-    if biz_bonuses.get('jackpot_luck', 0):
-        chance_jackpot = random.randint(0, 100)
-        if chance_jackpot <= biz_bonuses['jackpot_luck']:
-            reel = ['7', '7', '7']
-
-    # Подсчёт выигрыша
-    win = 0
-    gained_exp = 0
-
-    # Множитель опыта
-    mastery_bonus = get_user_bonuses(user_id, 'mastery')
-    business_bonus = biz_bonuses.get('game_mastery', 0)
-    exp_mult = calculate_exp_multiplier(bet, mastery_bonus, business_bonus)
-    state = "win"
-    # Результаты
-    if reel[0] == reel[1] == reel[2]:
-        if reel[0] == '7':
-            win = bet * 100
-            gained_exp = round(2 * exp_mult, 1)
-            msg = "💎 <b>ДЖЕКПОТ 100X!</b>"
-            state = "jackpot"
-        elif reel[0] == '🔔':
-            win = bet * 25
-            gained_exp = round(1.5 * exp_mult, 1)
-            msg = "🔔 <b>Огромный выигрыш 25X!</b>"
-        else:
-            win = bet * 5
-            gained_exp = round(1 * exp_mult, 1)
-            msg = "🎉 <b>Большой выигрыш 5X!</b>"
+        # Получаем бонусы
+        biz_bonuses = uow.player.business_bonuses
+
+        # Крутим барабаны
+        reel = [random.choice(SLOTS_SYMBOLS) for _ in range(3)]
+
+        # Бонус на джекпот от завода слотов
+        if biz_bonuses.get('jackpot_luck', 0):
+            chance_jackpot = random.randint(0, 100)
+            if chance_jackpot <= biz_bonuses['jackpot_luck']:
+                reel = ['7', '7', '7']
+
+        # Подсчёт выигрыша
+        win = 0
+        gained_exp = 0
+
+        # Множитель опыта
+        mastery_bonus = uow.player.talent_bonus('mastery')
+        business_bonus = biz_bonuses.get('game_mastery', 0)
+        exp_mult = calculate_exp_multiplier(bet, mastery_bonus, business_bonus)
+        state = "win"
+        # Результаты
+        if reel[0] == reel[1] == reel[2]:
+            if reel[0] == '7':
+                win = bet * 100
+                gained_exp = round(2 * exp_mult, 1)
+                msg = "💎 <b>ДЖЕКПОТ 100X!</b>"
+                state = "jackpot"
+            elif reel[0] == '🔔':
+                win = bet * 25
+                gained_exp = round(1.5 * exp_mult, 1)
+                msg = "🔔 <b>Огромный выигрыш 25X!</b>"
+            else:
+                win = bet * 5
+                gained_exp = round(1 * exp_mult, 1)
+                msg = "🎉 <b>Большой выигрыш 5X!</b>"
 
-    elif '7' not in reel and '🔔' not in reel:
-        if any(reel.count(sym) == 2 for sym in ['🍒', '🍋', '🍉']):
+        elif '7' not in reel and '🔔' not in reel and any(reel.count(sym) == 2 for sym in ['🍒', '🍋', '🍉']):
             win = int(bet * 1.5)
             gained_exp = round(0.5 * exp_mult, 1)
             msg = "💪 <b>Выигрыш 1.5X!</b>"
+
         else:
             # Проигрыш
             gained_exp = round(0.1 * exp_mult, 1)
@@ -611,63 +565,54 @@ async def spin(update: Update, context: ContextTypes.DEFAULT_TYPE):
             state = "lose"
 
             # Кэшбэк от удачи
-            luck_bonus = get_user_bonuses(user_id, 'luck')
+            luck_bonus = uow.player.talent_bonus('luck')
             if luck_bonus and random.randint(0, 100) < luck_bonus:
                 cashback = round(bet * 0.2)
                 win = cashback
                 msg += f"\n🍀 Повезло! Возвращено 20% ({spaced_num(cashback)} $miles)"
-    else:
-        # Проигрыш
-        gained_exp = round(0.1 * exp_mult, 1)
-        msg = "🙈 <b>Проигрыш</b>"
-        state = "lose"
-        # Кэшбэк от удачи
-        luck_bonus = get_user_bonuses(user_id, 'luck')
-        if luck_bonus and random.randint(0, 100) < luck_bonus:
-            cashback = round(bet * 0.2)
-            win = cashback
-            msg += f"\n🍀 Повезло! Возвращено 20% ({spaced_num(cashback)} $miles)"
-
-    win_bonus = get_user_business_bonuses(user_id).get("win_multiplier", 0)
-    win_bonus_amount = int(win * win_bonus)
-    bonus_text = f"❇️ Бонус: {spaced_num(win_bonus_amount)} $miles\n" if win_bonus_amount else ""
-
-    # Начисляем выигрыш и опыт
-    set_balance(user_id, get_balance(user_id, username) + win + win_bonus_amount)
-    update_experience(user_id, gained_exp)
-
-    # Информация об уровне
-    player_level = get_experience(user_id, username)
-    current_level = player_level[0]
-    current_xp = player_level[1]
-    next_level_xp = player_level[2]
-
-    result_text = " | ".join(reel)
-    win_text = f"💵 Выигрыш: {spaced_num(win)} $miles\n"
-    lose_text = f"☹️ Вы потеряли: {spaced_num(bet)} $miles\n"
-    caption = (
-        f"<blockquote> 🎰 СЛОТЫ </blockquote>\n"
-        f"\t\t{result_text}\n\n"
-        f"{msg}\n"
-        f"{win_text if win > 0 else lose_text}"
-        f"{bonus_text}"
-        f"✨ Опыт: +{gained_exp} EXP\n"
-        f"⭐️ Уровень: {current_level} ({current_xp}/{next_level_xp})\n"
-        f"💰 Баланс: {spaced_num(get_balance(user_id, username))} $miles"
-    )
 
-    # Отправка с картинкой
-    try:
-        image_stream = generate_spin_image(reel, state)
-        await update.message.reply_photo(
-            photo=image_stream,
-            caption=caption,
-            parse_mode="HTML"
+        win_bonus = biz_bonuses.get("win_multiplier", 0)
+        win_bonus_amount = int(win * win_bonus)
+        bonus_text = f"❇️ Бонус: {spaced_num(win_bonus_amount)} $miles\n" if win_bonus_amount else ""
+
+        # Начисляем выигрыш и опыт
+        uow.credit(win + win_bonus_amount)
+        uow.add_experience(gained_exp)
+
+        # Информация об уровне
+        current_level = uow.level
+        current_xp = uow.experience
+        next_level_xp = exp_for_level(current_level + 1)
+
+        result_text = " | ".join(reel)
+        win_text = f"💵 Выигрыш: {spaced_num(win)} $miles\n"
+        lose_text = f"☹️ Вы потеряли: {spaced_num(bet)} $miles\n"
+        caption = (
+            f"<blockquote> 🎰 СЛОТЫ </blockquote>\n"
+            f"\t\t{result_text}\n\n"
+            f"{msg}\n"
+            f"{win_text if win > 0 else lose_text}"
+            f"{bonus_text}"
+            f"✨ Опыт: +{gained_exp} EXP\n"
+            f"⭐️ Уровень: {current_level} ({current_xp}/{next_level_xp})\n"
+            f"💰 Баланс: {spaced_num(uow.balance)} $miles"
         )
-        image_stream.close()
-    except Exception as e:
-        print(f"Error generating spin image: {e}")
-        await safe_reply_text(update.message, caption, parse_mode="Markdown")
+
+        # Отправка с картинкой
+        try:
+            frame = await generate_spin_image(reel, state)
+            await send_photo(
+                update.message.reply_photo,
+                frame,
+                caption=caption,
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            print(f"Error generating spin image: {e}")
+
+            # Игрок не увидел результат - ставку не списываем
+            if not await safe_reply_text(update.message, caption, parse_mode="HTML"):
+                uow.rollback()
 
 
 # ======================= КОЛЕСО УДАЧИ =======================
@@ -675,9 +620,9 @@ async def spin(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def lucky_wheel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /lucky_wheel - бесплатное колесо удачи (раз в 30 мин)"""
     user = update.effective_user
-    ensure_user_exists(user)
+    await ensure_user_exists(user)
 
-    check = check_lucky_wheel_availability(user.id)
+    check = await check_lucky_wheel_availability(user.id)
     if check:
         remaining = check  # количество минут до следующего спина
         await safe_reply_text(update.message,
@@ -690,13 +635,12 @@ async def lucky_wheel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     win = random.choice(LUCKYWHEEL_PRIZES)
     win_sum = win[1]
 
-    balance = get_balance(user.id, user.username)
-    set_balance(user.id, balance + win_sum)
+    await adjust_balance(user.id, win_sum)
 
     text = (
         f"<blockquote>🎡 КОЛЕСО УДАЧИ</blockquote>\n\n"
         f"💵 Выигрыш: {spaced_num(win_sum)} $miles\n"
-        f"💰 Баланс: {spaced_num(get_balance(user.id, user.username))} $miles\n\n"
+        f"💰 Баланс: {spaced_num(await get_balance(user.id, user.username))} $miles\n\n"
         f"⏰ Возвращайся через {LUCKY_WHEEL_COOLDOWN} минут!"
     )
 
@@ -708,9 +652,9 @@ async def lucky_wheel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def exp_case(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /exp_case - бесплатный кейс с опытом (раз в 45 мин)"""
     user = update.effective_user
-    ensure_user_exists(user)
+    await ensure_user_exists(user)
 
-    check = check_exp_case_availability(user.id)
+    check = await check_exp_case_availability(user.id)
     if check:
         remaining = check  # количество минут до следующего спина
         await safe_reply_text(update.message,
@@ -723,8 +667,8 @@ async def exp_case(update: Update, context: ContextTypes.DEFAULT_TYPE):
     win = random.choice(EXP_CASE_PRIZES)
     win_exp = win[1]
 
-    update_experience(user.id, win_exp)
-    lvl, xp, next_xp = get_experience(user.id)
+    await update_experience(user.id, win_exp)
+    lvl, xp, next_xp = await get_experience(user.id)
 
     text = (
         f"<blockquote>🎁 КЕЙС ОПЫТА</blockquote>\n\n"
@@ -743,7 +687,7 @@ async def exp_case(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /steal - украсть у игрока (ответом)"""
     reply = update.message.reply_to_message
-    ensure_user_exists(update.effective_user)
+    await ensure_user_exists(update.effective_user)
 
     if not reply or reply.from_user.is_bot:
         await safe_reply_text(update.message,
@@ -758,8 +702,8 @@ async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await safe_reply_text(update.message, "❌ Нельзя обокрасть самого себя!")
         return
 
-    target_bal = get_balance(target.id, target.username)
-    user_bal = get_balance(user.id, user.username)
+    target_bal = await get_balance(target.id, target.username)
+    user_bal = await get_balance(user.id, user.username)
 
     if target_bal < STEAL["min_target_balance"]:
         await safe_reply_text(update.message,
@@ -769,7 +713,7 @@ async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Проверка кулдауна
-    availability = check_steal_availability(user.id)
+    availability = await check_steal_availability(user.id)
 
     if availability != True:
         await safe_reply_text(update.message,
@@ -779,8 +723,8 @@ async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Расчёт шансов с бонусами
-    biz_bonuses_target = get_user_business_bonuses(target.id)
-    biz_bonuses_user = get_user_business_bonuses(user.id)
+    biz_bonuses_target = await get_user_business_bonuses(target.id)
+    biz_bonuses_user = await get_user_business_bonuses(user.id)
 
     chance_bonus = biz_bonuses_target.get('steal_chance', 0)  # Защита
     chance_steal_bonus = biz_bonuses_user.get('steal_luck_chance', 0)  # Атака
@@ -790,8 +734,7 @@ async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Джекпот (75% баланса)
     if chance == STEAL["jackpot_chance"]:
         steal_value = floor(target_bal * STEAL["jackpot_amount_percent"])
-        set_balance(target.id, target_bal - steal_value)
-        set_balance(user.id, user_bal + steal_value)
+        stolen = await transfer(target.id, user.id, steal_value)
 
         msg = (
             f"💎 *ДЖЕКПОТ КРАЖИ!*\n"
@@ -806,14 +749,13 @@ async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         steal_value = floor(target_bal * STEAL["steal_amount_percent"])
 
         # Учёт талантов
-        untouchable_reduce = get_user_bonuses(target.id, 'untouchable')
-        agility_bonus = get_user_bonuses(user.id, 'agility')
+        untouchable_reduce = await get_user_bonuses(target.id, 'untouchable')
+        agility_bonus = await get_user_bonuses(user.id, 'agility')
 
         steal_value = steal_value - round(untouchable_reduce * steal_value)
         steal_value = steal_value + round(agility_bonus * steal_value)
 
-        set_balance(target.id, target_bal - steal_value)
-        set_balance(user.id, user_bal + steal_value)
+        stolen = await transfer(target.id, user.id, steal_value)
 
         msg = (
             f"✅ *Успех!*\n"
@@ -824,8 +766,9 @@ async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Провал (штраф)
     else:
+        stolen = True
         penalty = floor(user_bal * STEAL["fail_penalty_percent"])
-        set_balance(user.id, user_bal - penalty)
+        await adjust_balance(user.id, -penalty)
 
         msg = (
             f"👮‍♀️ *Поймали!*\n"
@@ -834,6 +777,10 @@ async def steal(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"⏰ Следующая попытка через {STEAL_COOLDOWN} минут"
         )
 
+    # Игрок успел потратить деньги между проверкой и кражей
+    if not stolen:
+        msg = "❌ Пока ты подкрадывался, у игрока не осталось столько $miles"
+
     await safe_reply_text(update.message, msg, parse_mode="Markdown")
 
 
@@ -841,9 +788,9 @@ async def hack(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /hack - взлом банка (только при балансе = 0)"""
     user_id = update.effective_user.id
     username = update.effective_user.username
-    balance = get_balance(user_id, username)
+    balance = await get_balance(user_id, username)
 
-    ensure_user_exists(update.effective_user)
+    await ensure_user_exists(update.effective_user)
 
     if balance > 0:
         await safe_reply_text(update.message,
@@ -859,7 +806,7 @@ async def hack(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                          )
 
     await asyncio.sleep(1.0)
-    hack_luck_chance = get_user_business_bonuses(user_id).get("hack_luck_chance", 0)
+    hack_luck_chance = (await get_user_business_bonuses(user_id)).get("hack_luck_chance", 0)
     # Проверка успеха
     if random.randint(0, 100) >= HACK["success_chance"] - hack_luck_chance:
         await progress_msg.edit_text("❌ *Взлом не удался!*", parse_mode="Markdown")
@@ -873,7 +820,7 @@ async def hack(update: Update, context: ContextTypes.DEFAULT_TYPE):
             stolen = random.randint(min_amount, max_amount)
             break
 
-    set_balance(user_id, get_balance(user_id, username) + stolen)
+    await adjust_balance(user_id, stolen)
 
     await progress_msg.edit_text(
         f"✅ *Взлом успешен!*\n"
@@ -890,7 +837,7 @@ async def deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
 
     # Проверка активного вклада
-    check = check_deposit_ready(user_id)
+    check = await check_deposit_ready(user_id)
 
     if check is True:
         await safe_reply_text(update.message,
@@ -952,18 +899,13 @@ async def deposit_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Получаем параметры вклада
     amount, multiplier, hours = DEPOSIT_OPTIONS[key.replace("deposit_", "", 1)]
 
-    user_bal = get_balance(user.id, user.username)
-
-    if user_bal < amount:
+    if not await adjust_balance(user.id, -amount):
         await query.edit_message_text("❌ Недостаточно средств.")
         return
 
     # Создаём вклад
-    new_balance = user_bal - amount
     bank_balance = int(amount * multiplier)
-
-    set_balance(user.id, new_balance)
-    update_bank_balance(user.id, bank_balance, hours)
+    await update_bank_balance(user.id, bank_balance, hours)
 
     hours_text = f"{hours} часа" if hours == 3 else f"{hours} часов"
 
@@ -977,7 +919,7 @@ async def deposit_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def claim_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /claim - забрать вклад"""
     user = update.effective_user
-    remaining = check_deposit_ready(user.id)
+    remaining = await check_deposit_ready(user.id)
 
     if isinstance(remaining, list):
         if len(remaining) == 2:
@@ -996,36 +938,24 @@ async def claim_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Забираем вклад
-    bank_bal = claim_bank_balance(user.id)
+    bank_bal = await claim_bank_balance(user.id)
+
+    # Вклад успел забрать параллельный /claim
+    if bank_bal is None:
+        await safe_reply_text(update.message, "⚠️ Забирать нечего: вклад уже получен.")
+        return
 
     await safe_reply_text(update.message,
                           f"💵 Забрано со вклада: {spaced_num(bank_bal)} $miles\n"
-                          f"💰 Твой баланс: {spaced_num(get_balance(user.id, user.username))} $miles",
+                          f"💰 Твой баланс: {spaced_num(await get_balance(user.id, user.username))} $miles",
                           parse_mode="Markdown"
                           )
 
 
 async def check_all_deposits(context: ContextTypes.DEFAULT_TYPE):
     """Фоновая проверка готовности вкладов"""
-    now = datetime.now()
-    users = get_all_users_with_deposit()
-
-    if not users:
-        return
-
-    for user in users:
-        if user["deposit_end"] and now >= user["deposit_end"]:
-            chat_id = user["telegram_id"]
-
-            try:
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text="🏦 Твой вклад завершён! Нажми /claim 💸"
-                )
-            except Exception as e:
-                print(f"Failed to notify user {chat_id}: {e}")
-
-            update_user(user["telegram_id"], {"deposit_end": None})
+    for chat_id in await take_due_deposits(datetime.now()):
+        notify(chat_id, "🏦 Твой вклад завершён! Нажми /claim 💸")
 
 
 async def promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1042,7 +972,7 @@ async def promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     promocode = context.args[0]
 
     # 2️⃣ Проверка существования и статуса промокода
-    ok, msg = check_promocode(promocode, user_id)
+    ok, msg = await check_promocode(promocode, user_id)
     if not ok:
         await update.message.reply_text(
             f"❌ *{msg}*",
@@ -1061,7 +991,7 @@ async def promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 4️⃣ Активация промокода
     # Атомарная попытка активации
-    if not try_activate_promocode(promocode, user_id):
+    if not await try_activate_promocode(promocode, user_id):
         await update.message.reply_text(
             "❌ Промокод больше недоступен",
             parse_mode="Markdown"
@@ -1069,7 +999,7 @@ async def promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Выдача наград
-    award_text = activate_promocode(user_id, promocode)
+    award_text = await activate_promocode(user_id, promocode)
     await update.message.reply_text(
         award_text,
         parse_mode="Markdown"
@@ -1089,7 +1019,7 @@ __all__ = [
     'stats', 'check', 'top', 'top_lvl', 'ref', 'give',
 
     # Игры
-    'spin', 'lucky_wheel', 'exp_case',
+    'spin', 'warm_spin_images', 'lucky_wheel', 'exp_case',
 
     # Действия
     'steal', 'hack', 'promo',
@@ -14,6 +14,66 @@ DB_CONFIG = {
     'autocommit': True
 }
 
+# Пул соединений (размер и таймауты можно переопределить через переменные окружения)
+DB_POOL = {
+    'size': int(os.getenv('DB_POOL_SIZE', 10)),  # Максимум открытых соединений
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),  # Секунд ожидания свободного соединения
+    'health_check_interval': float(os.getenv('DB_POOL_HEALTH_CHECK', 30)),  # Пинг, если простаивало дольше
+    'leak_timeout': float(os.getenv('DB_LEAK_TIMEOUT', 30)),  # Лог, если сессия не вернула соединение за N секунд
+}
+
+# Кэш уровней талантов (меняются только при прокачке и из админки)
+TALENT_CACHE = {
+    'maxsize': int(os.getenv('TALENT_CACHE_SIZE', 10000)),  # Игроков в кэше
+    'ttl': float(os.getenv('TALENT_CACHE_TTL', 600)),  # Секунд жизни записи
+}
+
+# Топы: снимок обновляется раз в refresh_interval секунд
+LEADERBOARD = {
+    'refresh_interval': float(os.getenv('LEADERBOARD_REFRESH', 60)),
+    'balance_top': 10,  # /top
+    'level_top': 100,  # /top_lvl
+    'ranks_cache_size': 10000,  # Места игроков, запрошенные за интервал
+}
+
+# Пассивный доход начисляется при чтении баланса. Фоновый обход с уведомлениями
+# давно не заходившим игрокам - только по желанию (0 - выключен, по умолчанию)
+INCOME = {
+    'sweep_interval': float(os.getenv('INCOME_SWEEP_INTERVAL', 0)),  # Секунд между обходами
+}
+
+# Отрисовка картинок вне event loop
+RENDER = {
+    'executor': os.getenv('RENDER_EXECUTOR', 'thread'),  # 'thread' или 'process'
+    'workers': int(os.getenv('RENDER_WORKERS', 2)),  # Потоков/процессов отрисовки
+    'queue_size': int(os.getenv('RENDER_QUEUE_SIZE', 32)),  # Отрисовок в работе и очереди, дальше - ожидание
+}
+
+# Готовые картинки /spin: 5³ барабанов × 3 состояния = 375 вариантов
+SPIN_IMAGE_CACHE = {
+    'maxsize': int(os.getenv('SPIN_IMAGE_CACHE_SIZE', 375)),  # Картинок в кэше
+    'warmup': os.getenv('SPIN_IMAGE_WARMUP', '0') == '1',  # Нарисовать все варианты при старте
+}
+
+# file_id загруженных картинок (чтобы не загружать их в Telegram повторно)
+MEDIA = {
+    'registry_path': os.getenv('MEDIA_REGISTRY_PATH', 'media_registry.json'),
+}
+
+# Очередь уведомлений фоновых задач (лимит Telegram ~30 сообщений/с на бота)
+NOTIFICATIONS = {
+    'global_rate': float(os.getenv('NOTIFY_RATE', 25)),  # Сообщений в секунду на весь бот
+    'chat_interval': float(os.getenv('NOTIFY_CHAT_INTERVAL', 1)),  # Секунд между сообщениями в один чат
+    'max_attempts': 3,  # Попыток отправки при таймаутах и RetryAfter
+    'drain_timeout': float(os.getenv('NOTIFY_DRAIN_TIMEOUT', 10)),  # Секунд на досылку очереди при остановке
+}
+
+# Кэш векторов бонусов бизнесов (меняются только при покупке/выдаче бизнеса)
+BUSINESS_BONUS_CACHE = {
+    'maxsize': int(os.getenv('BUSINESS_CACHE_SIZE', 10000)),
+    'ttl': float(os.getenv('BUSINESS_CACHE_TTL', 600)),
+}
+
 # ======================= ОБЩИЕ ИГРОВЫЕ НАСТРОЙКИ =======================
 
 MIN_BET = 1  # Минимальная ставка во всех играх
@@ -482,6 +542,12 @@ BUSINESS_LIST = [
 ]
 BUSINESS_LIST.sort(key=lambda x: x["price"])
 
+# Каталог по id (список отсортирован по цене, индекс != id)
+BUSINESS_BY_ID = {biz["id"]: biz for biz in BUSINESS_LIST}
+
+# Все типы бонусов бизнесов (вектор бонусов игрока содержит каждый, по умолчанию 0)
+BUSINESS_BONUS_TYPES = tuple(sorted({key for biz in BUSINESS_LIST for key in biz["user_bonus"]}))
+
 TOKEN = os.getenv("BOT_TOKEN")
 
 REF_SYSTEM = {
@@ -499,7 +565,7 @@ REF_SYSTEM = {
 
 __all__ = [
     # Конфиг
-    'DB_CONFIG', 'TOKEN',
+    'DB_CONFIG', 'DB_POOL', 'TALENT_CACHE', 'BUSINESS_BONUS_CACHE', 'LEADERBOARD', 'INCOME', 'NOTIFICATIONS', 'RENDER', 'SPIN_IMAGE_CACHE', 'MEDIA', 'TOKEN',
 
     # Общие
     'MIN_BET', 'BASE_XP', 'XP_FACTOR', 'MAX_LEVEL', 'LEVELS',
@@ -516,7 +582,7 @@ __all__ = [
     'BLACKJACK', 'ROULETTE', 'SLOTS', 'LUCKY_WHEEL', 'DUELS', 'MINES',
 
     # Экономика
-    'DEPOSITS', 'STEAL', 'HACK', 'BUSINESS_LIST',
+    'DEPOSITS', 'STEAL', 'HACK', 'BUSINESS_LIST', 'BUSINESS_BY_ID', 'BUSINESS_BONUS_TYPES',
 
     # UI
     'MESSAGES', 'EMOJI',
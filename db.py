@@ -0,0 +1,404 @@
+"""
+Пул соединений с MySQL
+Соединения переиспользуются между запросами вместо connect() на каждый вызов
+"""
+
+import asyncio
+import functools
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from mysql.connector import connect
+from mysql.connector.errors import InterfaceError, OperationalError
+
+from constants import DB_CONFIG, DB_POOL
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Свободное соединение не появилось за отведённое время"""
+
+
+# ======================= ПУЛ =======================
+
+class ConnectionPool:
+    """
+    Пул соединений фиксированного размера
+
+    Соединения открываются лениво (не больше size штук), перед выдачей
+    проверяются ping'ом, если простаивали дольше health_check_interval,
+    и переподключаются при обрыве
+    """
+
+    def __init__(
+            self,
+            config: Dict[str, Any],
+            size: int,
+            timeout: float,
+            health_check_interval: float,
+            leak_timeout: float
+    ):
+        self._config = {**config, 'consume_results': True}
+        self._size = max(1, size)
+        self._timeout = timeout
+        self._health_check_interval = health_check_interval
+        self._leak_timeout = leak_timeout
+
+        # Свободные соединения: (conn, время последнего использования)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+        # Выданные соединения: id(conn) -> [время выдачи, кто взял, уже залогировано]
+        self._checked_out: Dict[int, list] = {}
+        self._watchdog: Optional[threading.Thread] = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def acquire(self, timeout: Optional[float] = None, label: str = "?"):
+        """Получить соединение из пула (ждёт не дольше timeout секунд)"""
+        conn = self._acquire(self._timeout if timeout is None else timeout)
+
+        with self._lock:
+            self._checked_out[id(conn)] = [time.monotonic(), label, False]
+        self._start_watchdog()
+
+        return conn
+
+    def _acquire(self, timeout: float):
+        deadline = time.monotonic() + timeout
+
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open_if_allowed()
+                if conn is not None:
+                    return conn
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"Нет свободных соединений за {timeout} сек. (размер пула {self._size})")
+
+                try:
+                    conn, last_used = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    raise PoolTimeout(f"Нет свободных соединений за {timeout} сек. (размер пула {self._size})")
+
+            if self._is_healthy(conn, last_used):
+                return conn
+
+            self.discard(conn)
+
+    def release(self, conn) -> None:
+        """Вернуть соединение в пул"""
+        self._forget(conn)
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except (InterfaceError, OperationalError):
+            self.discard(conn)
+            return
+
+        self._idle.put((conn, time.monotonic()))
+
+    def discard(self, conn) -> None:
+        """Закрыть сломанное соединение и освободить место в пуле"""
+        self._forget(conn)
+
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+        with self._lock:
+            self._opened -= 1
+
+    def close_all(self) -> None:
+        """Закрыть все свободные соединения"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(conn)
+
+    def stats(self) -> Dict[str, int]:
+        """Состояние пула: открыто / свободно / выдано / размер"""
+        return {
+            "opened": self._opened,
+            "idle": self._idle.qsize(),
+            "checked_out": len(self._checked_out),
+            "size": self._size
+        }
+
+    def _forget(self, conn) -> None:
+        with self._lock:
+            self._checked_out.pop(id(conn), None)
+
+    def _start_watchdog(self) -> None:
+        """Фоновый поток, который логирует соединения, не возвращённые вовремя"""
+        if self._watchdog is not None or self._leak_timeout <= 0:
+            return
+
+        with self._lock:
+            if self._watchdog is not None:
+                return
+            self._watchdog = threading.Thread(target=self._watch_leaks, name="db-leak-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def _watch_leaks(self) -> None:
+        while True:
+            time.sleep(max(self._leak_timeout / 2, 1))
+            now = time.monotonic()
+
+            with self._lock:
+                leaked = [
+                    entry for entry in self._checked_out.values()
+                    if not entry[2] and now - entry[0] >= self._leak_timeout
+                ]
+                for entry in leaked:
+                    entry[2] = True
+
+            for since, label, _ in leaked:
+                logger.warning(
+                    "Сессия БД не возвращена в пул уже %.0f сек.: %s", now - since, label
+                )
+
+    def _open_if_allowed(self):
+        """Открыть новое соединение, если лимит пула не исчерпан"""
+        with self._lock:
+            if self._opened >= self._size:
+                return None
+            self._opened += 1
+
+        try:
+            return connect(**self._config)
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        """Проверка соединения перед выдачей (с переподключением)"""
+        if time.monotonic() - last_used < self._health_check_interval:
+            return True
+
+        try:
+            conn.ping(reconnect=True, attempts=2, delay=0)
+            return True
+        except (InterfaceError, OperationalError) as e:
+            logger.warning("Соединение с БД не прошло проверку: %s", e)
+            return False
+
+
+pool = ConnectionPool(DB_CONFIG, **DB_POOL)
+
+
+# Потоки для синхронных запросов из async-кода: не больше, чем соединений в пуле,
+# чтобы лишние запросы ждали в очереди executor'а, а не в acquire()
+executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="db")
+
+# Потоки для операций открытых AsyncDBSession. Сессия держит соединение между await'ами,
+# и если бы её запросы шли через executor, все его потоки могли бы ждать в acquire()
+# соединения, которое освободит только эта сессия - взаимная блокировка до PoolTimeout.
+# Соединения держат не больше pool.size сессий, поэтому потоков хватает всегда
+session_executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="db-session")
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Выполнить синхронную функцию работы с БД в пуле потоков, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def caller_label(depth: int = 1) -> str:
+    """Место вызова (файл:строка функция) для логов об утечках"""
+    frame = sys._getframe(depth + 1)
+    return f"{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+# ======================= СЕССИИ =======================
+
+class DBSession:
+    """
+    Сессия работы с БД: соединение из пула + курсор
+    Соединение возвращается в пул при выходе из with, даже при ошибке
+
+        with db_session() as session:
+            row = session.fetchone("SELECT ...", (user_id,))
+    """
+
+    def __init__(self, label: str = "?"):
+        self.label = label
+        self.conn = None
+        self.cursor = None
+
+    def __enter__(self) -> "DBSession":
+        self.conn = pool.acquire(label=self.label)
+        self.cursor = self.conn.cursor(dictionary=True)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        conn, self.conn = self.conn, None
+
+        # Обрыв связи — соединение в пул не возвращаем
+        if exc_type is not None and issubclass(exc_type, (InterfaceError, OperationalError)):
+            pool.discard(conn)
+            return
+
+        try:
+            self.cursor.close()
+        except (InterfaceError, OperationalError):
+            pool.discard(conn)
+            return
+
+        pool.release(conn)
+
+    def execute(self, query: str, params: Optional[tuple] = None):
+        self.cursor.execute(query, params)
+        return self.cursor
+
+    def executemany(self, query: str, seq_params: List[tuple]):
+        self.cursor.executemany(query, seq_params)
+        return self.cursor
+
+    def fetchone(self, query: str, params: Optional[tuple] = None) -> Optional[Dict]:
+        self.cursor.execute(query, params)
+        return self.cursor.fetchone()
+
+    def fetchall(self, query: str, params: Optional[tuple] = None) -> List[Dict]:
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    def begin(self) -> None:
+        """Явная транзакция (в DB_CONFIG включён autocommit)"""
+        self.conn.start_transaction()
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def rollback(self) -> None:
+        self.conn.rollback()
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+
+class AsyncDBSession:
+    """
+    Асинхронный вариант DBSession для хэндлеров
+    Все обращения к БД выполняются в отдельном потоке, не блокируя event loop
+
+        async with async_db_session() as session:
+            rows = await session.fetchall("SELECT ...")
+    """
+
+    def __init__(self, label: str = "?"):
+        self._session = DBSession(label)
+
+    async def __aenter__(self) -> "AsyncDBSession":
+        # Ожидание соединения - в общем executor'е, как у run_db
+        await run_db(self._session.__enter__)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self._run(self._session.__exit__, exc_type, exc, tb)
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """Операция с уже полученным соединением - в session_executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(session_executor, functools.partial(func, *args))
+
+    async def execute(self, query: str, params: Optional[tuple] = None) -> int:
+        cursor = await self._run(self._session.execute, query, params)
+        return cursor.rowcount
+
+    async def executemany(self, query: str, seq_params: List[tuple]) -> int:
+        cursor = await self._run(self._session.executemany, query, seq_params)
+        return cursor.rowcount
+
+    async def fetchone(self, query: str, params: Optional[tuple] = None) -> Optional[Dict]:
+        return await self._run(self._session.fetchone, query, params)
+
+    async def fetchall(self, query: str, params: Optional[tuple] = None) -> List[Dict]:
+        return await self._run(self._session.fetchall, query, params)
+
+    async def begin(self) -> None:
+        await self._run(self._session.begin)
+
+    async def commit(self) -> None:
+        await self._run(self._session.commit)
+
+    async def rollback(self) -> None:
+        await self._run(self._session.rollback)
+
+
+# ======================= ИНДЕКСЫ =======================
+
+# Индексы, без которых горячие запросы сканируют всю таблицу: таблица -> {имя: колонки}
+INDEXES: Dict[str, Dict[str, str]] = {
+    'users': {
+        'idx_users_balance': '(balance)',  # Топ и место игрока по балансу
+        'idx_users_experience': '(experience)',  # Топ по уровню
+        'idx_users_deposit_end': '(deposit_end)',  # Завершившиеся вклады
+    },
+    'user_businesses': {
+        'idx_user_businesses_acquired_at': '(acquired_at)',  # Начисление пассивного дохода
+    },
+}
+
+
+def ensure_indexes() -> None:
+    """Создание недостающих индексов из INDEXES (вызывается при старте бота)"""
+    with DBSession("ensure_indexes") as session:
+        for table, indexes in INDEXES.items():
+            for name, columns in indexes.items():
+                exists = session.fetchone(
+                    "SELECT 1 FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+                    (table, name)
+                )
+                if exists:
+                    continue
+
+                logger.info("Создаю индекс %s на %s%s", name, table, columns)
+                session.execute(f"ALTER TABLE {table} ADD INDEX {name} {columns}")
+
+
+def db_session() -> DBSession:
+    """Новая сессия БД (использовать только через with)"""
+    return DBSession(caller_label())
+
+
+def async_db_session() -> AsyncDBSession:
+    """Новая асинхронная сессия БД (использовать только через async with)"""
+    return AsyncDBSession(caller_label())
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'ConnectionPool',
+    'PoolTimeout',
+    'pool',
+    'executor',
+    'session_executor',
+    'run_db',
+    'DBSession',
+    'AsyncDBSession',
+    'db_session',
+    'async_db_session',
+    'INDEXES',
+    'ensure_indexes'
+]
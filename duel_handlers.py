@@ -4,7 +4,8 @@ from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
 from constants import DUELS
-from helpers import get_user, get_cursor, spaced_num
+from helpers import get_user, spaced_num
+from db import db_session
 from duel_turn_logic import delete_duel_session
 
 # Извлекаем константы
@@ -26,41 +27,33 @@ def get_duel_session(user_id: int, target_id: int) -> Optional[Dict]:
     Returns:
         Словарь с данными дуэли или None
     """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT * FROM duels_sessions WHERE user_id = %s AND target_id = %s",
-        (user_id, target_id)
-    )
-
-    return cursor.fetchone()
+    with db_session() as session:
+        return session.fetchone(
+            "SELECT * FROM duels_sessions WHERE user_id = %s AND target_id = %s",
+            (user_id, target_id)
+        )
 
 
 def update_duel_game(user_id: int, target_id: int, game_key: str) -> None:
     """Обновление типа игры в сессии дуэли"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "UPDATE duels_sessions SET game = %s WHERE user_id = %s AND target_id = %s",
-        (game_key, user_id, target_id)
-    )
-    conn.commit()
+    with db_session() as session:
+        session.execute(
+            "UPDATE duels_sessions SET game = %s WHERE user_id = %s AND target_id = %s",
+            (game_key, user_id, target_id)
+        )
+        session.commit()
 
 
 def update_duel_rounds(user_id: int, target_id: int, rounds: int) -> None:
     """Обновление количества раундов и начало игры"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute("""
-        UPDATE duels_sessions 
-        SET round = %s, move = 'target', current_round = 0
-        WHERE user_id = %s AND target_id = %s
-    """, (rounds, user_id, target_id))
-
-    conn.commit()
+    with db_session() as session:
+        session.execute("""
+            UPDATE duels_sessions 
+            SET round = %s, move = 'target', current_round = 0
+            WHERE user_id = %s AND target_id = %s
+        """, (rounds, user_id, target_id))
+
+        session.commit()
 
 
 # ======================= ОБРАБОТЧИК ВЫБОРА ИГРЫ =======================
@@ -5,9 +5,10 @@ from telegram.constants import ParseMode
 
 from constants import DUELS
 from helpers import (
-    set_balance, get_balance, spaced_num,
-    get_user, get_cursor
+    transfer, get_balance, spaced_num,
+    get_user
 )
+from db import db_session
 
 # Извлекаем константы
 GAME_ANIMATIONS = DUELS["animations"]
@@ -26,24 +27,17 @@ def get_active_duel(user_id: int) -> Optional[Dict]:
     Returns:
         Словарь с данными дуэли или None
     """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT * FROM duels_sessions WHERE user_id = %s OR target_id = %s",
-        (user_id, user_id)
-    )
-
-    return cursor.fetchone()
+    with db_session() as session:
+        return session.fetchone(
+            "SELECT * FROM duels_sessions WHERE user_id = %s OR target_id = %s",
+            (user_id, user_id)
+        )
 
 
 def get_duel_by_initiator(user_id: int) -> Optional[Dict]:
     """Получение дуэли по ID инициатора"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute("SELECT * FROM duels_sessions WHERE user_id = %s", (user_id,))
-    return cursor.fetchone()
+    with db_session() as session:
+        return session.fetchone("SELECT * FROM duels_sessions WHERE user_id = %s", (user_id,))
 
 
 # ======================= ОБНОВЛЕНИЕ СОСТОЯНИЯ =======================
@@ -57,31 +51,29 @@ def update_player_score(duel_user_id: int, player_id: int, points: int) -> None:
         player_id: ID игрока, который сделал ход
         points: Количество очков
     """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
     # Определяем какой игрок ходил
     duel = get_duel_by_initiator(duel_user_id)
 
-    if player_id == duel['user_id']:
-        # Ход инициатора дуэли
-        cursor.execute("""
-            UPDATE duels_sessions 
-            SET user_score = user_score + %s, 
-                move = 'target', 
-                current_round = current_round + 1 
-            WHERE user_id = %s
-        """, (points, duel_user_id))
-    else:
-        # Ход оппонента
-        cursor.execute("""
-            UPDATE duels_sessions 
-            SET target_score = target_score + %s, 
-                move = 'user' 
-            WHERE user_id = %s
-        """, (points, duel_user_id))
-
-    conn.commit()
+    with db_session() as session:
+        if player_id == duel['user_id']:
+            # Ход инициатора дуэли
+            session.execute("""
+                UPDATE duels_sessions 
+                SET user_score = user_score + %s, 
+                    move = 'target', 
+                    current_round = current_round + 1 
+                WHERE user_id = %s
+            """, (points, duel_user_id))
+        else:
+            # Ход оппонента
+            session.execute("""
+                UPDATE duels_sessions 
+                SET target_score = target_score + %s, 
+                    move = 'user' 
+                WHERE user_id = %s
+            """, (points, duel_user_id))
+
+        session.commit()
 
 
 # ======================= ПРОВЕРКА ЗАВЕРШЕНИЯ =======================
@@ -123,11 +115,11 @@ def check_duel_completion(duel: Dict) -> Tuple[bool, Optional[str]]:
     if user_score > target_score:
         winner_id = duel['user_id']
         loser_id = duel['target_id']
-        winner_name = user_name
+        winner_name, loser_name = user_name, target_name
     elif target_score > user_score:
         winner_id = duel['target_id']
         loser_id = duel['user_id']
-        winner_name = target_name
+        winner_name, loser_name = target_name, user_name
     else:
         # Ничья
         result_text += "🤝 <b>Ничья!</b> Ставка возвращена обоим игрокам."
@@ -136,11 +128,14 @@ def check_duel_completion(duel: Dict) -> Tuple[bool, Optional[str]]:
     # Обработка выигрыша
     bet = duel['bet']
 
-    winner_balance = get_balance(winner_id)
-    loser_balance = get_balance(loser_id)
-
-    set_balance(winner_id, winner_balance + bet)
-    set_balance(loser_id, loser_balance - bet)
+    # Без проверки баланса: проигравший мог потратить деньги во время дуэли,
+    # но победитель получает выигрыш всегда (как и раньше)
+    if not transfer(loser_id, winner_id, bet, min_balance=None):
+        result_text += (
+            f"🏆 <b>Победитель: {winner_name}!</b>\n"
+            f"⚠️ Не удалось выплатить ставку: {loser_name} не найден."
+        )
+        return True, result_text
 
     result_text += (
         f"🏆 <b>Победитель: {winner_name}!</b>\n"
@@ -153,11 +148,9 @@ def check_duel_completion(duel: Dict) -> Tuple[bool, Optional[str]]:
 
 def delete_duel_session(user_id: int) -> None:
     """Удаление сессии дуэли"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute("DELETE FROM duels_sessions WHERE user_id = %s", (user_id,))
-    conn.commit()
+    with db_session() as session:
+        session.execute("DELETE FROM duels_sessions WHERE user_id = %s", (user_id,))
+        session.commit()
 
 
 # ======================= ОБРАБОТЧИК ХОДА =======================
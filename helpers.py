@@ -1,7 +1,8 @@
 from datetime import datetime, timedelta
 from contextlib import contextmanager
-from typing import Optional, Dict, List, Tuple, Any, NamedTuple
-from mysql.connector import connect
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional, Dict, List, Tuple, Any, NamedTuple, Mapping, Iterable
 import asyncio
 from PIL import Image
 import os
@@ -12,30 +13,23 @@ from telegram.constants import ChatMemberStatus
 from telegram.error import TimedOut, NetworkError, RetryAfter
 # Импорт констант
 from constants import (
-    DB_CONFIG, MAX_LEVEL, LEVELS, TALENT_BONUSES,
+    TALENT_BONUSES,
     LUCKY_WHEEL_COOLDOWN, STEAL_COOLDOWN,
-    EXP_MULTIPLIERS_BY_BET, SLOTS, BUSINESS_LIST, TOKEN, EXP_CASE_COOLDOWN
+    EXP_MULTIPLIERS_BY_BET, SLOTS, BUSINESS_LIST, TOKEN, EXP_CASE_COOLDOWN, TALENT_CACHE,
+    BUSINESS_BY_ID, BUSINESS_BONUS_TYPES, BUSINESS_BONUS_CACHE
 )
+from db import DBSession, caller_label, db_session, run_db
+from cache import LRUCache
+from levels import exp_for_level, level_after_gain, progress
 
 
 # ======================= РАБОТА С БД =======================
 
 @contextmanager
 def get_db_connection():
-    """Context manager для безопасной работы с БД"""
-    conn = connect(**DB_CONFIG)
-    cursor = conn.cursor(dictionary=True)
-    try:
-        yield cursor, conn
-    finally:
-        cursor.close()
-        conn.close()
-
-
-def get_cursor():
-    """Устаревшая функция, оставлена для совместимости"""
-    conn = connect(**DB_CONFIG)
-    return [conn.cursor(dictionary=True), conn]
+    """Context manager для безопасной работы с БД (соединение берётся из пула)"""
+    with DBSession(caller_label(2)) as session:
+        yield session.cursor, session.conn
 
 
 # ======================= УТИЛИТЫ =======================
@@ -87,6 +81,39 @@ async def cropped_num(num: int | str) -> str:
     return f"{num}{suffixes[suffix_index]}"
 
 
+def split_lines(lines: Iterable[str], first_limit: int, limit: int) -> List[str]:
+    """
+    Склейка строк в сообщения с учётом лимитов Telegram (строки не разрываются)
+    Первый кусок - не длиннее first_limit (подпись к фото), остальные - не длиннее limit
+    Пустые строки в начале куска отбрасываются, пустых кусков не бывает
+    (если строк нет совсем - возвращается пустой список)
+    """
+    chunks: List[str] = []
+    current, current_limit = "", first_limit
+
+    for line in lines:
+        # Пустая строка-разделитель в начале куска не нужна
+        if not current and not line.strip():
+            continue
+
+        # Строка длиннее лимита обрезается (в начале куска - по его собственному лимиту)
+        max_length = limit if current else current_limit
+        if len(line) > max_length:
+            line = line[:max_length - 1] + "…"
+
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= current_limit:
+            current = candidate
+            continue
+
+        chunks.append(current)
+        current, current_limit = ("" if not line.strip() else line), limit
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
 def parse_bet_amount(amount_str: str, user_id: int, username: Optional[str] = None) -> Optional[int]:
     """Универсальный парсер ставок"""
     amount_str = str(amount_str).lower().strip()
@@ -125,19 +152,25 @@ def calculate_exp_multiplier(bet_amount: int, mastery_bonus: float = 0, business
 # ======================= БАЛАНС =======================
 
 def get_balance(user_id: int, username: Optional[str] = None) -> int:
-    """Получение баланса пользователя"""
-    with get_db_connection() as (cursor, conn):
-        cursor.execute("SELECT balance FROM users WHERE telegram_id = %s", (user_id,))
-        result = cursor.fetchone()
+    """Получение баланса пользователя (с начислением накопившегося дохода бизнесов)"""
+    with db_session() as session:
+        result = session.fetchone(
+            "SELECT u.balance, b.businesses_ids, b.acquired_at FROM users u "
+            "LEFT JOIN user_businesses b ON b.user_id = u.telegram_id WHERE u.telegram_id = %s",
+            (user_id,)
+        )
 
         if result:
-            return result['balance']
+            accrued = accrue_income(
+                session, user_id, parse_businesses_ids(result['businesses_ids']), result['acquired_at']
+            )
+            return result['balance'] + accrued
         else:
-            cursor.execute(
+            session.execute(
                 "INSERT INTO users (telegram_id, username, balance, level, experience) VALUES (%s, %s, %s, %s, %s)",
                 (user_id, username, 100, 1, 0.0)
             )
-            conn.commit()
+            session.commit()
             return 100
 
 
@@ -149,6 +182,69 @@ def set_balance(user_id: int, amount: int) -> None:
         conn.commit()
 
 
+def adjust_balance(user_id: int, delta: int, min_balance: Optional[int] = 0) -> bool:
+    """
+    Атомарное изменение баланса на delta одним UPDATE
+    Списание не проходит, если баланс опустился бы ниже min_balance (None - без проверки)
+    Возвращает True если баланс изменён
+    """
+    delta = int(round(delta))
+    if delta == 0:
+        return True
+
+    with db_session() as session:
+        if min_balance is None:
+            session.execute(
+                "UPDATE users SET balance = balance + %s WHERE telegram_id = %s",
+                (delta, user_id)
+            )
+        else:
+            session.execute(
+                "UPDATE users SET balance = balance + %s WHERE telegram_id = %s AND balance >= %s",
+                (delta, user_id, min_balance - delta)
+            )
+        session.commit()
+        return session.rowcount == 1
+
+
+def transfer(from_id: int, to_id: int, amount: int, min_balance: Optional[int] = 0) -> bool:
+    """
+    Перевод amount от from_id к to_id в одной транзакции
+    Возвращает False (ничего не меняя), если у отправителя не хватает средств
+    min_balance=None - без проверки (долг, который нельзя не выплатить: баланс может уйти в минус)
+    """
+    amount = int(round(amount))
+    if amount <= 0:
+        return False
+
+    with db_session() as session:
+        session.begin()
+        if min_balance is None:
+            session.execute(
+                "UPDATE users SET balance = balance - %s WHERE telegram_id = %s",
+                (amount, from_id)
+            )
+        else:
+            session.execute(
+                "UPDATE users SET balance = balance - %s WHERE telegram_id = %s AND balance >= %s",
+                (amount, from_id, min_balance + amount)
+            )
+        if session.rowcount != 1:
+            session.rollback()
+            return False
+
+        session.execute(
+            "UPDATE users SET balance = balance + %s WHERE telegram_id = %s",
+            (amount, to_id)
+        )
+        if session.rowcount != 1:
+            session.rollback()
+            return False
+
+        session.commit()
+        return True
+
+
 def update_user(telegram_id: int, fields: Dict[str, Any]) -> None:
     """Универсальное обновление полей"""
     if not fields:
@@ -173,18 +269,16 @@ def get_experience(user_id: int, username: Optional[str] = None) -> Tuple[int, f
         result = cursor.fetchone()
 
         if result:
-            true_lvl = next((lvl for lvl, xp in LEVELS if xp >= float(result['experience'])), float("inf")) - 1
+            true_lvl, experience, next_level_xp = progress(float(result['experience']))
             if int(result['level']) != true_lvl:
                 cursor.execute("UPDATE users SET level = %s WHERE telegram_id = %s", (true_lvl, user_id,))
                 conn.commit()
-                return true_lvl, float(result['experience']), LEVELS[true_lvl+1][1]
 
-            return int(result['level']), float(result['experience']), LEVELS[true_lvl+1][1]
-        else:
-            # Создаём пользователя если нет
-            get_balance(user_id, username)
-            conn.commit()
-            return 1, 0.0, LEVELS[1][1]
+            return true_lvl, experience, next_level_xp
+
+    # Создаём пользователя если нет
+    get_balance(user_id, username)
+    return progress(0.0)
 
 
 def update_experience(user_id: int, amount: float) -> Dict[str, Any]:
@@ -199,20 +293,9 @@ def update_experience(user_id: int, amount: float) -> Dict[str, Any]:
         if not result:
             return {'leveled_up': False, 'new_level': 1}
 
-        current_level = int(result['level'])
-        current_exp = float(result['experience'])
-        new_exp = round(current_exp + amount, 1)
-
-        # Проверка повышения уровня
-        leveled_up = False
-        while current_level < MAX_LEVEL:
-            next_level_xp = next((xp for lvl, xp in LEVELS if lvl == current_level + 1), float('inf'))
-
-            if new_exp >= next_level_xp:
-                current_level += 1
-                leveled_up = True
-            else:
-                break
+        new_exp = round(float(result['experience']) + amount, 1)
+        current_level = level_after_gain(int(result['level']), new_exp)
+        leveled_up = current_level > int(result['level'])
 
         cursor.execute(
             "UPDATE users SET experience = %s, level = %s WHERE telegram_id = %s",
@@ -227,6 +310,36 @@ def update_experience(user_id: int, amount: float) -> Dict[str, Any]:
         }
 
 
+def write_player_deltas(session: DBSession, deltas: Dict[int, Tuple[int, float, int]]) -> None:
+    """
+    Пакетное начисление баланса и опыта в транзакции вызывающего (итоги раунда)
+    deltas: {user_id: (изменение баланса, опыт, уровень после начисления)}
+    """
+    if not deltas:
+        return
+
+    session.executemany(
+        "UPDATE users SET balance = balance + %s, experience = ROUND(experience + %s, 1), "
+        "level = GREATEST(level, %s) WHERE telegram_id = %s",
+        [(balance, exp, level, user_id) for user_id, (balance, exp, level) in deltas.items()]
+    )
+
+
+def apply_player_deltas(deltas: Dict[int, Tuple[int, float, int]]) -> None:
+    """Пакетное начисление баланса и опыта одной транзакцией"""
+    if not deltas:
+        return
+
+    with db_session() as session:
+        session.begin()
+        try:
+            write_player_deltas(session, deltas)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+
 # ======================= БАНК И ВКЛАДЫ =======================
 
 def update_bank_balance(user_id: int, bank_balance: int, hours: Optional[int]) -> None:
@@ -278,34 +391,69 @@ def claim_bank_balance(user_id: int) -> Optional[int]:
     """Забрать вклад, возвращает сумму или None"""
     with get_db_connection() as (cursor, conn):
         cursor.execute(
-            "SELECT bank_balance, deposit_end, balance FROM users WHERE telegram_id = %s",
+            "SELECT bank_balance, deposit_end FROM users WHERE telegram_id = %s",
             (user_id,)
         )
         user = cursor.fetchone()
 
-        if not user or user["bank_balance"] <= 0:
-            return None
+    if not user or user["bank_balance"] <= 0:
+        return None
 
-        # Проверяем готовность
-        if user["deposit_end"] and datetime.now() < user["deposit_end"]:
+    # Проверяем готовность
+    if user["deposit_end"] and datetime.now() < user["deposit_end"]:
+        return None
+
+    deposit_income_bonus = get_user_business_bonuses(user_id).get('deposit_income_bonus', 0)
+    # Переводим на баланс
+    claimed_amount = user["bank_balance"] + deposit_income_bonus*user["bank_balance"]
+
+    # Одним UPDATE: повторный /claim не найдёт вклад и ничего не начислит
+    with db_session() as session:
+        session.execute(
+            "UPDATE users SET balance = balance + %s, bank_balance = 0, deposit_end = NULL "
+            "WHERE telegram_id = %s AND bank_balance = %s",
+            (int(round(claimed_amount)), user_id, user["bank_balance"])
+        )
+        session.commit()
+        if session.rowcount != 1:
             return None
 
-        deposit_income_bonus = get_user_business_bonuses(user_id).get('deposit_income_bonus', 0)
-        # Переводим на баланс
-        claimed_amount = user["bank_balance"] + deposit_income_bonus*user["bank_balance"]
-        new_balance = user["balance"] + claimed_amount
+    return claimed_amount
+
+
+def take_due_deposits(now: datetime) -> List[int]:
+    """
+    Завершившиеся вклады: сбрасывает deposit_end всей пачке одним UPDATE
+    Возвращает: telegram_id игроков, которых нужно уведомить
+    """
+    with db_session() as session:
+        session.begin()
+        try:
+            # Только id по индексу idx_users_deposit_end - пустой тик не читает строки users
+            # FOR UPDATE: /claim между SELECT и UPDATE дождётся конца транзакции,
+            # поэтому UPDATE сбросит ровно выбранные строки и лишних уведомлений не будет
+            rows = session.fetchall(
+                "SELECT telegram_id FROM users WHERE deposit_end <= %s FOR UPDATE",
+                (now,)
+            )
 
-        set_balance(user_id, new_balance)
-        update_bank_balance(user_id, 0, None)
+            if not rows:
+                session.rollback()
+                return []
 
-        return claimed_amount
+            user_ids = [row['telegram_id'] for row in rows]
+            placeholders = ", ".join(["%s"] * len(user_ids))
 
+            session.execute(
+                f"UPDATE users SET deposit_end = NULL WHERE telegram_id IN ({placeholders})",
+                tuple(user_ids)
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
 
-def get_all_users_with_deposit() -> List[Dict]:
-    """Получить всех пользователей с активными вкладами"""
-    with get_db_connection() as (cursor, conn):
-        cursor.execute("SELECT * FROM users WHERE bank_balance != 0")
-        return cursor.fetchall()
+    return user_ids
 
 
 # ======================= BLACKJACK =======================
@@ -450,6 +598,15 @@ def set_new_duel(user_id: int, target_id: int, bet: int, game: str = 'dice') ->
 
 # ======================= ТАЛАНТЫ =======================
 
+# user_id -> уровни четырёх талантов
+TALENTS_CACHE = LRUCache("talents", **TALENT_CACHE)
+
+
+def invalidate_user_talents(user_id: int) -> None:
+    """Сброс кэша талантов (вызывать после любого UPDATE talents)"""
+    TALENTS_CACHE.invalidate(user_id)
+
+
 def ensure_talent_exists(user_id: int) -> None:
     """Создание записи талантов если не существует"""
     with get_db_connection() as (cursor, conn):
@@ -462,21 +619,28 @@ def ensure_talent_exists(user_id: int) -> None:
 
 def get_user_talents(user_id: int) -> Dict[str, int]:
     """Получение уровней талантов пользователя"""
-    with get_db_connection() as (cursor, conn):
-        ensure_talent_exists(user_id)
+    cached = TALENTS_CACHE.get(user_id)
+    if cached is not None:
+        return dict(cached)
 
+    ensure_talent_exists(user_id)
+
+    with get_db_connection() as (cursor, conn):
         cursor.execute(
             "SELECT untouchable, agility, mastery, luck FROM talents WHERE user_id = %s",
             (user_id,)
         )
         row = cursor.fetchone()
 
-        return {
-            "untouchable": row['untouchable'],
-            "agility": row['agility'],
-            "mastery": row['mastery'],
-            "luck": row['luck']
-        }
+    talents = {
+        "untouchable": row['untouchable'],
+        "agility": row['agility'],
+        "mastery": row['mastery'],
+        "luck": row['luck']
+    }
+    TALENTS_CACHE.set(user_id, talents)
+
+    return dict(talents)
 
 
 def get_user_bonuses(user_id: int, talent_name: str) -> float:
@@ -484,16 +648,10 @@ def get_user_bonuses(user_id: int, talent_name: str) -> float:
     Получение бонуса от таланта
     Возвращает числовое значение бонуса (например, 0.3 для 30%)
     """
-    with get_db_connection() as (cursor, conn):
-        ensure_talent_exists(user_id)
-
-        cursor.execute(f"SELECT {talent_name} FROM talents WHERE user_id = %s", (user_id,))
-        result = cursor.fetchone()
+    level = get_user_talents(user_id).get(talent_name, 0)
+    bonus_per_level = TALENT_BONUSES.get(talent_name, 0)
 
-        level = result[talent_name] if result else 0
-        bonus_per_level = TALENT_BONUSES.get(talent_name, 0)
-
-        return round(level * bonus_per_level, 4)
+    return round(level * bonus_per_level, 4)
 
 
 # ======================= КОЛЕСО УДАЧИ =======================
@@ -526,20 +684,20 @@ def check_lucky_wheel_availability(user_id: int) -> bool | int:
         cursor.execute("SELECT last_lucky_wheel FROM users WHERE telegram_id = %s", (user_id,))
         last_spin = cursor.fetchone()
 
-        if not last_spin or last_spin['last_lucky_wheel'] is None:
-            update_luckywheel_timestamp(user_id)
-            return 0
+    if not last_spin or last_spin['last_lucky_wheel'] is None:
+        update_luckywheel_timestamp(user_id)
+        return 0
 
-        last_lucky_wheel = last_spin['last_lucky_wheel']
-        current_time = datetime.now()
-        time_passed = current_time - last_lucky_wheel
+    last_lucky_wheel = last_spin['last_lucky_wheel']
+    current_time = datetime.now()
+    time_passed = current_time - last_lucky_wheel
 
-        if time_passed >= timedelta(minutes=LUCKY_WHEEL_COOLDOWN):
-            update_luckywheel_timestamp(user_id)
-            return 0
+    if time_passed >= timedelta(minutes=LUCKY_WHEEL_COOLDOWN):
+        update_luckywheel_timestamp(user_id)
+        return 0
 
-        remaining = timedelta(minutes=LUCKY_WHEEL_COOLDOWN) - time_passed
-        return int(remaining.total_seconds() // 60)
+    remaining = timedelta(minutes=LUCKY_WHEEL_COOLDOWN) - time_passed
+    return int(remaining.total_seconds() // 60)
 
 
 def check_exp_case_availability(user_id: int) -> bool | int:
@@ -551,20 +709,20 @@ def check_exp_case_availability(user_id: int) -> bool | int:
         cursor.execute("SELECT last_exp_case FROM users WHERE telegram_id = %s", (user_id,))
         last_case = cursor.fetchone()
 
-        if not last_case or last_case['last_exp_case'] is None:
-            update_expcase_timestamp(user_id)
-            return 0
+    if not last_case or last_case['last_exp_case'] is None:
+        update_expcase_timestamp(user_id)
+        return 0
 
-        last_exp_case = last_case['last_exp_case']
-        current_time = datetime.now()
-        time_passed = current_time - last_exp_case
+    last_exp_case = last_case['last_exp_case']
+    current_time = datetime.now()
+    time_passed = current_time - last_exp_case
 
-        if time_passed >= timedelta(minutes=EXP_CASE_COOLDOWN):
-            update_expcase_timestamp(user_id)
-            return 0
+    if time_passed >= timedelta(minutes=EXP_CASE_COOLDOWN):
+        update_expcase_timestamp(user_id)
+        return 0
 
-        remaining = timedelta(minutes=EXP_CASE_COOLDOWN) - time_passed
-        return int(remaining.total_seconds() // 60)
+    remaining = timedelta(minutes=EXP_CASE_COOLDOWN) - time_passed
+    return int(remaining.total_seconds() // 60)
 
 # ======================= КРАЖА =======================
 
@@ -587,37 +745,37 @@ def check_steal_availability(user_id: int) -> bool | int:
         cursor.execute("SELECT last_steal FROM users WHERE telegram_id = %s", (user_id,))
         last_attempt = cursor.fetchone()
 
-        if not last_attempt or last_attempt['last_steal'] is None:
-            update_steal_timestamp(user_id)
-            return True
+    if not last_attempt or last_attempt['last_steal'] is None:
+        update_steal_timestamp(user_id)
+        return True
 
-        last_steal = last_attempt['last_steal']
-        current_time = datetime.now()
-        time_passed = current_time - last_steal
+    last_steal = last_attempt['last_steal']
+    current_time = datetime.now()
+    time_passed = current_time - last_steal
 
-        if time_passed >= timedelta(minutes=STEAL_COOLDOWN):
-            update_steal_timestamp(user_id)
-            return True
+    if time_passed >= timedelta(minutes=STEAL_COOLDOWN):
+        update_steal_timestamp(user_id)
+        return True
 
-        remaining = timedelta(minutes=STEAL_COOLDOWN) - time_passed
-        return int(remaining.total_seconds() // 60)
+    remaining = timedelta(minutes=STEAL_COOLDOWN) - time_passed
+    return int(remaining.total_seconds() // 60)
 
 
 # ======================= БИЗНЕС =======================
 
-def ensure_business_profile(user_id: int) -> None:
-    """Создание профиля бизнесов если не существует"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
+# user_id -> вектор бонусов бизнесов
+BUSINESS_BONUSES_CACHE = LRUCache("business_bonuses", **BUSINESS_BONUS_CACHE)
 
-    cursor.execute("SELECT user_id FROM user_businesses WHERE user_id = %s", (user_id,))
 
-    if not cursor.fetchone():
-        cursor.execute(
-            "INSERT INTO user_businesses (user_id, businesses_ids) VALUES (%s, %s)",
-            (user_id, json.dumps([]))
-        )
-        conn.commit()
+def ensure_business_profile(user_id: int) -> None:
+    """Создание профиля бизнесов если не существует"""
+    with db_session() as session:
+        if not session.fetchone("SELECT user_id FROM user_businesses WHERE user_id = %s", (user_id,)):
+            session.execute(
+                "INSERT INTO user_businesses (user_id, businesses_ids) VALUES (%s, %s)",
+                (user_id, json.dumps([]))
+            )
+            session.commit()
 
 
 def get_user_business_profile(user_id: int) -> Dict:
@@ -625,24 +783,16 @@ def get_user_business_profile(user_id: int) -> Dict:
     Получение профиля бизнесов пользователя
     Возвращает: {'businesses_ids': [1, 3, 5], 'passive_income': 50000}
     """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
     ensure_business_profile(user_id)
 
-    cursor.execute(
-        "SELECT businesses_ids FROM user_businesses WHERE user_id = %s",
-        (user_id,)
-    )
-    row = cursor.fetchone()
-
-    # Безопасная десериализация
-    try:
-        businesses_ids = json.loads(row['businesses_ids'])
-    except (json.JSONDecodeError, TypeError):
-        businesses_ids = []
+    with db_session() as session:
+        row = session.fetchone(
+            "SELECT businesses_ids FROM user_businesses WHERE user_id = %s",
+            (user_id,)
+        )
 
-    passive_income = sum(b["income"] for b in BUSINESS_LIST if b["id"] in businesses_ids)
+    businesses_ids = parse_businesses_ids(row['businesses_ids'])
+    passive_income = sum(BUSINESS_BY_ID[biz_id]["income"] for biz_id in businesses_ids if biz_id in BUSINESS_BY_ID)
 
     return {
         "businesses_ids": businesses_ids,
@@ -650,23 +800,72 @@ def get_user_business_profile(user_id: int) -> Dict:
     }
 
 
-def get_user_business_bonuses(user_id: int) -> Dict[str, float]:
+def parse_businesses_ids(raw: Optional[str]) -> List[int]:
+    """Безопасная десериализация списка бизнесов из user_businesses"""
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def businesses_bonuses(businesses_ids: Iterable[int]) -> Mapping[str, float]:
     """
-    Получение всех бонусов от бизнесов пользователя
-    Возвращает: {'game_mastery': 0.3, 'steal_chance': -5}
+    Вектор бонусов набора бизнесов: значение для каждого типа из BUSINESS_BONUS_TYPES
+    Возвращает: {'game_mastery': 0.3, 'steal_chance': -5, 'win_multiplier': 0, ...} (только для чтения)
     """
-    profile = get_user_business_profile(user_id)
-    bonuses = {}
+    return _bonus_vector(frozenset(businesses_ids))
+
+
+@lru_cache(maxsize=1024)
+def _bonus_vector(businesses_ids: frozenset) -> Mapping[str, float]:
+    bonuses = dict.fromkeys(BUSINESS_BONUS_TYPES, 0)
 
-    for biz_id in profile['businesses_ids']:
-        biz_data = next((b for b in BUSINESS_LIST if b['id'] == biz_id), None)
+    for biz_id in businesses_ids:
+        biz_data = BUSINESS_BY_ID.get(biz_id)
 
-        if not biz_data or not biz_data['user_bonus']:
+        if not biz_data:
             continue
 
         for bonus_type, value in biz_data['user_bonus'].items():
-            bonuses[bonus_type] = bonuses.get(bonus_type, 0) + value
+            bonuses[bonus_type] += value
+
+    return MappingProxyType(bonuses)
+
+
+def businesses_income(businesses_ids: Iterable[int]) -> int:
+    """Доход набора бизнесов в час с учётом множителей"""
+    return _income_for(frozenset(businesses_ids))
+
+
+@lru_cache(maxsize=1024)
+def _income_for(businesses_ids: frozenset) -> int:
+    base_income = sum(BUSINESS_BY_ID[biz_id]["income"] for biz_id in businesses_ids if biz_id in BUSINESS_BY_ID)
+
+    # Применяем бонус от блокчейн-стартапа (+10% доходов)
+    income_mult = businesses_bonuses(businesses_ids)['income_multiplier']
+
+    if income_mult:
+        base_income = int(base_income * (1 + income_mult))
+
+    return base_income
+
+
+def get_user_business_bonuses(user_id: int) -> Mapping[str, float]:
+    """
+    Получение всех бонусов от бизнесов пользователя (из кэша, если есть)
+    Возвращает: {'game_mastery': 0.3, 'steal_chance': -5, ...}
+    """
+    cached = BUSINESS_BONUSES_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+
+    return load_user_business_bonuses(user_id)
+
 
+def load_user_business_bonuses(user_id: int) -> Mapping[str, float]:
+    """Загрузка вектора бонусов из БД с записью в кэш"""
+    bonuses = businesses_bonuses(get_user_business_profile(user_id)['businesses_ids'])
+    BUSINESS_BONUSES_CACHE.set(user_id, bonuses)
     return bonuses
 
 
@@ -675,41 +874,305 @@ def add_user_business(user_id: int, business_id: int) -> bool:
     Добавление бизнеса пользователю
     Возвращает: True если успешно, False если уже есть
     """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
+    ensure_business_profile(user_id)
 
-    profile = get_user_business_profile(user_id)
-    businesses = profile["businesses_ids"]
+    with db_session() as session:
+        row = session.fetchone(
+            "SELECT businesses_ids, acquired_at FROM user_businesses WHERE user_id = %s",
+            (user_id,)
+        )
+        businesses = parse_businesses_ids(row['businesses_ids'])
 
-    if business_id in businesses:
-        return False
+        if business_id in businesses:
+            return False
 
-    businesses.append(business_id)
-    businesses.sort()
+        # Прошедшие часы - по старому набору бизнесов, новый приносит доход с момента покупки
+        accrue_income(session, user_id, businesses, row['acquired_at'])
 
-    cursor.execute(
-        "UPDATE user_businesses SET businesses_ids = %s WHERE user_id = %s",
-        (json.dumps(businesses), user_id)
-    )
-    conn.commit()
+        businesses.append(business_id)
+        businesses.sort()
 
+        session.execute(
+            "UPDATE user_businesses SET businesses_ids = %s, acquired_at = %s WHERE user_id = %s",
+            (json.dumps(businesses), datetime.now(), user_id)
+        )
+        session.commit()
+
+    BUSINESS_BONUSES_CACHE.invalidate(user_id)
     return True
 
 
 def calculate_total_income(user_id: int) -> int:
     """Расчёт общего дохода с учётом множителей"""
-    profile = get_user_business_profile(user_id)
-    businesses = profile["businesses_ids"]
-    base_income = sum(b["income"] for b in BUSINESS_LIST if b["id"] in businesses)
+    return businesses_income(get_user_business_profile(user_id)["businesses_ids"])
 
-    # Применяем бонус от блокчейн-стартапа (+10% доходов)
-    bonuses = get_user_business_bonuses(user_id)
-    income_mult = bonuses.get('income_multiplier', 0)
 
-    if income_mult:
-        base_income = int(base_income * (1 + income_mult))
+# ======================= ПАССИВНЫЙ ДОХОД =======================
 
-    return base_income
+# Доход начисляется за целые часы с acquired_at, acquired_at сдвигается на эти часы
+INCOME_PERIOD = timedelta(hours=1)
+INCOME_CHUNK_SIZE = 1000
+
+
+def due_income_hours(acquired_at: Optional[datetime], now: datetime) -> int:
+    """Сколько целых периодов дохода прошло с acquired_at"""
+    if acquired_at is None:
+        return 0
+    return max(int((now - acquired_at) // INCOME_PERIOD), 0)
+
+
+def accrue_income(
+        session: DBSession,
+        user_id: int,
+        businesses_ids: Iterable[int],
+        acquired_at: Optional[datetime],
+        now: Optional[datetime] = None
+) -> int:
+    """
+    Ленивое начисление дохода при чтении баланса (в уже открытой сессии)
+    Возвращает: начисленную сумму (0 - если начислять нечего или успел другой запрос)
+    """
+    hours = due_income_hours(acquired_at, now or datetime.now())
+    if not hours:
+        return 0
+
+    income = businesses_income(businesses_ids)
+
+    # Без дохода acquired_at всё равно сдвигается: иначе первый купленный бизнес
+    # начислил бы доход за все часы с создания профиля
+    if not income:
+        session.execute(
+            "UPDATE user_businesses SET acquired_at = acquired_at + INTERVAL %s HOUR "
+            "WHERE user_id = %s AND acquired_at = %s",
+            (hours, user_id, acquired_at)
+        )
+        session.commit()
+        return 0
+
+    # Условие на прежний acquired_at: параллельное чтение не начислит второй раз
+    session.execute(
+        "UPDATE users u JOIN user_businesses b ON b.user_id = u.telegram_id "
+        "SET u.balance = u.balance + %s, b.acquired_at = b.acquired_at + INTERVAL %s HOUR "
+        "WHERE b.user_id = %s AND b.acquired_at = %s",
+        (income * hours, hours, user_id, acquired_at)
+    )
+    session.commit()
+
+    return income * hours if session.rowcount else 0
+
+
+def pay_due_incomes(now: datetime) -> List[Tuple[int, int]]:
+    """
+    Фоновое начисление дохода тем, кто давно не заходил (остальным доход
+    начисляется при чтении баланса - accrue_income)
+    Игроки обрабатываются кусками по INCOME_CHUNK_SIZE, каждый кусок - своя транзакция:
+    строки блокируются SELECT ... FOR UPDATE и группируются по (сумма, часы),
+    каждая группа - один UPDATE, который начисляет баланс и сдвигает acquired_at
+    Возвращает: [(user_id, доход), ...] - только реально начисленное
+    """
+    cutoff = now - INCOME_PERIOD
+
+    with db_session() as session:
+        rows = session.fetchall("SELECT user_id FROM user_businesses WHERE acquired_at <= %s", (cutoff,))
+
+    user_ids = [row['user_id'] for row in rows]
+    paid = []
+
+    for start in range(0, len(user_ids), INCOME_CHUNK_SIZE):
+        paid.extend(_pay_income_chunk(user_ids[start:start + INCOME_CHUNK_SIZE], cutoff, now))
+
+    return paid
+
+
+def _pay_income_chunk(user_ids: List[int], cutoff: datetime, now: datetime) -> List[Tuple[int, int]]:
+    placeholders = ", ".join(["%s"] * len(user_ids))
+
+    with db_session() as session:
+        session.begin()
+        try:
+            # Перечитываем под блокировкой: чтение баланса (accrue_income) дождётся конца
+            # транзакции и уже не найдёт прежний acquired_at, а строки, которые оно успело
+            # начислить раньше, сюда не попадут
+            rows = session.fetchall(
+                "SELECT user_id, businesses_ids, acquired_at FROM user_businesses "
+                f"WHERE user_id IN ({placeholders}) AND acquired_at <= %s FOR UPDATE",
+                (*user_ids, cutoff)
+            )
+
+            # (сумма, часы) -> [(игрок, acquired_at)] (доход зависит только от набора бизнесов)
+            # Группа с нулевой суммой только сдвигает acquired_at - как в accrue_income
+            groups: Dict[Tuple[int, int], List[Tuple[int, datetime]]] = {}
+            for row in rows:
+                hours = due_income_hours(row['acquired_at'], now)
+                income = businesses_income(parse_businesses_ids(row['businesses_ids']))
+                if hours:
+                    groups.setdefault((income * hours, hours), []).append((row['user_id'], row['acquired_at']))
+
+            paid = []
+            for (amount, hours), players in groups.items():
+                placeholders = ", ".join(["(%s, %s)"] * len(players))
+                session.execute(
+                    "UPDATE users u JOIN user_businesses b ON b.user_id = u.telegram_id "
+                    "SET u.balance = u.balance + %s, b.acquired_at = b.acquired_at + INTERVAL %s HOUR "
+                    f"WHERE (b.user_id, b.acquired_at) IN ({placeholders})",
+                    (amount, hours, *(value for player in players for value in player))
+                )
+                if amount > 0:
+                    paid.extend((user_id, amount) for user_id, _ in players)
+
+            session.commit()
+            return paid
+        except Exception:
+            session.rollback()
+            raise
+
+
+# ======================= ПРОФИЛЬ ИГРОКА =======================
+
+class PlayerSnapshot(NamedTuple):
+    """Всё, что нужно экранам /stats, /check, /shop и /talents, одним запросом"""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    balance: int
+    level: int
+    experience: float
+    next_level_xp: float
+    talents: Dict[str, int]
+    businesses_ids: List[int]
+
+    @property
+    def businesses(self) -> List[Dict]:
+        return [b for b in BUSINESS_LIST if b["id"] in self.businesses_ids]
+
+    @property
+    def business_bonuses(self) -> Mapping[str, float]:
+        return businesses_bonuses(self.businesses_ids)
+
+    @property
+    def passive_income(self) -> int:
+        return businesses_income(self.businesses_ids)
+
+    def talent_bonus(self, talent_name: str) -> float:
+        """То же, что get_user_bonuses, но без запроса к БД"""
+        return round(self.talents.get(talent_name, 0) * TALENT_BONUSES.get(talent_name, 0), 4)
+
+
+PLAYER_SNAPSHOT_QUERY = """
+    SELECT u.telegram_id, u.username, u.first_name, u.balance, u.level, u.experience,
+           t.user_id AS talents_user_id, t.untouchable, t.agility, t.mastery, t.luck,
+           b.user_id AS businesses_user_id, b.businesses_ids, b.acquired_at
+    FROM users u
+    LEFT JOIN talents t ON t.user_id = u.telegram_id
+    LEFT JOIN user_businesses b ON b.user_id = u.telegram_id
+    WHERE {where}
+"""
+
+
+def get_player_snapshot(
+        user_id: Optional[int] = None,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        seen: bool = False
+) -> Optional[PlayerSnapshot]:
+    """
+    Загрузка профиля игрока (баланс, опыт, таланты, бизнесы) одним JOIN-запросом
+    По user_id недостающие записи создаются, по username (без @) - возвращает None, если игрока нет
+    seen=True - игрок сам открыл экран: обновляется last_seen (как в ensure_user_exists)
+    """
+    if user_id is not None:
+        where, param = "u.telegram_id = %s", user_id
+    elif username:
+        where, param = "u.username = %s", username
+    else:
+        return None
+
+    with db_session() as session:
+        row = session.fetchone(PLAYER_SNAPSHOT_QUERY.format(where=where), (param,))
+
+        if not row:
+            if user_id is None:
+                return None
+
+            session.execute(
+                "INSERT INTO users (telegram_id, username, first_name, balance) VALUES (%s, %s, %s, %s)",
+                (user_id, username, first_name, 100)
+            )
+            session.commit()
+            row = {
+                'telegram_id': user_id, 'username': username, 'first_name': first_name,
+                'balance': 100, 'level': 1, 'experience': 0.0,
+                'talents_user_id': None, 'businesses_user_id': None, 'businesses_ids': None
+            }
+
+        user_id = row['telegram_id']
+        level = progress(float(row['experience']))[0]
+
+        # Недостающие записи создаются только при первом обращении
+        writes = []
+        if row['talents_user_id'] is None:
+            writes.append(("INSERT INTO talents (user_id) VALUES (%s)", (user_id,)))
+        if row['businesses_user_id'] is None:
+            writes.append((
+                "INSERT INTO user_businesses (user_id, businesses_ids) VALUES (%s, %s)",
+                (user_id, json.dumps([]))
+            ))
+        if int(row['level']) != level:
+            writes.append(("UPDATE users SET level = %s WHERE telegram_id = %s", (level, user_id)))
+        if seen:
+            writes.append(("UPDATE users SET last_seen = CURRENT_TIMESTAMP WHERE telegram_id = %s", (user_id,)))
+
+        for query, params in writes:
+            session.execute(query, params)
+        if writes:
+            session.commit()
+
+        businesses_ids = parse_businesses_ids(row['businesses_ids'])
+        balance = row['balance'] + accrue_income(session, user_id, businesses_ids, row.get('acquired_at'))
+
+    return snapshot_from_row(row, balance)
+
+
+def get_player_snapshots(user_ids: Iterable[int]) -> Dict[int, PlayerSnapshot]:
+    """
+    Профили нескольких игроков одним запросом (только чтение, без создания записей)
+    Возвращает: {user_id: PlayerSnapshot} - отсутствующих в БД игроков в словаре нет
+    """
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    with db_session() as session:
+        rows = session.fetchall(
+            PLAYER_SNAPSHOT_QUERY.format(where=f"u.telegram_id IN ({placeholders})"),
+            tuple(user_ids)
+        )
+
+    return {row['telegram_id']: snapshot_from_row(row) for row in rows}
+
+
+def snapshot_from_row(row: Dict, balance: Optional[int] = None) -> PlayerSnapshot:
+    """PlayerSnapshot из строки PLAYER_SNAPSHOT_QUERY (заодно обновляет кэши талантов и бонусов)"""
+    user_id = row['telegram_id']
+    level, experience, next_level_xp = progress(float(row['experience']))
+    businesses_ids = parse_businesses_ids(row['businesses_ids'])
+
+    talents = {name: row.get(name) or 0 for name in ("untouchable", "agility", "mastery", "luck")}
+    TALENTS_CACHE.set(user_id, talents)
+    BUSINESS_BONUSES_CACHE.set(user_id, businesses_bonuses(businesses_ids))
+
+    return PlayerSnapshot(
+        user_id=user_id,
+        username=row['username'],
+        first_name=row['first_name'],
+        balance=row['balance'] if balance is None else balance,
+        level=level,
+        experience=experience,
+        next_level_xp=next_level_xp,
+        talents=dict(talents),
+        businesses_ids=businesses_ids
+    )
 
 # ======================= ГЕНЕРАЦИЯ ИЗОБРАЖЕНИЙ =======================
 
@@ -779,7 +1242,7 @@ def activate_promocode(user_id: int, promocode: str) -> str:
     if award.get("business"):
         for biz_id in award["business"]:
             has_business = add_user_business(user_id, biz_id)
-            msg += f"• {BUSINESS_LIST[biz_id]['emoji']} {BUSINESS_LIST[biz_id]['name']}"
+            msg += f"• {BUSINESS_BY_ID[biz_id]['emoji']} {BUSINESS_BY_ID[biz_id]['name']}"
             msg += " (уже есть)\n" if not has_business else "\n"
 
     if award.get("experience"):
@@ -788,18 +1251,13 @@ def activate_promocode(user_id: int, promocode: str) -> str:
 
     if award.get("lvl"):
         current_lvl, current_xp, next_level_xp = get_experience(user_id)
-        target_lvl = current_lvl + award["lvl"]
+        target_xp = exp_for_level(current_lvl + award["lvl"])
 
-        next_level_xp = next(
-            (xp for lvl, xp in LEVELS if lvl == target_lvl),
-            float('inf')
-        )
-
-        update_experience(user_id, next_level_xp - current_xp)
+        update_experience(user_id, max(target_xp - current_xp, 0))
         msg += f"• ✨ +{award['lvl']} LVL\n"
 
     if award.get("balance"):
-        set_balance(user_id, get_balance(user_id) + award["balance"])
+        adjust_balance(user_id, award["balance"])
         msg += f"• 💰 +{award['balance']} $miles\n"
 
     return msg
@@ -846,7 +1304,7 @@ def try_activate_promocode(promocode: str, user_id: int) -> bool:
 
 
 async def check_promocode_requirements(user_id: int, promocode: str) -> Tuple[bool, str]:
-    data = get_promocode_data(promocode)
+    data = await run_db(get_promocode_data, promocode)
     requirements = data.get("requirements", {})
 
     if not requirements:
@@ -854,9 +1312,9 @@ async def check_promocode_requirements(user_id: int, promocode: str) -> Tuple[bo
 
     errors = []
 
-    user_level, user_experience, next_level_xp = get_experience(user_id)
-    user_businesses = get_user_business_profile(user_id).get("businesses", [])
-    user_talents = get_user_talents(user_id)
+    user_level, user_experience, next_level_xp = await run_db(get_experience, user_id)
+    user_businesses = (await run_db(get_user_business_profile, user_id)).get("businesses", [])
+    user_talents = await run_db(get_user_talents, user_id)
 
     if requirements.get("required_lvl") and user_level < requirements["required_lvl"]:
         errors.append(f"⚠️ Необходим уровень {requirements['required_lvl']} или выше.")
@@ -864,7 +1322,7 @@ async def check_promocode_requirements(user_id: int, promocode: str) -> Tuple[bo
     for biz_id in requirements.get("required_business", []):
         if biz_id not in user_businesses:
             errors.append(
-                f"⚠️ Необходим бизнес <i>{BUSINESS_LIST[biz_id]['emoji']} {BUSINESS_LIST[biz_id]['name']}</i>."
+                f"⚠️ Необходим бизнес <i>{BUSINESS_BY_ID[biz_id]['emoji']} {BUSINESS_BY_ID[biz_id]['name']}</i>."
             )
 
     for talent, lvl in requirements.get("required_talents", {}).items():
@@ -0,0 +1,146 @@
+"""
+Топы игроков
+Первые N строк топа и готовая подпись хранятся в памяти и обновляются фоновой
+задачей раз в LEADERBOARD['refresh_interval'] секунд. Место игрока считается
+индексным COUNT(*) и тоже кэшируется на этот интервал (сам баланс - всегда живой)
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram.ext import ContextTypes
+
+from cache import LRUCache
+from constants import LEADERBOARD
+from db import async_db_session
+from helpers import cropped_num
+from repository import get_balance
+
+REFRESH_INTERVAL = LEADERBOARD['refresh_interval']
+
+
+class Leaderboard:
+    """Снимок топа по одной колонке users с закэшированной подписью"""
+
+    def __init__(self, column: str, limit: int, render: Callable[[List[Dict]], Awaitable[str]]):
+        self.column = column
+        self.limit = limit
+        self._render = render
+
+        self.rows: List[Dict] = []
+        self._caption: Optional[str] = None
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._caption is None or time.monotonic() - self._refreshed_at >= REFRESH_INTERVAL
+
+    async def refresh(self, force: bool = True) -> None:
+        """Перечитать топ из БД и перерисовать подпись"""
+        async with self._lock:
+            # Пока ждали блокировку, снимок мог обновить другой вызов
+            if not force and not self.is_stale:
+                return
+
+            async with async_db_session() as session:
+                rows = await session.fetchall(
+                    "SELECT telegram_id, username, first_name, balance, level, experience "
+                    f"FROM users ORDER BY {self.column} DESC LIMIT %s",
+                    (self.limit,)
+                )
+
+            self.rows = rows
+            self._caption = await self._render(rows)
+            self._refreshed_at = time.monotonic()
+
+    async def caption(self) -> str:
+        """Подпись топа (из БД - только если снимок устарел)"""
+        if self.is_stale:
+            await self.refresh(force=False)
+        return self._caption
+
+
+# ======================= ОФОРМЛЕНИЕ =======================
+
+async def render_balance_top(players: List[Dict]) -> str:
+    leaderboard_lines = []
+    for i, p in enumerate(players, 1):
+        # HTML автоматически экранирует опасные символы
+        if p['username']:
+            name = f"<a href='tg://user?id=0'>{p['username']}</a>"
+        else:
+            name = f"<a href='tg://user?id=0'>{p['first_name']}</a>"
+
+        balance_short = await cropped_num(p['balance'])
+        leaderboard_lines.append(f"{i}. {name} | <i>{balance_short} $miles</i>")
+
+    leaderboard = "\n".join(leaderboard_lines)
+    return f"🏆 <b>Топ {LEADERBOARD['balance_top']} игроков по балансу:</b>\n\n{leaderboard}"
+
+
+async def render_level_top(players: List[Dict]) -> str:
+    leaderboard_lines = []
+    for i, p in enumerate(players, 1):
+        if p['username']:
+            name = f"@{p['username']}"
+        else:
+            name = p['first_name']
+
+        leaderboard_lines.append(
+            f"{i}. {name} — ⭐️{p['level']} ({p['experience']} EXP)"
+        )
+
+    leaderboard = "\n".join(leaderboard_lines)
+    return f"🏆 <b>Топ {LEADERBOARD['level_top']} игроков по уровню:</b>\n\n{leaderboard}"
+
+
+BALANCE_TOP = Leaderboard("balance", LEADERBOARD['balance_top'], render_balance_top)
+LEVEL_TOP = Leaderboard("experience", LEADERBOARD['level_top'], render_level_top)
+
+# ======================= МЕСТО ИГРОКА =======================
+
+# user_id -> место (баланс в кэш не попадает: он читается с начислением дохода)
+RANKS_CACHE = LRUCache("leaderboard_ranks", LEADERBOARD['ranks_cache_size'], REFRESH_INTERVAL)
+
+
+async def get_balance_place(user_id: int, username: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Место игрока в топе по балансу
+    Возвращает: (место, текущий баланс)
+    """
+    balance = await get_balance(user_id, username)
+
+    place = RANKS_CACHE.get(user_id)
+    if place is None:
+        # COUNT по индексу idx_users_balance вместо выгрузки всей таблицы
+        async with async_db_session() as session:
+            row = await session.fetchone("SELECT COUNT(*) AS higher FROM users WHERE balance > %s", (balance,))
+
+        place = int(row['higher']) + 1
+        RANKS_CACHE.set(user_id, place)
+
+    return place, balance
+
+
+# ======================= ФОНОВАЯ ЗАДАЧА =======================
+
+async def refresh_leaderboards(context: ContextTypes.DEFAULT_TYPE):
+    """Обновление снимков топов (job_queue)"""
+    for board in (BALANCE_TOP, LEVEL_TOP):
+        try:
+            await board.refresh()
+        except Exception as e:
+            print(f"Ошибка обновления топа {board.column}: {e}")
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'Leaderboard',
+    'BALANCE_TOP',
+    'LEVEL_TOP',
+    'get_balance_place',
+    'refresh_leaderboards'
+]
@@ -0,0 +1,49 @@
+"""
+Таблица уровней
+Поиск уровня по опыту - бинарный поиск по порогам из constants.LEVELS
+Уровень L достигнут, когда опыт >= exp_for_level(L)
+"""
+
+from bisect import bisect_right
+from typing import List, Tuple
+
+from constants import LEVELS, MAX_LEVEL
+
+# LEVEL_XP[L - 1] - общий опыт, необходимый для уровня L (по возрастанию)
+LEVEL_XP: List[int] = [xp for _, xp in LEVELS]
+
+
+def level_for_exp(experience: float) -> int:
+    """Уровень для количества опыта (1..MAX_LEVEL)"""
+    return max(1, min(bisect_right(LEVEL_XP, experience), MAX_LEVEL))
+
+
+def exp_for_level(level: int) -> int:
+    """Общий опыт, необходимый для уровня (уровень ограничивается 1..MAX_LEVEL)"""
+    return LEVEL_XP[max(1, min(level, MAX_LEVEL)) - 1]
+
+
+def level_after_gain(current_level: int, new_exp: float) -> int:
+    """Уровень после начисления опыта (не понижается)"""
+    return max(current_level, level_for_exp(new_exp))
+
+
+def progress(experience: float) -> Tuple[int, float, int]:
+    """
+    Прогресс игрока
+    Возвращает: (уровень, опыт, опыт для следующего уровня)
+    На максимальном уровне следующим считается он сам
+    """
+    level = level_for_exp(experience)
+    return level, experience, exp_for_level(level + 1)
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'LEVEL_XP',
+    'level_for_exp',
+    'exp_for_level',
+    'level_after_gain',
+    'progress'
+]
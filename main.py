@@ -5,8 +5,12 @@ from telegram.ext import (
 )
 from blackjack import blackjack, handle_blackjack_action
 from buy_smiles import show_donate_menu, button_callback_handler, precheckout_handler, success_payment_handler
-from constants import TOKEN
-from roulette import roulette, game, check_all_games
+from constants import TOKEN, LEADERBOARD, INCOME, SPIN_IMAGE_CACHE
+from db import run_db, ensure_indexes
+from leaderboard import refresh_leaderboards
+from notifications import NOTIFICATION_QUEUE
+from render import RENDER_SERVICE
+from roulette import roulette, game, schedule_active_games
 from talents import talents, talent_info, upgrade_talent
 from shop import shop, shop_callback, my_biz, check_all_incomes
 from main_duels import duel, my_duels
@@ -18,11 +22,12 @@ from mines import mines, handle_mines_action
 from commands import (
     start, help_command, help_callback, stats, top, top_lvl,
     check, give, ref, spin, lucky_wheel, exp_case, hack, steal,
-    deposit, deposit_choice, claim_deposit, check_all_deposits, promo
+    deposit, deposit_choice, claim_deposit, check_all_deposits, promo,
+    warm_spin_images
 )
 from admin import (
     admin_panel, admin_give_money, admin_set_level,
-    admin_set_talent, admin_give_business, admin_callback
+    admin_set_talent, admin_give_business, admin_callback, admin_stats
 )
 from telegram.error import TimedOut, NetworkError
 import logging
@@ -71,6 +76,24 @@ async def set_commands(app):
     await app.bot.set_my_commands(commands)
 
 
+async def on_startup(app):
+    """Подготовка перед запуском: индексы БД, таймеры рулетки, очередь уведомлений и меню команд"""
+    await run_db(ensure_indexes)
+    await schedule_active_games(app.job_queue)
+    NOTIFICATION_QUEUE.start(app.bot)
+    await set_commands(app)
+
+    # Картинки /spin рисуются в фоне, запуск бота не ждёт
+    if SPIN_IMAGE_CACHE['warmup']:
+        app.create_task(warm_spin_images())
+
+
+async def on_shutdown(app):
+    """Остановка воркера уведомлений и пула отрисовки"""
+    await NOTIFICATION_QUEUE.stop()
+    RENDER_SERVICE.shutdown()
+
+
 # ======================= ОБРАБОТЧИК ТЕКСТА (КНОПКИ) =======================
 
 async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -111,8 +134,9 @@ def build_bot(token: str):
     """
     app = ApplicationBuilder().token(token).build()
 
-    # Установка команд меню
-    app.post_init = set_commands
+    # Индексы БД, таймеры рулетки и команды меню
+    app.post_init = on_startup
+    app.post_shutdown = on_shutdown
 
     # Установка логгера ошибок
     logger = logging.getLogger(__name__)
@@ -135,18 +159,19 @@ def build_bot(token: str):
         first=10
     )
 
-    # Проверка групповых игр рулетки каждые 3 секунды
-    app.job_queue.run_repeating(
-        check_all_games,
-        interval=5,
-        first=10
-    )
+    # Пассивный доход начисляется при чтении баланса, обход включается только явно
+    if INCOME['sweep_interval'] > 0:
+        app.job_queue.run_repeating(
+            check_all_incomes,
+            interval=INCOME['sweep_interval'],
+            first=60
+        )
 
-    # Начисление пассивного дохода каждые 3 секунды
+    # Обновление топов
     app.job_queue.run_repeating(
-        check_all_incomes,
-        interval=60,
-        first=10
+        refresh_leaderboards,
+        interval=LEADERBOARD['refresh_interval'],
+        first=5
     )
 
     # ===== ОСНОВНЫЕ КОМАНДЫ =====
@@ -167,6 +192,7 @@ def build_bot(token: str):
     app.add_handler(CommandHandler("admin_level", admin_set_level))
     app.add_handler(CommandHandler("admin_talent", admin_set_talent))
     app.add_handler(CommandHandler("admin_biz", admin_give_business))
+    app.add_handler(CommandHandler("admin_stats", admin_stats))
 
     app.add_handler(CallbackQueryHandler(
         admin_callback,
@@ -311,7 +337,11 @@ if __name__ == "__main__":
     print("   • Вклады")
     print("\n🔄 Фоновые задачи:")
     print("   • Проверка вкладов (каждую минуту)")
-    print("   • Проверка рулетки (каждые 3 сек)")
-    print("   • Пассивный доход (каждую минуту)")
+    print("   • Раунды рулетки (по таймеру на каждый раунд)")
+    print(f"   • Топы (каждые {LEADERBOARD['refresh_interval']:g} сек)")
+    if INCOME['sweep_interval'] > 0:
+        print(f"   • Пассивный доход (обход каждые {INCOME['sweep_interval']:g} сек)")
+    else:
+        print("   • Пассивный доход (начисляется при чтении баланса)")
 
     app.run_polling(drop_pending_updates=True)
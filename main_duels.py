@@ -5,9 +5,10 @@ from telegram.ext import ContextTypes
 from constants import DUELS, MIN_BET
 from helpers import (
     get_balance, spaced_num,
-    user_exists, get_cursor, parse_bet_amount,
+    user_exists, parse_bet_amount,
     ensure_user_exists
 )
+from db import db_session, async_db_session
 
 # Извлекаем константы
 GAME_NAMES = DUELS["games"]
@@ -26,15 +27,12 @@ def find_user_by_username(username: str) -> Optional[int]:
     Returns:
         telegram_id или None
     """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT telegram_id FROM users WHERE username = %s",
-        (username,)
-    )
+    with db_session() as session:
+        result = session.fetchone(
+            "SELECT telegram_id FROM users WHERE username = %s",
+            (username,)
+        )
 
-    result = cursor.fetchone()
     return result['telegram_id'] if result else None
 
 
@@ -50,18 +48,16 @@ def create_duel_session(user_id: int, target_id: int, bet: int) -> bool:
     Returns:
         True если успешно
     """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
     try:
-        cursor.execute("""
-            INSERT INTO duels_sessions 
-            (user_id, target_id, bet, game, round, user_score, target_score, move, current_round)
-            VALUES (%s, %s, %s, '', %s, 0, 0, '', 0)
-            ON DUPLICATE KEY UPDATE bet = VALUES(bet)
-        """, (user_id, target_id, bet, DEFAULT_ROUNDS))
-
-        conn.commit()
+        with db_session() as session:
+            session.execute("""
+                INSERT INTO duels_sessions 
+                (user_id, target_id, bet, game, round, user_score, target_score, move, current_round)
+                VALUES (%s, %s, %s, '', %s, 0, 0, '', 0)
+                ON DUPLICATE KEY UPDATE bet = VALUES(bet)
+            """, (user_id, target_id, bet, DEFAULT_ROUNDS))
+
+            session.commit()
         return True
     except Exception as e:
         print(f"Error creating duel session: {e}")
@@ -219,15 +215,21 @@ async def my_duels(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /my_duels - показать активные дуэли"""
     user_id = update.effective_user.id
 
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute("""
-        SELECT * FROM duels_sessions 
-        WHERE user_id = %s OR target_id = %s
-    """, (user_id, user_id))
-
-    duels = cursor.fetchall()
+    async with async_db_session() as session:
+        duels = await session.fetchall("""
+            SELECT * FROM duels_sessions 
+            WHERE user_id = %s OR target_id = %s
+        """, (user_id, user_id))
+
+        opponent_ids = {d['target_id'] if d['user_id'] == user_id else d['user_id'] for d in duels}
+        opponents = {}
+        if opponent_ids:
+            placeholders = ", ".join(["%s"] * len(opponent_ids))
+            rows = await session.fetchall(
+                f"SELECT telegram_id, username, first_name FROM users WHERE telegram_id IN ({placeholders})",
+                tuple(opponent_ids)
+            )
+            opponents = {row['telegram_id']: row for row in rows}
 
     if not duels:
         await update.message.reply_text(
@@ -246,11 +248,7 @@ async def my_duels(update: Update, context: ContextTypes.DEFAULT_TYPE):
         opponent_id = duel['target_id'] if is_initiator else duel['user_id']
 
         # Получаем имя оппонента
-        cursor.execute(
-            "SELECT username, first_name FROM users WHERE telegram_id = %s",
-            (opponent_id,)
-        )
-        opp_data = cursor.fetchone()
+        opp_data = opponents.get(opponent_id)
         opponent_name = f"@{opp_data['username']}" if opp_data and opp_data['username'] else f"User{opponent_id}"
 
         # Статус дуэли
@@ -0,0 +1,147 @@
+"""
+Реестр загруженных в Telegram картинок
+После первой отправки запоминается file_id, который вернул Telegram (ключ -
+хэш содержимого), и дальше вместо байтов отправляется он. Реестр хранится
+в файле MEDIA['registry_path'] и переживает перезапуск
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Union
+
+from telegram import Message
+from telegram.error import BadRequest
+
+from assets import Asset
+from constants import MEDIA
+
+logger = logging.getLogger(__name__)
+
+
+def media_key(data: bytes) -> str:
+    """Хэш содержимого картинки"""
+    return hashlib.sha256(data).hexdigest()
+
+
+# Ошибки Telegram, после которых file_id больше не годится (остальные BadRequest -
+# например, ошибка разметки подписи - повторятся и при загрузке байтами)
+STALE_FILE_ERRORS = ("wrong file identifier", "file reference expired", "wrong remote file identifier")
+
+
+def is_stale_file_error(error: BadRequest) -> bool:
+    message = str(error).lower()
+    return any(text in message for text in STALE_FILE_ERRORS)
+
+
+class Frame(NamedTuple):
+    """
+    Закодированная картинка вместе с хэшем содержимого
+    Кэши картинок хранят Frame: хэш считается один раз при отрисовке и
+    вытесняется из памяти вместе с байтами
+    """
+    data: bytes
+    key: str
+
+    @classmethod
+    def of(cls, data: bytes) -> "Frame":
+        return cls(data, media_key(data))
+
+
+class MediaRegistry:
+    """Хэш содержимого -> file_id с сохранением в JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file_ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._file_ids.get(key)
+
+    def remember(self, key: str, file_id: str) -> None:
+        if self._file_ids.get(key) == file_id:
+            return
+
+        self._file_ids[key] = file_id
+        self._save()
+
+    def forget(self, key: str) -> None:
+        if self._file_ids.pop(key, None) is not None:
+            self._save()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._file_ids = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Реестр картинок %s не прочитан: %s", self.path, e)
+
+    def _save(self) -> None:
+        # Запись во временный файл и замена: реестр не бьётся при падении
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._file_ids, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("Реестр картинок %s не сохранён: %s", self.path, e)
+
+
+MEDIA_REGISTRY = MediaRegistry(MEDIA['registry_path'])
+
+
+async def send_photo(send: Callable[..., Awaitable[Message]], photo: Union[bytes, Frame, Asset], **kwargs) -> Message:
+    """
+    Отправка картинки через reply_photo/send_photo: по file_id, если картинку
+    уже загружали, иначе байтами с запоминанием file_id
+
+        await send_photo(update.message.reply_photo, IMAGE_CACHE["START_IMG"], caption=...)
+        await send_photo(partial(bot.send_photo, chat_id), frame, caption=...)
+    """
+    # Файл из assets читается в память, только если его ещё не загружали
+    key = photo.key if isinstance(photo, (Asset, Frame)) else media_key(photo)
+
+    file_id = MEDIA_REGISTRY.get(key)
+
+    if file_id:
+        try:
+            return await send(photo=file_id, **kwargs)
+        except BadRequest as e:
+            if not is_stale_file_error(e):
+                raise
+
+            # file_id другого бота или удалён на стороне Telegram - загружаем заново
+            logger.info("file_id %s не принят: %s", file_id, e)
+            MEDIA_REGISTRY.forget(key)
+
+    if isinstance(photo, Asset):
+        data = photo.read()
+    elif isinstance(photo, Frame):
+        data = photo.data
+    else:
+        data = photo
+    message = await send(photo=data, **kwargs)
+    if message.photo:
+        MEDIA_REGISTRY.remember(key, message.photo[-1].file_id)
+    return message
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'MediaRegistry',
+    'MEDIA_REGISTRY',
+    'media_key',
+    'Frame',
+    'send_photo'
+]
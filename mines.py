@@ -3,11 +3,11 @@ from telegram.ext import (ContextTypes)
 from random import *
 from typing import Tuple
 
-from constants import MIN_BET, LEVELS, MINES
-from helpers import ensure_user_exists, parse_bet_amount, spaced_num, get_balance, set_balance, get_mines_session, \
-    create_mines_session, delete_mines_session, get_experience, update_experience, get_user_bonuses, \
-    calculate_exp_multiplier
-from helpers import get_user_business_bonuses
+from constants import MIN_BET, MINES
+from helpers import spaced_num, calculate_exp_multiplier
+from repository import ensure_user_exists, parse_bet_amount, get_balance, adjust_balance, get_mines_session, \
+    create_mines_session, delete_mines_session, get_experience, update_experience, get_user_bonuses
+from repository import get_user_business_bonuses
 
 
 # ======================= ИГРОВАЯ ЛОГИКА =======================
@@ -100,10 +100,10 @@ async def mines(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     username = user.username
 
-    ensure_user_exists(user)
+    await ensure_user_exists(user)
 
     # Проверка наличия активной сессии
-    if get_mines_session(user_id):
+    if await get_mines_session(user_id):
         await update.message.reply_text(
             "❌ У тебя уже есть активная игра. Заверши её, чтобы начать новую."
         )
@@ -119,7 +119,7 @@ async def mines(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Парсинг ставки
-    bet = parse_bet_amount(context.args[1], user_id, username)
+    bet = await parse_bet_amount(context.args[1], user_id, username)
     try:
         mines = int(context.args[0])
     except ValueError:
@@ -135,26 +135,22 @@ async def mines(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Проверка лимитов
-    balance = get_balance(user_id, username)
-
     if bet < MIN_BET:
         await update.message.reply_text(f"❌ Минимальная ставка: {spaced_num(MIN_BET)} $miles")
         return
 
-    if bet > balance:
+    # Снимаем ставку
+    if not await adjust_balance(user_id, -bet):
         await update.message.reply_text(
-            f"❌ Недостаточно средств.\n💰 Твой баланс: {spaced_num(balance)} $miles"
+            f"❌ Недостаточно средств.\n💰 Твой баланс: {spaced_num(await get_balance(user_id, username))} $miles"
         )
         return
 
-    # Снимаем ставку
-    set_balance(user_id, balance - bet)
-
     # Создаем поле
     field = create_field(mines)
 
     # Создаем сессию
-    create_mines_session(user_id, bet, field, [])
+    await create_mines_session(user_id, bet, field, [])
 
     await send_mines_state(update, context, user_id)
 
@@ -166,7 +162,7 @@ async def send_mines_state(
         is_callback: bool = False
 ):
     """Отправка текущего состояния игры"""
-    session = get_mines_session(user_id)
+    session = await get_mines_session(user_id)
 
     if not session:
         if is_callback:
@@ -239,7 +235,7 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     # Получаем сессию
-    session = get_mines_session(user_id)
+    session = await get_mines_session(user_id)
     if not session:
         await query.answer("⚠️ Сессия не найдена", show_alert=True)
         return
@@ -263,12 +259,12 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         if field[idx] == 0:
             steps = len(open_cells)
             multiplier = count_multiplier(steps, field.count(0))
-            exp_gained = calculate_exp_reward(multiplier, bet, user_id, "lose")
-            update_experience(user_id, exp_gained)
+            exp_gained = await calculate_exp_reward(multiplier, bet, user_id, "lose")
+            await update_experience(user_id, exp_gained)
 
-            cashback, bonus_text = apply_luck_cashback(user_id, username, bet)
+            cashback, bonus_text = await apply_luck_cashback(user_id, username, bet)
 
-            level, xp, next_level_xp = get_experience(user_id, username)
+            level, xp, next_level_xp = await get_experience(user_id, username)
 
             text = (
                 f"💥 *ВЗРЫВ!* Ты попал на мину\n\n"
@@ -277,10 +273,10 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
                 f"{bonus_text}"
                 f"✨ Получено: {exp_gained} EXP\n"
                 f"⭐️ Уровень: {level} ({xp}/{next_level_xp})\n"
-                f"💰 Баланс: {spaced_num(get_balance(user_id, username))} $miles"
+                f"💰 Баланс: {spaced_num(await get_balance(user_id, username))} $miles"
             )
 
-            delete_mines_session(user_id)
+            await delete_mines_session(user_id)
 
             await query.edit_message_text(
                 text=text,
@@ -297,16 +293,15 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
                 steps = len(open_cells)
                 multiplier = count_multiplier(steps, field.count(0))
                 win_amount = int(bet * multiplier)
-                win_bonus = get_user_business_bonuses(user_id).get("win_multiplier", 0)
+                win_bonus = (await get_user_business_bonuses(user_id)).get("win_multiplier", 0)
                 win_bonus_amount = int(win_amount * win_bonus)
                 bonus_text = f"❇️ Бонус: {spaced_num(win_bonus_amount)} $miles\n\n" if win_bonus_amount else "\n"
-                current_balance = get_balance(user_id, username)
-                set_balance(user_id, current_balance + win_amount + win_bonus_amount)
+                await adjust_balance(user_id, win_amount + win_bonus_amount)
 
-                exp_gained = calculate_exp_reward(multiplier, bet, user_id, "win")
-                update_experience(user_id, exp_gained)
+                exp_gained = await calculate_exp_reward(multiplier, bet, user_id, "win")
+                await update_experience(user_id, exp_gained)
 
-                level, xp, next_level_xp = get_experience(user_id, username)
+                level, xp, next_level_xp = await get_experience(user_id, username)
 
                 text = (
                     f"🏁 *Ты открыл все клетки!*\n\n"
@@ -317,10 +312,10 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
                     f"{bonus_text}"
                     f"✨ Получено: {exp_gained} EXP\n"
                     f"⭐️ Уровень: {level} ({xp}/{next_level_xp})\n"
-                    f"💰 Баланс: {spaced_num(get_balance(user_id, username))} $miles"
+                    f"💰 Баланс: {spaced_num(await get_balance(user_id, username))} $miles"
                 )
 
-                delete_mines_session(user_id)
+                await delete_mines_session(user_id)
 
                 await query.edit_message_text(
                     text=text,
@@ -330,7 +325,7 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
                     parse_mode="Markdown"
                 )
                 return
-            create_mines_session(user_id, bet, field, open_cells)
+            await create_mines_session(user_id, bet, field, open_cells)
             await send_mines_state(update, context, user_id, True)
 
     # =================== CASHOUT ===================
@@ -338,17 +333,16 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         steps = len(open_cells)
         multiplier = count_multiplier(steps, field.count(0))
         win_amount = int(bet * multiplier)
-        win_bonus = get_user_business_bonuses(user_id).get("win_multiplier", 0)
+        win_bonus = (await get_user_business_bonuses(user_id)).get("win_multiplier", 0)
         win_bonus_amount = int(win_amount * win_bonus)
         bonus_text = f"❇️ Бонус: {spaced_num(win_bonus_amount)} $miles\n\n" if win_bonus_amount else "\n"
 
-        current_balance = get_balance(user_id, username)
-        set_balance(user_id, current_balance + win_amount + win_bonus_amount)
+        await adjust_balance(user_id, win_amount + win_bonus_amount)
 
-        exp_gained = calculate_exp_reward(multiplier, bet, user_id, "win")
-        update_experience(user_id, exp_gained)
+        exp_gained = await calculate_exp_reward(multiplier, bet, user_id, "win")
+        await update_experience(user_id, exp_gained)
 
-        level, xp, next_level_xp = get_experience(user_id, username)
+        level, xp, next_level_xp = await get_experience(user_id, username)
 
         text = (
             f"🏁 *Ты забрал выигрыш!*\n\n"
@@ -360,10 +354,10 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"{bonus_text}"
             f"✨ Получено: {exp_gained} EXP\n"
             f"⭐️ Уровень: {level} ({xp}/{next_level_xp})\n"
-            f"💰 Баланс: {spaced_num(get_balance(user_id, username))} $miles"
+            f"💰 Баланс: {spaced_num(await get_balance(user_id, username))} $miles"
         )
 
-        delete_mines_session(user_id)
+        await delete_mines_session(user_id)
 
         await query.edit_message_text(
             text=text,
@@ -376,12 +370,12 @@ async def handle_mines_action(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 # ======================= РАСЧЁТ РЕЗУЛЬТАТА =======================
 
-def calculate_exp_reward(result: float, bet: int, user_id: int, state: str) -> float:
+async def calculate_exp_reward(result: float, bet: int, user_id: int, state: str) -> float:
     """Расчёт опыта за игру с учётом множителей"""
 
     # Бонусы от талантов и бизнесов
-    mastery_bonus = get_user_bonuses(user_id, 'mastery')
-    biz_bonuses = get_user_business_bonuses(user_id)
+    mastery_bonus = await get_user_bonuses(user_id, 'mastery')
+    biz_bonuses = await get_user_business_bonuses(user_id)
     business_bonus = biz_bonuses.get('game_mastery', 0)
 
     # Множитель от ставки
@@ -390,12 +384,12 @@ def calculate_exp_reward(result: float, bet: int, user_id: int, state: str) -> f
     return round(result * exp_mult * MINES['exp_factor'] * MINES[f'exp_{state}'], 1)
 
 
-def apply_luck_cashback(user_id: int, username: str, bet: int) -> Tuple[int, str]:
+async def apply_luck_cashback(user_id: int, username: str, bet: int) -> Tuple[int, str]:
     """
     Проверка и применение кэшбэка от таланта "Удача"
     Возвращает: (cashback_amount, bonus_text)
     """
-    luck_bonus = get_user_bonuses(user_id, 'luck')
+    luck_bonus = await get_user_bonuses(user_id, 'luck')
 
     if not luck_bonus:
         return 0, ''
@@ -403,8 +397,7 @@ def apply_luck_cashback(user_id: int, username: str, bet: int) -> Tuple[int, str
     # Проверка срабатывания (процент от luck_bonus)
     if randint(0, 100) < luck_bonus:
         cashback = round(bet * 0.2)
-        current_balance = get_balance(user_id, username)
-        set_balance(user_id, current_balance + cashback)
+        await adjust_balance(user_id, cashback)
 
         bonus_text = f"\n🍀 Тебе повезло! Возвращено 20% ({spaced_num(cashback)} $miles) от ставки!"
         return cashback, bonus_text
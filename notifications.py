@@ -0,0 +1,200 @@
+"""
+Очередь исходящих уведомлений для фоновых задач
+Задачи кладут сообщение через notify() и сразу возвращаются, отправкой
+занимается один воркер: общий лимит Telegram (token bucket), не чаще раза
+в chat_interval секунд на чат, повтор с учётом RetryAfter. Несколько ещё не
+отправленных уведомлений одному игроку склеиваются в одно сообщение
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import Forbidden, BadRequest, NetworkError, RetryAfter, TimedOut
+
+from constants import NOTIFICATIONS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Не больше rate операций в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class NotificationQueue:
+    """Очередь уведомлений с одним воркером отправки"""
+
+    def __init__(
+            self,
+            global_rate: float,
+            chat_interval: float,
+            max_attempts: int,
+            drain_timeout: float = 0
+    ):
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.drain_timeout = drain_timeout
+        self._bucket = TokenBucket(global_rate)
+
+        # chat_id -> тексты, ещё не отправленные (склеиваются при отправке)
+        self._pending: Dict[int, List[str]] = {}
+        # (когда можно отправлять, порядковый номер, chat_id)
+        self._ready: List[Tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        # chat_id -> время, раньше которого в чат писать нельзя
+        self._next_allowed: Dict[int, float] = {}
+        # Воркер отправляет уже снятое с очереди сообщение
+        self._sending = False
+
+        self._wakeup = asyncio.Event()
+        self._bot: Optional[Bot] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, chat_id: int, text: str) -> None:
+        """Поставить уведомление в очередь (без ожидания отправки)"""
+        texts = self._pending.get(chat_id)
+        if texts is not None:
+            texts.append(text)
+            return
+
+        self._pending[chat_id] = [text]
+        ready_at = max(time.monotonic(), self._next_allowed.get(chat_id, 0))
+        heapq.heappush(self._ready, (ready_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    # ======================= ВОРКЕР =======================
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Остановка воркера: сначала досылаем очередь (не дольше drain_timeout секунд) -
+        деньги за доход и вклады уже начислены, уведомления о них терять нельзя
+        """
+        if self._worker is not None:
+            deadline = time.monotonic() + self.drain_timeout
+            while (self._pending or self._sending) and not self._worker.done() and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+
+            if self._pending:
+                logger.warning(
+                    "Остановка очереди уведомлений: не отправлено в %s чат(ов)", len(self._pending)
+                )
+
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _run(self) -> None:
+        while True:
+            if not self._ready:
+                self._forget_expired()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            ready_at, _, chat_id = self._ready[0]
+            delay = ready_at - time.monotonic()
+
+            # Ждём очередь чата, но просыпаемся, если появился чат без ожидания
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._ready)
+            text = "\n".join(self._pending.pop(chat_id))
+
+            # Заранее: put() во время отправки должен поставить следующее сообщение
+            # в этот чат не раньше чем через chat_interval
+            self._next_allowed[chat_id] = time.monotonic() + self.chat_interval
+            self._sending = True
+            try:
+                await self._bucket.acquire()
+                await self._send(chat_id, text)
+            finally:
+                self._sending = False
+            self._next_allowed[chat_id] = time.monotonic() + self.chat_interval
+
+    async def _send(self, chat_id: int, text: str) -> None:
+        for attempt in range(self.max_attempts):
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+                return
+            except RetryAfter as e:
+                # Флуд-контроль общий для бота - ждёт вся очередь
+                await asyncio.sleep(e.retry_after + 0.5)
+            except (Forbidden, BadRequest) as e:
+                # Бот заблокирован или чат недоступен - повтор не поможет
+                logger.info("Уведомление в чат %s не доставлено: %s", chat_id, e)
+                return
+            except (TimedOut, NetworkError):
+                await asyncio.sleep(1.5 * (attempt + 1))
+            except Exception:
+                logger.exception("Ошибка отправки уведомления в чат %s", chat_id)
+                return
+
+        logger.warning("Уведомление в чат %s не отправлено после %s попыток", chat_id, self.max_attempts)
+
+    def _forget_expired(self) -> None:
+        now = time.monotonic()
+        self._next_allowed = {
+            chat_id: allowed for chat_id, allowed in self._next_allowed.items() if allowed > now
+        }
+
+
+NOTIFICATION_QUEUE = NotificationQueue(
+    global_rate=NOTIFICATIONS['global_rate'],
+    chat_interval=NOTIFICATIONS['chat_interval'],
+    max_attempts=NOTIFICATIONS['max_attempts'],
+    drain_timeout=NOTIFICATIONS['drain_timeout']
+)
+
+
+def notify(chat_id: int, text: str) -> None:
+    """Уведомление игроку через общую очередь (HTML)"""
+    NOTIFICATION_QUEUE.put(chat_id, text)
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'TokenBucket',
+    'NotificationQueue',
+    'NOTIFICATION_QUEUE',
+    'notify'
+]
@@ -0,0 +1,127 @@
+"""
+Сервис отрисовки картинок
+Вся работа PIL (композиция и JPEG-кодирование) выполняется в отдельном пуле -
+потоков или процессов (RENDER['executor']). Одновременно ожидают не больше
+RENDER['queue_size'] отрисовок, остальные хэндлеры ждут своей очереди
+Время отрисовок по функциям видно в /admin_stats
+
+    frame = await RENDER_SERVICE.render(render_spin_image, reel, state)
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from constants import RENDER
+
+logger = logging.getLogger(__name__)
+
+
+class RenderStats:
+    """Счётчики и время отрисовок одной функции"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 1)
+        }
+
+
+class RenderService:
+    """Пул отрисовки с ограниченной очередью и метриками"""
+
+    def __init__(self, executor: str, workers: int, queue_size: int):
+        self.kind = executor
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._stats: Dict[str, RenderStats] = {}
+        self.waiting = 0
+
+    @property
+    def executor(self) -> Executor:
+        # Пул создаётся при первой отрисовке: импорт модулей ничего не запускает
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        return self._executor
+
+    async def render(self, func: Callable, *args) -> Any:
+        """
+        Выполнить функцию отрисовки в пуле
+        Для пула процессов func и аргументы должны сериализоваться pickle
+        (функция уровня модуля, кортежи/строки/числа)
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue_size)
+
+        stats = self._stats.setdefault(func.__name__, RenderStats())
+
+        # Очередь заполнена - ждём свободного места (backpressure)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        try:
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, func, *args)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            self._slots.release()
+
+        stats.add((time.perf_counter() - started) * 1000)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние пула и время отрисовок по функциям"""
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "waiting": self.waiting,
+            "renders": {name: stats.as_dict() for name, stats in self._stats.items()}
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+RENDER_SERVICE = RenderService(
+    executor=RENDER['executor'],
+    workers=RENDER['workers'],
+    queue_size=RENDER['queue_size']
+)
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'RenderService',
+    'RENDER_SERVICE'
+]
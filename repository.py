@@ -0,0 +1,99 @@
+"""
+Асинхронный слой доступа к данным
+Awaitable-версии функций helpers: каждый вызов выполняется в пуле потоков БД,
+поэтому медленный запрос не останавливает обработку остальных апдейтов
+
+    from repository import get_balance, set_balance
+    balance = await get_balance(user_id)
+"""
+
+import functools
+from typing import Callable, Mapping
+
+import helpers
+from db import run_db
+
+
+def to_async(func: Callable) -> Callable:
+    """Обернуть синхронную функцию БД в корутину, выполняемую в пуле потоков"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+
+    return wrapper
+
+
+# ======================= ПОЛЬЗОВАТЕЛИ =======================
+
+ensure_user_exists = to_async(helpers.ensure_user_exists)
+user_exists = to_async(helpers.user_exists)
+get_user = to_async(helpers.get_user)
+get_user_by_username = to_async(helpers.get_user_by_username)
+update_user = to_async(helpers.update_user)
+get_player_snapshot = to_async(helpers.get_player_snapshot)
+get_player_snapshots = to_async(helpers.get_player_snapshots)
+
+# ======================= БАЛАНС =======================
+
+get_balance = to_async(helpers.get_balance)
+set_balance = to_async(helpers.set_balance)
+adjust_balance = to_async(helpers.adjust_balance)
+transfer = to_async(helpers.transfer)
+parse_bet_amount = to_async(helpers.parse_bet_amount)
+
+# ======================= ОПЫТ И УРОВНИ =======================
+
+get_experience = to_async(helpers.get_experience)
+update_experience = to_async(helpers.update_experience)
+apply_player_deltas = to_async(helpers.apply_player_deltas)
+
+# ======================= ТАЛАНТЫ =======================
+
+ensure_talent_exists = to_async(helpers.ensure_talent_exists)
+get_user_talents = to_async(helpers.get_user_talents)
+get_user_bonuses = to_async(helpers.get_user_bonuses)
+
+# ======================= БИЗНЕС =======================
+
+get_user_business_profile = to_async(helpers.get_user_business_profile)
+calculate_total_income = to_async(helpers.calculate_total_income)
+
+
+async def get_user_business_bonuses(user_id: int) -> Mapping[str, float]:
+    """Вектор бонусов бизнесов: при попадании в кэш - без перехода в поток БД"""
+    cached = helpers.BUSINESS_BONUSES_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+
+    return await run_db(helpers.load_user_business_bonuses, user_id)
+
+
+# ======================= БАНК И ВКЛАДЫ =======================
+
+update_bank_balance = to_async(helpers.update_bank_balance)
+check_deposit_ready = to_async(helpers.check_deposit_ready)
+claim_bank_balance = to_async(helpers.claim_bank_balance)
+take_due_deposits = to_async(helpers.take_due_deposits)
+
+# ======================= ТАЙМЕРЫ =======================
+
+check_lucky_wheel_availability = to_async(helpers.check_lucky_wheel_availability)
+check_exp_case_availability = to_async(helpers.check_exp_case_availability)
+check_steal_availability = to_async(helpers.check_steal_availability)
+
+# ======================= СЕССИИ ИГР =======================
+
+create_blackjack_session = to_async(helpers.create_blackjack_session)
+get_blackjack_session = to_async(helpers.get_blackjack_session)
+delete_blackjack_session = to_async(helpers.delete_blackjack_session)
+
+create_mines_session = to_async(helpers.create_mines_session)
+get_mines_session = to_async(helpers.get_mines_session)
+delete_mines_session = to_async(helpers.delete_mines_session)
+
+# ======================= ПРОМОКОДЫ =======================
+
+check_promocode = to_async(helpers.check_promocode)
+try_activate_promocode = to_async(helpers.try_activate_promocode)
+activate_promocode = to_async(helpers.activate_promocode)
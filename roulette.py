@@ -1,22 +1,29 @@
 import io
-from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Tuple, Optional
+from functools import partial
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Tuple
 import random
 from PIL import Image
 from telegram import Bot, Update
-from telegram.ext import ContextTypes
-
-from constants import (
-    ROULETTE, MIN_BET, LEVELS,
-    GROUP_GAME_DURATION, BETTING_DEADLINE_OFFSET
-)
-from helpers import (
-    get_balance, set_balance, spaced_num,
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import ContextTypes, JobQueue
+from telegram.helpers import escape_markdown
+
+from constants import ROULETTE, MIN_BET
+from helpers import spaced_num, calculate_exp_multiplier, split_lines, PlayerSnapshot
+from levels import level_after_gain
+from repository import (
+    get_balance, adjust_balance,
     get_experience, update_experience,
-    get_user_bonuses, get_cursor, parse_bet_amount,
-    calculate_exp_multiplier, ensure_user_exists
+    get_user_bonuses, parse_bet_amount,
+    ensure_user_exists, get_player_snapshots
 )
-from helpers import get_user_business_bonuses
+from repository import get_user_business_bonuses
+from rounds import ROUNDS, Round
+from media import Frame, send_photo
+from render import RENDER_SERVICE
+from assets import ASSETS
 
 # Извлекаем константы из словаря
 RED_NUMBERS = ROULETTE["red_numbers"]
@@ -25,17 +32,19 @@ MULTIPLIERS = ROULETTE["multipliers"]
 BASE_EXP = ROULETTE["base_exp"]
 BET_NAMES = ROULETTE["bet_names"]
 VALID_BET_TYPES = ROULETTE["valid_bet_types"]
-NUMBERS_IMG_CACHE = {
-    str(num): Image.open(f'roulette/{num}.png').convert("RGBA")
-    for num in range(0, 37)
-}
-MAIN_IMG_CACHE = Image.open('roulette/roulette.jpg')
+BETS_CLOSED_TEXT = "❌ Приём ставок окончен. Подождите следующую игру."
+# Секунд до повторного розыгрыша, если выплата не прошла
+ROUND_RETRY_DELAY = 30
+# Лимит текста табло /game (запас под строку с таймером)
+BOARD_LIMIT = MessageLimit.MAX_TEXT_LENGTH - 64
+# Число -> готовый Frame (JPEG и его хэш, всего 37 вариантов)
+ROULETTE_FRAMES: Dict[int, Frame] = {}
 
 
 # ======================= ИГРОВАЯ ЛОГИКА =======================
 
-def check_win(bet_type: str, number: int) -> bool:
-    """Проверка выигрыша ставки"""
+def _rule_wins(bet_type: str, number: int) -> bool:
+    """Правила выигрыша ставки (используются только для построения BET_TABLE)"""
     # Ставка на конкретное число
     if bet_type.isdigit():
         return int(bet_type) == number
@@ -63,8 +72,7 @@ def check_win(bet_type: str, number: int) -> bool:
     return False
 
 
-def get_bet_category(bet_type: str) -> str:
-    """Определение категории ставки для расчёта множителя и опыта"""
+def _rule_category(bet_type: str) -> str:
     if bet_type.isdigit():
         return 'number'
     if bet_type in ['к', 'ч']:
@@ -76,13 +84,58 @@ def get_bet_category(bet_type: str) -> str:
     return 'unknown'
 
 
-def calculate_roulette_exp(
+class BetSpec(NamedTuple):
+    """Ставка: бит N маски - выигрыш при выпадении числа N"""
+    mask: int
+    multiplier: int
+    category: str
+
+
+def _build_bet_table() -> Dict[str, BetSpec]:
+    table = {}
+    for bet_type in VALID_BET_TYPES:
+        category = _rule_category(bet_type)
+        mask = sum(1 << number for number in range(37) if _rule_wins(bet_type, number))
+        table[bet_type] = BetSpec(mask, MULTIPLIERS.get(category, 0), category)
+    return table
+
+
+# Все исходы всех ставок считаются один раз при импорте
+BET_TABLE: Dict[str, BetSpec] = _build_bet_table()
+UNKNOWN_BET = BetSpec(0, 0, 'unknown')
+
+
+def check_win(bet_type: str, number: int) -> bool:
+    """Проверка выигрыша ставки"""
+    return bool(BET_TABLE.get(bet_type, UNKNOWN_BET).mask >> number & 1)
+
+
+def get_bet_category(bet_type: str) -> str:
+    """Определение категории ставки для расчёта множителя и опыта"""
+    return BET_TABLE.get(bet_type, UNKNOWN_BET).category
+
+
+def bet_rtp(bet_type: str) -> float:
+    """Теоретический возврат ставки (доля от суммы) - для симуляций и проверки баланса"""
+    spec = BET_TABLE.get(bet_type, UNKNOWN_BET)
+    return spec.mask.bit_count() * spec.multiplier / 37
+
+
+async def calculate_roulette_exp(
         bet_type: str,
         won: bool,
         bet_amount: int,
         user_id: int
 ) -> float:
     """Расчёт опыта за игру в рулетку"""
+    mastery_bonus = await get_user_bonuses(user_id, 'mastery')
+    biz_bonuses = await get_user_business_bonuses(user_id)
+
+    return roulette_exp(bet_type, won, bet_amount, mastery_bonus, biz_bonuses.get('game_mastery', 0))
+
+
+def roulette_exp(bet_type: str, won: bool, bet_amount: int, mastery_bonus: float, business_bonus: float) -> float:
+    """Опыт за ставку при известных бонусах (без обращений к БД)"""
     category = get_bet_category(bet_type)
 
     # Базовый опыт
@@ -91,23 +144,18 @@ def calculate_roulette_exp(
     else:
         base_exp = BASE_EXP['loss']
 
-    # Бонусы
-    mastery_bonus = get_user_bonuses(user_id, 'mastery')
-    biz_bonuses = get_user_business_bonuses(user_id)
-    business_bonus = biz_bonuses.get('game_mastery', 0)
-
     # Множитель от ставки
     exp_mult = calculate_exp_multiplier(bet_amount, mastery_bonus, business_bonus)
 
     return round(base_exp * exp_mult, 1)
 
 
-def apply_luck_cashback(user_id: int, username: str, bet_amount: int) -> Tuple[int, str]:
+async def apply_luck_cashback(user_id: int, username: str, bet_amount: int) -> Tuple[int, str]:
     """
     Применение кэшбэка от таланта "Удача" при проигрыше
     Возвращает: (сумма_кэшбэка, текст_для_сообщения)
     """
-    luck_bonus = get_user_bonuses(user_id, 'luck')
+    luck_bonus = await get_user_bonuses(user_id, 'luck')
 
     if not luck_bonus:
         return 0, ''
@@ -115,8 +163,7 @@ def apply_luck_cashback(user_id: int, username: str, bet_amount: int) -> Tuple[i
     # Проверка срабатывания
     if random.randint(0, 100) < luck_bonus:
         cashback = round(bet_amount * 0.2)
-        current_balance = get_balance(user_id, username)
-        set_balance(user_id, current_balance + cashback)
+        await adjust_balance(user_id, cashback)
 
         bonus_text = f"🍀 {username} повезло! Возвращено 20% ({spaced_num(cashback)} $miles) от ставки!"
         return cashback, bonus_text
@@ -131,101 +178,6 @@ def format_bet_display(bet_type: str) -> str:
     return BET_NAMES.get(bet_type, f"❓ {bet_type}")
 
 
-# ======================= БАЗА ДАННЫХ =======================
-
-def create_game_if_needed(chat_id: int) -> None:
-    """Создание игровой сессии для группы если её нет"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT * FROM roulette_games WHERE chat_id = %s AND is_active = TRUE",
-        (chat_id,)
-    )
-    game = cursor.fetchone()
-
-    if not game:
-        now = datetime.now(timezone.utc)
-        start_time = now + timedelta(seconds=GROUP_GAME_DURATION)
-        deadline = start_time - timedelta(seconds=BETTING_DEADLINE_OFFSET)
-
-        cursor.execute(
-            "INSERT INTO roulette_games (chat_id, start_time, betting_deadline) VALUES (%s, %s, %s)",
-            (chat_id, start_time, deadline)
-        )
-        conn.commit()
-
-
-def can_place_bet(chat_id: int) -> Tuple[bool, Optional[str]]:
-    """
-    Проверка возможности сделать ставку в групповой игре
-    Возвращает: (можно_ставить, сообщение_об_ошибке)
-    """
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT * FROM roulette_games WHERE chat_id = %s AND is_active = TRUE",
-        (chat_id,)
-    )
-    game = cursor.fetchone()
-
-    if not game:
-        return False, "⏳ Сейчас нет активной игры."
-
-    now = datetime.now(timezone.utc).replace(tzinfo=None)
-    deadline = game['betting_deadline'].replace(tzinfo=None)
-
-    if now >= deadline:
-        return False, "❌ Приём ставок окончен. Подождите следующую игру."
-
-    return True, None
-
-
-def add_or_update_bet(
-        chat_id: int,
-        user_id: int,
-        username: str,
-        bet_type: str,
-        amount: int
-) -> None:
-    """Добавление или обновление ставки в групповой игре"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute("""
-        INSERT INTO roulette_bets (chat_id, user_id, username, bet_type, amount)
-        VALUES (%s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE amount = amount + VALUES(amount)
-    """, (chat_id, user_id, username, bet_type, amount))
-    conn.commit()
-
-
-def get_game_bets(chat_id: int) -> List[Dict]:
-    """Получение всех ставок в текущей игре"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT * FROM roulette_bets WHERE chat_id = %s",
-        (chat_id,)
-    )
-    return cursor.fetchall()
-
-
-def get_user_first_name(user_id: int) -> str:
-    """Получение имени пользователя для отображения"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    cursor.execute(
-        "SELECT first_name FROM users WHERE telegram_id = %s",
-        (user_id,)
-    )
-    result = cursor.fetchone()
-    return result['first_name'] if result else f"User{user_id}"
-
-
 # ======================= КОМАНДЫ =======================
 
 async def roulette(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -237,7 +189,7 @@ async def roulette(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = chat.id
     is_private = chat.type == "private"
 
-    ensure_user_exists(user)
+    await ensure_user_exists(user)
 
     # Проверка аргументов
     if not context.args or len(context.args) < 2:
@@ -268,62 +220,80 @@ async def roulette(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Парсинг суммы ставки
-    bet_amount = parse_bet_amount(context.args[1], user_id, username)
+    bet_amount = await parse_bet_amount(context.args[1], user_id, username)
 
     if bet_amount is None:
         await update.message.reply_text("❌ Некорректная сумма ставки")
         return
 
-    # Проверка баланса
-    balance = get_balance(user_id, username)
-
-    if bet_amount > balance:
-        await update.message.reply_text(
-            f"💸 Недостаточно средств.\n💰 Твой баланс: {spaced_num(balance)} $miles"
-        )
-        return
-
     if bet_amount < MIN_BET:
         await update.message.reply_text(f"💸 Минимальная ставка: {MIN_BET} $miles")
         return
 
     # ============= ЛИЧНАЯ ИГРА (приватный чат) =============
     if is_private:
-        await play_solo_roulette(update, user_id, username, bet_type, bet_amount, balance)
+        if await take_bet(update, user_id, username, bet_amount):
+            await play_solo_roulette(update, user_id, username, bet_type, bet_amount)
         return
 
     # ============= ГРУППОВАЯ ИГРА =============
-    create_game_if_needed(chat_id)
+    # Списание и запись ставки - одна транзакция, раунд открывается только принятой ставкой
+    result = await ROUNDS.place_bet(chat_id, user_id, username, bet_type, bet_amount, user.first_name)
+
+    if result.round is None:
+        await update.message.reply_text(BETS_CLOSED_TEXT)
+        return
 
-    can_bet, error_msg = can_place_bet(chat_id)
-    if not can_bet:
-        await update.message.reply_text(error_msg)
+    if not result.placed:
+        await reply_no_funds(update, user_id, username)
         return
 
-    # Снимаем деньги и добавляем ставку
-    set_balance(user_id, balance - bet_amount)
-    add_or_update_bet(chat_id, user_id, username, bet_type, bet_amount)
+    if result.created:
+        schedule_round(context.job_queue, chat_id, result.round.start_time)
 
     await update.message.reply_text(
         f"✅ Ставка {spaced_num(bet_amount)} $miles {format_bet_display(bet_type).lower()} принята."
     )
 
 
-def generate_roulette_image(num: int) -> io.BytesIO:
-    """Генерация изображения результата слотов"""
+async def take_bet(update: Update, user_id: int, username: str, bet_amount: int) -> bool:
+    """Списание ставки (при нехватке средств отвечает игроку и возвращает False)"""
+    if await adjust_balance(user_id, -bet_amount):
+        return True
+
+    await reply_no_funds(update, user_id, username)
+    return False
+
 
-    num_img = NUMBERS_IMG_CACHE[str(num)]
+async def reply_no_funds(update: Update, user_id: int, username: str) -> None:
+    await update.message.reply_text(
+        f"💸 Недостаточно средств.\n💰 Твой баланс: {spaced_num(await get_balance(user_id, username))} $miles"
+    )
+
+
+async def generate_roulette_image(num: int) -> Frame:
+    """JPEG результата рулетки (из кэша, первый раз рисуется в сервисе отрисовки)"""
+    frame = ROULETTE_FRAMES.get(num)
+
+    if frame is None:
+        frame = Frame.of(await RENDER_SERVICE.render(render_roulette_frame, num))
+        ROULETTE_FRAMES[num] = frame
+
+    return frame
+
+
+def render_roulette_frame(num: int) -> bytes:
+    """Отрисовка и JPEG-кодирование результата рулетки"""
+    num_img = ASSETS.image(f"roulette/{num}.png", "RGBA")
 
     result = Image.new('RGB', (997, 562), (255, 255, 255))
-    result.paste(MAIN_IMG_CACHE, (0, 0))
+    result.paste(ASSETS.image("roulette/roulette.jpg", "RGB"), (0, 0))
 
     result.paste(num_img, (373, 229), num_img)
     result = result.convert('RGB')
     bio = io.BytesIO()
-    bio.name = f'temp_roulette_{random.randint(1000000, 9999999)}.jpeg'
     result.save(bio, 'JPEG', quality=30)
-    bio.seek(0)
-    return bio
+    return bio.getvalue()
 
 
 async def play_solo_roulette(
@@ -331,10 +301,9 @@ async def play_solo_roulette(
         user_id: int,
         username: str,
         bet_type: str,
-        bet_amount: int,
-        balance: int
+        bet_amount: int
 ):
-    """Одиночная игра в рулетку (приватный чат)"""
+    """Одиночная игра в рулетку (приватный чат), ставка уже списана"""
     # Крутим рулетку
     number = random.randint(0, 36)
 
@@ -342,225 +311,303 @@ async def play_solo_roulette(
     won = check_win(bet_type, number)
     category = get_bet_category(bet_type)
 
-    # Снимаем ставку
-    set_balance(user_id, balance - bet_amount)
-
     # Формируем результат
     result_text = f"🎲 Выпало число: *{number}*\n\n"
 
     if won:
         multiplier = MULTIPLIERS[category]
         winnings = bet_amount * multiplier
-        win_bonus = get_user_business_bonuses(user_id).get("win_multiplier", 0)
+        win_bonus = (await get_user_business_bonuses(user_id)).get("win_multiplier", 0)
         win_bonus_amount = int(winnings * win_bonus)
         bonus_text = f"❇️ Бонус: {spaced_num(win_bonus_amount)} $miles\n" if win_bonus_amount else ""
 
-        set_balance(user_id, get_balance(user_id, username) + winnings + win_bonus_amount)
+        await adjust_balance(user_id, winnings + win_bonus_amount)
 
         result_text += f"🎉 Ты выиграл {spaced_num(winnings)} $miles!\n" + bonus_text
     else:
         result_text += f"😢 Ты проиграл {spaced_num(bet_amount)} $miles.\n"
 
         # Шанс на кэшбэк
-        cashback, bonus_text = apply_luck_cashback(user_id, username, bet_amount)
+        cashback, bonus_text = await apply_luck_cashback(user_id, username, bet_amount)
         result_text += bonus_text
 
     # Начисляем опыт
-    exp_gained = calculate_roulette_exp(bet_type, won, bet_amount, user_id)
-    update_experience(user_id, exp_gained)
+    exp_gained = await calculate_roulette_exp(bet_type, won, bet_amount, user_id)
+    await update_experience(user_id, exp_gained)
 
     # Информация об уровне
-    level_info = get_experience(user_id, username)
-    current_level = level_info[0]
-    current_xp = level_info[1]
-    next_level_xp = next(
-        (xp for lvl, xp in LEVELS if lvl == current_level + 1),
-        float("inf")
-    )
+    current_level, current_xp, next_level_xp = await get_experience(user_id, username)
 
     result_text += (
         f"\n✨ Получено: {exp_gained} EXP\n"
         f"⭐️ Уровень: {current_level} ({current_xp}/{next_level_xp})\n"
-        f"💰 Баланс: {spaced_num(get_balance(user_id, username))} $miles"
+        f"💰 Баланс: {spaced_num(await get_balance(user_id, username))} $miles"
     )
-    image_stream = generate_roulette_image(number)
+    frame = await generate_roulette_image(number)
     # Отправляем с картинкой
     try:
-        await update.message.reply_photo(
-            photo=image_stream,
+        await send_photo(
+            update.message.reply_photo,
+            frame,
             caption=result_text,
             parse_mode="Markdown"
         )
-        image_stream.close()
     except FileNotFoundError:
         await update.message.reply_text(result_text, parse_mode="Markdown")
 
 
 async def game(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Команда /game - показать текущую групповую игру и ставки"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-    chat_id = update.effective_chat.id
-
-    cursor.execute(
-        "SELECT * FROM roulette_games WHERE chat_id = %s AND is_active = TRUE",
-        (chat_id,)
-    )
-    game_info = cursor.fetchone()
+    """Команда /game - табло текущей групповой игры (одно сообщение на раунд)"""
+    current = ROUNDS.get(update.effective_chat.id)
 
-    if not game_info:
+    if not current:
         await update.message.reply_text("🎲 Сейчас нет активной игры.")
         return
 
-    # Считаем оставшееся время
-    now = datetime.now(timezone.utc).replace(tzinfo=None)
-    seconds_left = int((game_info['start_time'] - now).total_seconds())
+    seconds_left = current.seconds_left
+    time_info = f"⏳ Игра начнётся через {seconds_left} сек." if seconds_left > 0 else "⏳ Игра сейчас начнётся..."
+    text = f"{await bet_board(current)}\n\n{time_info}"
 
-    # Получаем ставки
-    bets = get_game_bets(chat_id)
+    await show_board(update, context.bot, current, text)
 
-    if not bets:
-        time_info = f"⏳ Игра начнётся через {seconds_left} сек." if seconds_left > 0 else "⏳ Игра сейчас начнётся..."
-        await update.message.reply_text(f"🎱 Рулетка\n\n{time_info}\n\n📭 Ставок пока нет.")
-        return
 
-    # Группируем ставки по типу
-    grouped_bets: Dict[str, List[str]] = {}
+async def bet_board(current: Round) -> str:
+    """Текст табло ставок (перерисовывается только после новых ставок)"""
+    if current.board_cache and current.board_cache[0] == current.version:
+        return current.board_cache[1]
 
-    for bet in bets:
-        key = bet['bet_type']
-        if key not in grouped_bets:
-            grouped_bets[key] = []
+    # Имена игроков без username (раунд восстановлен из БД) - один раз, одним запросом
+    unnamed = [user_id for user_id in current.player_totals if user_id not in current.names]
+    if unnamed:
+        players = await get_player_snapshots(unnamed)
+        for user_id in unnamed:
+            player = players.get(user_id)
+            current.names[user_id] = player.first_name if player and player.first_name else f"User{user_id}"
 
-        display_name = f"@{bet['username']}" if bet['username'] else get_user_first_name(bet['user_id'])
-        grouped_bets[key].append(f"{display_name} — {spaced_num(bet['amount'])} $miles")
+    # Дальше без await: текст соответствует version
+    version = current.version
 
-    # Формируем сообщение
-    output = "🎱 *Рулетка*\n🏦 *Ставки:*\n\n"
+    if not current.bets:
+        text = "🎱 *Рулетка*\n\n📭 Ставок пока нет."
+        current.board_cache = (version, text)
+        return text
 
-    for bet_type, players in grouped_bets.items():
-        title = format_bet_display(bet_type)
-        output += f"{title}:\n" + "\n".join(players) + "\n——————————\n"
+    # Ставки по типам
+    grouped_bets: Dict[str, List[str]] = {bet_type: [] for bet_type in current.type_totals}
+    for bet in current.bets.values():
+        name = escape_markdown(current.names[bet['user_id']])
+        grouped_bets[bet['bet_type']].append(f"{name} — {spaced_num(bet['amount'])} $miles")
 
-    time_info = f"⏳ Игра начнётся через {seconds_left} сек." if seconds_left > 0 else "⏳ Игра сейчас начнётся..."
-    output += f"\n{time_info}"
+    lines = ["🎱 *Рулетка*", "🏦 *Ставки:*", ""]
+    for bet_type, bet_lines in grouped_bets.items():
+        title = format_bet_display(bet_type)
+        lines += [f"{title} ({spaced_num(current.type_totals[bet_type])} $miles):", *bet_lines, "——————————"]
 
-    await update.message.reply_text(output, parse_mode="Markdown")
+    # Суммы по игрокам, крупные - первыми
+    lines += ["", "👥 *Игроки:*"]
+    for user_id, total in sorted(current.player_totals.items(), key=lambda item: -item[1]):
+        lines.append(f"{escape_markdown(current.names[user_id])} — {spaced_num(total)} $miles")
 
+    # Табло - одно сообщение: не влезшие строки отбрасываются
+    text = split_lines(lines, BOARD_LIMIT, BOARD_LIMIT)[0]
+    current.board_cache = (version, text)
+    return text
 
-# ======================= ЗАВЕРШЕНИЕ ГРУППОВОЙ ИГРЫ =======================
 
-async def start_roulette_for_chat(chat_id: int, bot: Bot):
-    """Завершение групповой игры и подведение итогов"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
+async def show_board(update: Update, bot: Bot, current: Round, text: str) -> None:
+    """Обновить табло раунда или отправить (и закрепить) новое"""
+    chat_id = update.effective_chat.id
 
-    # Завершаем игру
-    cursor.execute(
-        "UPDATE roulette_games SET is_active = FALSE WHERE chat_id = %s",
-        (chat_id,)
-    )
-    conn.commit()
+    if current.board_message_id is not None:
+        try:
+            await bot.edit_message_text(
+                text, chat_id=chat_id, message_id=current.board_message_id, parse_mode="Markdown"
+            )
+            return
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            # Табло удалили из чата - отправляем новое
 
-    # Получаем ставки
-    bets = get_game_bets(chat_id)
+    message = await update.message.reply_text(text, parse_mode="Markdown")
+    current.board_message_id = message.message_id
 
-    if not bets:
-        await bot.send_message(chat_id, "⛔ Игра завершена, но ставок не было.")
-        return
+    try:
+        await bot.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+    except TelegramError:
+        # Нет прав на закрепление - табло просто обновляется на месте
+        pass
 
-    # Крутим рулетку
-    number = random.randint(0, 36)
-    # number = 0
 
-    result_text = f"🎰 *Игра окончена!*\n🎲 Выпало число: *{number}*\n\n"
+# ======================= ЗАВЕРШЕНИЕ ГРУППОВОЙ ИГРЫ =======================
 
-    win_log: List[str] = []
-    lose_log: List[str] = []
+def settle_round(
+        bets: List[Dict],
+        number: int,
+        players: Dict[int, PlayerSnapshot]
+) -> Tuple[List[str], List[str], Dict[int, Tuple[int, float, int]]]:
+    """
+    Расчёт всех ставок раунда в памяти, итоги - одной строкой на игрока
+    Возвращает: (строки выигравших, строки проигравших, {user_id: (баланс, опыт, уровень)})
+    """
+    totals: Dict[int, Dict] = {}
+    drawn = 1 << number
 
-    # Обрабатываем каждую ставку
     for bet in bets:
         user_id = bet['user_id']
-        username = bet['username']
         amount = bet['amount']
         bet_type = bet['bet_type']
+        player = players.get(user_id)
 
-        display_name = f"@{username}" if username else get_user_first_name(user_id)
+        total = totals.get(user_id)
+        if total is None:
+            if bet['username']:
+                display_name = f"@{bet['username']}"
+            else:
+                display_name = player.first_name if player and player.first_name else f"User{user_id}"
 
-        # Проверяем выигрыш
-        won = check_win(bet_type, number)
-        category = get_bet_category(bet_type)
+            total = totals[user_id] = {
+                'name': escape_markdown(display_name), 'staked': 0, 'payout': 0, 'bonus': 0, 'cashback': 0, 'exp': 0.0
+            }
 
-        if won:
-            # Выигрыш
-            multiplier = MULTIPLIERS[category]
-            winnings = amount * multiplier
-            win_bonus = get_user_business_bonuses(user_id).get("win_multiplier", 0)
-            win_bonus_amount = int(winnings * win_bonus)
-            bonus_text = f"\n  ❇️ Бонус: {spaced_num(win_bonus_amount)} $miles" if win_bonus_amount else ""
+        biz_bonuses = player.business_bonuses if player else {}
+        mastery_bonus = player.talent_bonus('mastery') if player else 0
 
-            set_balance(user_id, get_balance(user_id, username) + winnings + win_bonus_amount)
+        spec = BET_TABLE.get(bet_type, UNKNOWN_BET)
+        won = bool(spec.mask & drawn)
 
-            # Опыт
-            exp_gained = calculate_roulette_exp(bet_type, True, amount, user_id)
-            update_experience(user_id, exp_gained)
+        total['staked'] += amount
+        total['exp'] += roulette_exp(bet_type, won, amount, mastery_bonus, biz_bonuses.get('game_mastery', 0))
 
-            win_log.append(
-                f"{display_name} +{spaced_num(winnings)} $miles (✨ +{exp_gained} EXP)" + bonus_text
-            )
+        if won:
+            winnings = amount * spec.multiplier
+            total['payout'] += winnings
+            total['bonus'] += int(winnings * biz_bonuses.get("win_multiplier", 0))
+        else:
+            # Кэшбэк от таланта "Удача"
+            luck_bonus = player.talent_bonus('luck') if player else 0
+            if luck_bonus and random.randint(0, 100) < luck_bonus:
+                total['cashback'] += round(amount * 0.2)
+
+    win_log: List[Tuple[int, str]] = []
+    lose_log: List[Tuple[int, str]] = []
+    deltas = {}
+
+    for user_id, total in totals.items():
+        credited = total['payout'] + total['bonus'] + total['cashback']
+        net = credited - total['staked']
+        exp_gained = round(total['exp'], 1)
+
+        player = players.get(user_id)
+        level = level_after_gain(player.level, player.experience + exp_gained) if player else 1
+        deltas[user_id] = (credited, exp_gained, level)
+
+        if total['payout'] and net >= 0:
+            line = f"{total['name']} +{spaced_num(net)} $miles (✨ +{exp_gained} EXP)"
+            if total['bonus']:
+                line += f"\n  ❇️ Бонус: {spaced_num(total['bonus'])} $miles"
+            win_log.append((net, line))
         else:
-            # Проигрыш
-            exp_gained = calculate_roulette_exp(bet_type, False, amount, user_id)
-            update_experience(user_id, exp_gained)
+            line = f"{total['name']} -{spaced_num(-net)} $miles (✨ +{exp_gained} EXP)"
+            if total['cashback']:
+                line += f"\n  🍀 Повезло! Возвращено 20% ({spaced_num(total['cashback'])} $miles) от ставки!"
+            lose_log.append((net, line))
 
-            # Проверка кэшбэка
-            cashback, bonus_text = apply_luck_cashback(user_id, username, amount)
+    # Крупные выигрыши и проигрыши - первыми
+    win_log.sort(key=lambda item: -item[0])
+    lose_log.sort(key=lambda item: item[0])
 
-            lose_text = f"{display_name} -{spaced_num(amount)} $miles (✨ +{exp_gained} EXP)"
-            if bonus_text:
-                lose_text += f"\n  {bonus_text}"
+    return [line for _, line in win_log], [line for _, line in lose_log], deltas
 
-            lose_log.append(lose_text)
 
-    # Формируем итоговое сообщение
-    if win_log:
-        result_text += "🏆 *Победившие ставки:*\n" + "\n".join(win_log) + "\n\n"
+async def start_roulette_for_chat(chat_id: int, bot: Bot):
+    """Завершение групповой игры и подведение итогов"""
+    # Снимаем раунд (ставки остаются в БД до выплаты)
+    current = await ROUNDS.close(chat_id)
+
+    if current is None:
+        return
+
+    if current.board_message_id is not None:
+        try:
+            await bot.unpin_chat_message(chat_id, current.board_message_id)
+        except TelegramError:
+            pass
+
+    bets = list(current.bets.values())
+
+    if not bets:
+        await ROUNDS.settle(chat_id, {})
+        await bot.send_message(chat_id, "⛔ Игра завершена, но ставок не было.")
+        return
+
+    # Крутим рулетку
+    number = random.randint(0, 36)
 
+    # Все участники одним запросом, расчёт в памяти, выплата и удаление ставок - одной транзакцией
+    players = await get_player_snapshots({bet['user_id'] for bet in bets})
+    win_log, lose_log, deltas = settle_round(bets, number, players)
+    await ROUNDS.settle(chat_id, deltas)
+
+    # Итоги построчно: начало - в подпись к фото, остальное - следующими сообщениями
+    lines = ["🎰 *Игра окончена!*", f"🎲 Выпало число: *{number}*", ""]
+    if win_log:
+        lines += ["🏆 *Победившие ставки:*", *win_log, ""]
     if lose_log:
-        result_text += "🙈 *Проигравшие ставки:*\n" + "\n".join(lose_log)
+        lines += ["🙈 *Проигравшие ставки:*", *lose_log]
 
-    # Удаляем ставки и игру
-    cursor.execute("DELETE FROM roulette_bets WHERE chat_id = %s", (chat_id,))
-    cursor.execute("DELETE FROM roulette_games WHERE chat_id = %s", (chat_id,))
-    conn.commit()
+    caption, *overflow = split_lines(lines, MessageLimit.CAPTION_LENGTH, MessageLimit.MAX_TEXT_LENGTH)
 
     # Отправляем результат
-    image_stream = generate_roulette_image(number)
+    frame = await generate_roulette_image(number)
     try:
-        await bot.send_photo(
-            chat_id=chat_id,
-            photo=image_stream,
-            caption=result_text,
+        await send_photo(
+            partial(bot.send_photo, chat_id),
+            frame,
+            caption=caption,
             parse_mode="Markdown"
         )
-        image_stream.close()
     except FileNotFoundError:
-        await bot.send_message(chat_id, result_text, parse_mode="Markdown")
+        await bot.send_message(chat_id, caption, parse_mode="Markdown")
+
+    for text in overflow:
+        await bot.send_message(chat_id, text, parse_mode="Markdown")
 
 
-async def check_all_games(context: ContextTypes.DEFAULT_TYPE):
-    """Периодическая проверка готовности игр (вызывается из job_queue)"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
+# ======================= ТАЙМЕРЫ РАУНДОВ =======================
+
+def schedule_round(job_queue: JobQueue, chat_id: int, start_time: datetime) -> None:
+    """Разовая задача job_queue на момент start_time (UTC) - без опроса таблицы игр"""
+    name = f"roulette_round:{chat_id}"
+    if job_queue.get_jobs_by_name(name):
+        return
+
+    # В БД время хранится без часового пояса (UTC)
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+
+    delay = max((start_time - datetime.now(timezone.utc)).total_seconds(), 0)
+    job_queue.run_once(run_round, when=delay, data=chat_id, name=name)
+
+
+async def run_round(context: ContextTypes.DEFAULT_TYPE):
+    """Розыгрыш раунда по таймеру (вызывается из job_queue)"""
+    chat_id = context.job.data
+
+    try:
+        await start_roulette_for_chat(chat_id, context.bot)
+    except Exception as e:
+        print(f"Ошибка розыгрыша рулетки в чате {chat_id}: {e}")
 
-    now = datetime.now(timezone.utc)
+        # Выплата не прошла - ставки в БД, раунд разыгрывается повторно
+        if ROUNDS.is_settling(chat_id):
+            context.job_queue.run_once(run_round, when=ROUND_RETRY_DELAY, data=chat_id, name=f"roulette_round:{chat_id}")
 
-    cursor.execute("SELECT * FROM roulette_games WHERE is_active = TRUE")
-    games = cursor.fetchall()
 
-    for game in games:
-        if game['start_time'].replace(tzinfo=None) <= now.replace(tzinfo=None):
-            await start_roulette_for_chat(game['chat_id'], context.bot)
+async def schedule_active_games(job_queue: JobQueue) -> None:
+    """Восстановление раундов из БД и их таймеров после перезапуска бота (невыплаченные - сразу)"""
+    for current in await ROUNDS.load():
+        schedule_round(job_queue, current.chat_id, current.start_time)
 
 
 # ======================= ЭКСПОРТ =======================
@@ -568,6 +615,6 @@ async def check_all_games(context: ContextTypes.DEFAULT_TYPE):
 __all__ = [
     'roulette',
     'game',
-    'check_all_games',
+    'schedule_active_games',
     'start_roulette_for_chat'
 ]
@@ -0,0 +1,280 @@
+"""
+Состояние групповых раундов рулетки в памяти
+Раунд (время старта, дедлайн ставок, сложенные ставки) живёт в ROUNDS, /game и
+таймеры читают его без обращения к БД. Ставка пишется в roulette_bets в одной
+транзакции со списанием денег, а строки раунда удаляются в одной транзакции с
+выплатой, поэтому после падения бота load() восстанавливает и активные, и
+закрытые, но не разыгранные раунды
+Суммы ставок по типам и по игрокам для табло /game обновляются при каждой ставке
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from constants import GROUP_GAME_DURATION, BETTING_DEADLINE_OFFSET
+
+from db import db_session, run_db
+from helpers import write_player_deltas
+
+
+class Round:
+    """Один раунд в чате"""
+
+    def __init__(self, chat_id: int, start_time: datetime, deadline: datetime):
+        self.chat_id = chat_id
+        self.start_time = start_time
+        self.deadline = deadline
+
+        # (user_id, bet_type) -> ставка (как строка roulette_bets)
+        self.bets: Dict[Tuple[int, str], Dict] = {}
+
+        # Агрегаты для табло: тип ставки -> сумма, user_id -> сумма, user_id -> имя
+        self.type_totals: Dict[str, int] = {}
+        self.player_totals: Dict[int, int] = {}
+        self.names: Dict[int, str] = {}
+        # Растёт с каждой ставкой: по нему проверяется актуальность отрисованного табло
+        self.version = 0
+
+        # Сообщение с табло в чате и его текст (версия, текст)
+        self.board_message_id: Optional[int] = None
+        self.board_cache: Optional[Tuple[int, str]] = None
+
+    @property
+    def accepting_bets(self) -> bool:
+        return datetime.now(timezone.utc) < self.deadline
+
+    @property
+    def seconds_left(self) -> int:
+        return int((self.start_time - datetime.now(timezone.utc)).total_seconds())
+
+    def add_bet(
+            self, user_id: int, username: str, bet_type: str, amount: int, first_name: Optional[str] = None
+    ) -> None:
+        bet = self.bets.get((user_id, bet_type))
+        if bet is None:
+            self.bets[(user_id, bet_type)] = {
+                'user_id': user_id, 'username': username, 'bet_type': bet_type, 'amount': amount
+            }
+        else:
+            bet['amount'] += amount
+
+        self.type_totals[bet_type] = self.type_totals.get(bet_type, 0) + amount
+        self.player_totals[user_id] = self.player_totals.get(user_id, 0) + amount
+
+        # Без username и first_name (раунд из БД) имя подгрузит /game
+        if username:
+            self.names[user_id] = f"@{username}"
+        elif first_name:
+            self.names[user_id] = first_name
+
+        self.version += 1
+
+
+class BetResult(NamedTuple):
+    """Итог place_bet"""
+    round: Optional[Round]  # None - приём ставок окончен
+    placed: bool  # False - не хватило средств, ничего не списано
+    created: bool  # Раунд открыт этой ставкой
+
+
+class RoundRegistry:
+    """Активные и закрытые, но ещё не разыгранные раунды по chat_id"""
+
+    def __init__(self):
+        self._rounds: Dict[int, Round] = {}
+
+        # Закрытые раунды: строки в БД помечены is_active = FALSE и ждут выплаты
+        self._settling: Dict[int, Round] = {}
+
+        # Ставки и закрытие раунда в одном чате - по очереди
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self._rounds)
+
+    def get(self, chat_id: int) -> Optional[Round]:
+        return self._rounds.get(chat_id)
+
+    def is_settling(self, chat_id: int) -> bool:
+        return chat_id in self._settling
+
+    def _lock(self, chat_id: int) -> asyncio.Lock:
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        return lock
+
+    async def place_bet(
+            self, chat_id: int, user_id: int, username: str, bet_type: str, amount: int,
+            first_name: Optional[str] = None
+    ) -> BetResult:
+        """
+        Ставка в текущий раунд чата (первая ставка открывает новый)
+        Деньги списываются и ставка пишется в БД одной транзакцией
+        """
+        async with self._lock(chat_id):
+            # Предыдущий раунд ещё не выплачен: его строки в roulette_bets пересеклись бы с новыми
+            if chat_id in self._settling:
+                return BetResult(None, False, False)
+
+            current = self._rounds.get(chat_id)
+            created = current is None
+
+            if created:
+                start_time = datetime.now(timezone.utc) + timedelta(seconds=GROUP_GAME_DURATION)
+                deadline = start_time - timedelta(seconds=BETTING_DEADLINE_OFFSET)
+                current = Round(chat_id, start_time, deadline)
+            elif not current.accepting_bets:
+                return BetResult(None, False, False)
+
+            game = (chat_id, current.start_time, current.deadline) if created else None
+            bet = (chat_id, user_id, username, bet_type, amount)
+
+            if not await run_db(_write_bet, game, bet):
+                return BetResult(current, False, False)
+
+            if created:
+                self._rounds[chat_id] = current
+            current.add_bet(user_id, username, bet_type, amount, first_name)
+
+        return BetResult(current, True, created)
+
+    async def close(self, chat_id: int) -> Optional[Round]:
+        """
+        Снять раунд для розыгрыша: в БД он помечается неактивным и остаётся до выплаты
+        Повторный вызов после неудачного розыгрыша вернёт тот же раунд
+        Возвращает None, если раунда нет
+        """
+        async with self._lock(chat_id):
+            current = self._settling.get(chat_id)
+            if current is not None:
+                return current
+
+            current = self._rounds.get(chat_id)
+            if current is None:
+                return None
+
+            await run_db(_deactivate_round, chat_id)
+
+            del self._rounds[chat_id]
+            self._settling[chat_id] = current
+
+        return current
+
+    async def settle(self, chat_id: int, deltas: Dict[int, Tuple[int, float, int]]) -> None:
+        """Выплата по раунду и удаление его строк из БД одной транзакцией"""
+        async with self._lock(chat_id):
+            await run_db(_settle_round, chat_id, deltas)
+            self._settling.pop(chat_id, None)
+
+    async def load(self) -> List[Round]:
+        """
+        Восстановление раундов из БД (при старте бота)
+        Неактивные раунды закрыты, но не выплачены - их нужно разыграть сразу
+        """
+        games, bets = await run_db(_load_rounds)
+
+        for game in games:
+            chat_id = game['chat_id']
+            current = Round(
+                chat_id,
+                game['start_time'].replace(tzinfo=timezone.utc),
+                game['betting_deadline'].replace(tzinfo=timezone.utc)
+            )
+
+            if game['is_active']:
+                self._rounds[chat_id] = current
+            else:
+                self._settling[chat_id] = current
+
+        for bet in bets:
+            chat_id = bet['chat_id']
+            current = self._rounds.get(chat_id) or self._settling.get(chat_id)
+            if current is not None:
+                current.add_bet(bet['user_id'], bet['username'], bet['bet_type'], bet['amount'])
+
+        return [*self._rounds.values(), *self._settling.values()]
+
+
+# ======================= БАЗА ДАННЫХ =======================
+
+def _write_bet(game: Optional[Tuple], bet: Tuple) -> bool:
+    """Списание ставки, запись раунда (если он новый) и ставки (False - не хватило средств)"""
+    chat_id, user_id, _, _, amount = bet
+
+    with db_session() as session:
+        session.begin()
+        try:
+            session.execute(
+                "UPDATE users SET balance = balance - %s WHERE telegram_id = %s AND balance >= %s",
+                (amount, user_id, amount)
+            )
+            if session.rowcount != 1:
+                session.rollback()
+                return False
+
+            if game:
+                session.execute(
+                    "INSERT INTO roulette_games (chat_id, start_time, betting_deadline) VALUES (%s, %s, %s)",
+                    game
+                )
+            session.execute("""
+                INSERT INTO roulette_bets (chat_id, user_id, username, bet_type, amount)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE amount = amount + VALUES(amount)
+            """, bet)
+            session.commit()
+            return True
+        except Exception:
+            session.rollback()
+            raise
+
+
+def _deactivate_round(chat_id: int) -> None:
+    with db_session() as session:
+        session.execute("UPDATE roulette_games SET is_active = FALSE WHERE chat_id = %s", (chat_id,))
+        session.commit()
+
+
+def _settle_round(chat_id: int, deltas: Dict[int, Tuple[int, float, int]]) -> None:
+    with db_session() as session:
+        session.begin()
+        try:
+            write_player_deltas(session, deltas)
+            session.execute("DELETE FROM roulette_bets WHERE chat_id = %s", (chat_id,))
+            session.execute("DELETE FROM roulette_games WHERE chat_id = %s", (chat_id,))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+
+def _load_rounds() -> Tuple[List[Dict], List[Dict]]:
+    with db_session() as session:
+        games = session.fetchall(
+            "SELECT chat_id, start_time, betting_deadline, is_active FROM roulette_games"
+        )
+        if not games:
+            return [], []
+
+        placeholders = ", ".join(["%s"] * len(games))
+        bets = session.fetchall(
+            f"SELECT chat_id, user_id, username, bet_type, amount FROM roulette_bets WHERE chat_id IN ({placeholders})",
+            tuple(game['chat_id'] for game in games)
+        )
+
+    return games, bets
+
+
+ROUNDS = RoundRegistry()
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'Round',
+    'BetResult',
+    'RoundRegistry',
+    'ROUNDS'
+]
@@ -1,14 +1,16 @@
-import json
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from constants import BUSINESS_LIST
+from constants import BUSINESS_LIST, BUSINESS_BY_ID
 from helpers import (
-    get_cursor, get_balance, set_balance, spaced_num,
-    get_experience, ensure_user_exists, ensure_talent_exists,
-    get_user_talents, get_user_business_profile, add_user_business, ensure_business_profile, calculate_total_income
+    get_balance, adjust_balance, spaced_num,
+    get_experience, get_user_talents, get_user_business_profile, add_user_business,
+    pay_due_incomes
 )
+from repository import get_player_snapshot
+from db import run_db
+from notifications import notify
 
 
 # ======================= КОМАНДЫ =======================
@@ -68,21 +70,17 @@ async def send_shop_item(update_or_query, context: ContextTypes.DEFAULT_TYPE, is
     index = context.user_data.get('shop_index', 0)
     biz = BUSINESS_LIST[index]
 
-    user_id = update_or_query.effective_user.id
-    username = update_or_query.effective_user.username
-
-    ensure_user_exists(update_or_query.effective_user)
-    ensure_talent_exists(user_id)
-    ensure_business_profile(user_id)
+    user = update_or_query.effective_user
+    user_id = user.id
 
     # Получаем данные пользователя
-    user_lvl, user_experience, next_level_xp = get_experience(user_id, username)
-    mastery_lvl = get_user_talents(user_id).get("mastery", 0)
-    profile = get_user_business_profile(user_id)
-    balance = get_balance(user_id, username)
+    player = await get_player_snapshot(user_id, user.username, user.first_name, seen=True)
+    user_lvl = player.level
+    mastery_lvl = player.talents.get("mastery", 0)
+    balance = player.balance
 
     # Проверка доступности
-    already_owned = biz["id"] in profile["businesses_ids"]
+    already_owned = biz["id"] in player.businesses_ids
     requirements_met = user_lvl >= biz["lvl"] and mastery_lvl >= biz["mastery"]
     can_afford = balance >= biz["price"]
     available = requirements_met and not already_owned and can_afford
@@ -173,7 +171,6 @@ async def handle_shop_purchase(user_id: int, username: str, business_id: int) ->
     # Проверка требований
     user_lvl, user_xp, next_level_xp = get_experience(user_id, username)
     mastery_lvl = get_user_talents(user_id).get("mastery", 0)
-    balance = get_balance(user_id, username)
 
     if user_lvl < business['lvl']:
         return f"❌ Недостаточно уровня. Требуется: {business['lvl']}"
@@ -181,17 +178,16 @@ async def handle_shop_purchase(user_id: int, username: str, business_id: int) ->
     if mastery_lvl < business['mastery']:
         return f"❌ Недостаточно мастерства. Требуется: {business['mastery']}"
 
-    if balance < business['price']:
+    # Покупка
+    if not adjust_balance(user_id, -business['price']):
         return f"💸 Недостаточно средств. Требуется: {spaced_num(business['price'])} $miles"
 
-    # Покупка
     success = add_user_business(user_id, business_id)
 
     if not success:
+        adjust_balance(user_id, business['price'])
         return "⚠️ Ошибка при покупке."
 
-    set_balance(user_id, balance - business['price'])
-
     emoji = business.get("emoji", "🏬")
     return (
         f"✅ *Поздравляем с покупкой!*\n\n"
@@ -204,9 +200,10 @@ async def handle_shop_purchase(user_id: int, username: str, business_id: int) ->
 async def my_biz(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /my_biz - показать мои бизнесы"""
     user = update.effective_user
-    profile = get_user_business_profile(user.id)
+    # Снимок заодно начисляет накопившийся доход
+    player = await get_player_snapshot(user.id, user.username, user.first_name, seen=True)
 
-    if not profile['businesses_ids']:
+    if not player.businesses_ids:
         await update.message.reply_text(
             '⚠️ У тебя нет ни одного бизнеса\n'
             '▶️ Купи их в /shop',
@@ -215,7 +212,7 @@ async def my_biz(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Формируем заголовок
-    count = len(profile['businesses_ids'])
+    count = len(player.businesses_ids)
     if count == 1:
         message = f'<i>📍 У тебя есть {count} бизнес:</i>\n\n'
     elif 1 < count < 5:
@@ -225,8 +222,8 @@ async def my_biz(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Список бизнесов
     total_income = 0
-    for biz_id in profile['businesses_ids']:
-        biz = next((b for b in BUSINESS_LIST if b['id'] == biz_id), None)
+    for biz_id in player.businesses_ids:
+        biz = BUSINESS_BY_ID.get(biz_id)
         if not biz:
             continue
 
@@ -241,7 +238,7 @@ async def my_biz(update: Update, context: ContextTypes.DEFAULT_TYPE):
         total_income += biz['income']
 
     # Итоговый доход с множителями
-    final_income = calculate_total_income(user.id)
+    final_income = player.passive_income
 
     if final_income > total_income:
         message += (
@@ -258,48 +255,15 @@ async def my_biz(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def check_all_incomes(context: ContextTypes.DEFAULT_TYPE):
     """Периодическая проверка и начисление пассивного дохода"""
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
-    now = datetime.now()
-
-    cursor.execute("SELECT user_id, acquired_at, businesses_ids FROM user_businesses")
-    rows = cursor.fetchall()
-
-    for row in rows:
-        user_id = row['user_id']
-        acquired_at = row['acquired_at']
-        businesses = json.loads(row['businesses_ids'])
-        # Проверка времени
-        if not acquired_at or (now - acquired_at < timedelta(hours=1)):
-            continue
-
-        if len(businesses) == 0:
-            continue
-
-        # Расчёт дохода с бонусами
-        income = calculate_total_income(user_id)
-
-        # Начисление
-        current_balance = get_balance(user_id, None)
-        set_balance(user_id, current_balance + income)
+    try:
+        paid = await run_db(pay_due_incomes, datetime.now())
+    except Exception as e:
+        print(f"Ошибка начисления пассивного дохода: {e}")
+        return
 
-        # Обновление времени
-        cursor.execute(
-            "UPDATE user_businesses SET acquired_at = %s WHERE user_id = %s",
-            (now, user_id)
-        )
-        conn.commit()
-
-        # Уведомление
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"<blockquote>💵 Начислен пассивный доход: {spaced_num(income)} $miles</blockquote>",
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            print(f"Failed to notify user {user_id}: {e}")
+    # Уведомления отправит очередь, задача не ждёт
+    for user_id, income in paid:
+        notify(user_id, f"<blockquote>💵 Начислен пассивный доход: {spaced_num(income)} $miles</blockquote>")
 
 
 # ======================= ЭКСПОРТ =======================
@@ -9,10 +9,12 @@ from constants import (
     TALENT_COSTS, TALENT_LEVEL_REQUIREMENTS
 )
 from helpers import (
-    get_cursor, get_balance, set_balance, spaced_num,
+    get_balance, adjust_balance, spaced_num,
     get_experience, ensure_user_exists, ensure_talent_exists,
-    get_user_talents
+    get_user_talents, invalidate_user_talents
 )
+from repository import get_player_snapshot
+from db import async_db_session
 
 # ======================= КОНСТАНТЫ ТАЛАНТОВ =======================
 
@@ -157,11 +159,9 @@ async def talents(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         await query.answer()
 
-    ensure_user_exists(user)
-    ensure_talent_exists(user.id)
-
-    user_lvl = get_experience(user.id, user.username)[0]
-    talents_data = get_user_talents(user.id)
+    player = await get_player_snapshot(user.id, user.username, user.first_name, seen=True)
+    user_lvl = player.level
+    talents_data = player.talents
 
     # Формируем кнопки талантов
     keyboard = [
@@ -190,7 +190,7 @@ async def talents(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (
         f"✨ *ТАЛАНТЫ*\n\n"
         f"⭐️ Твой уровень: {user_lvl}\n"
-        f"💰 Баланс: {spaced_num(get_balance(user.id, user.username))} $miles\n\n"
+        f"💰 Баланс: {spaced_num(player.balance)} $miles\n\n"
         f"Выбери талант для прокачки:"
     )
 
@@ -334,17 +334,22 @@ async def upgrade_talent(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Прокачиваем талант
-    c = get_cursor()
-    cursor, conn = c[0], c[1]
-
+    if not adjust_balance(user_id, -data['next_price']):
+        await query.answer(
+            f"💸 Недостаточно средств. Стоимость: {spaced_num(data['next_price'])} $miles",
+            show_alert=True
+        )
+        return
     new_balance = balance - data['next_price']
-    set_balance(user_id, new_balance)
 
-    cursor.execute(
-        f"UPDATE talents SET {talent_name} = {talent_name} + 1 WHERE user_id = %s",
-        (user_id,)
-    )
-    conn.commit()
+    async with async_db_session() as session:
+        await session.execute(
+            f"UPDATE talents SET {talent_name} = {talent_name} + 1 WHERE user_id = %s",
+            (user_id,)
+        )
+        await session.commit()
+
+    invalidate_user_talents(user_id)
 
     await query.answer()
 
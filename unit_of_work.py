@@ -0,0 +1,168 @@
+"""
+Unit of work на один вызов хэндлера
+Игрок загружается одним запросом. Ставка списывается сразу атомарным UPDATE
+(иначе два параллельных хэндлера сыграли бы на одни и те же деньги), а
+начисления, опыт и поля users копятся в памяти и записываются одной
+транзакцией при выходе из async with. При откате списанное возвращается
+
+    async with unit_of_work(update.effective_user) as uow:
+        if not await uow.debit(bet):
+            ...
+        uow.credit(win)
+        uow.add_experience(exp)
+        if not await safe_reply_text(...):
+            uow.rollback()
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict
+
+from db import caller_label, db_session, run_db
+from helpers import PlayerSnapshot
+from levels import level_after_gain
+from repository import adjust_balance, get_player_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """Отложенные изменения одного игрока"""
+
+    def __init__(self, user, label: str = "?"):
+        self.user = user
+        self.label = label
+        self.player: PlayerSnapshot = None
+
+        # Уже списано из БД / ещё не записанные начисления
+        self._debited = 0
+        self._credited = 0
+        self._exp_gained = 0.0
+        self._fields: Dict[str, Any] = {}
+        self._rolled_back = False
+
+    async def __aenter__(self) -> "UnitOfWork":
+        self.player = await get_player_snapshot(self.user.id, self.user.username, self.user.first_name)
+        self.touch('last_seen')
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        # Хэндлер упал до подтверждения - ничего не записываем, ставку возвращаем
+        if exc_type is None and not self._rolled_back:
+            try:
+                await self.flush()
+                return
+            except Exception:
+                # Ставка уже списана отдельным commit'ом, а выигрыш и опыт не записались
+                logger.exception(
+                    "Изменения игрока %s не записаны (%s): +%s $miles, +%s EXP, ставка %s возвращается",
+                    self.user.id, self.label, self._credited, self._exp_gained, self._debited
+                )
+
+        if self._debited:
+            await self._refund()
+
+    async def _refund(self) -> None:
+        try:
+            await adjust_balance(self.user.id, self._debited, None)
+        except Exception:
+            logger.exception("Ставка %s игрока %s (%s) не возвращена", self._debited, self.user.id, self.label)
+
+    # ======================= СОСТОЯНИЕ =======================
+
+    @property
+    def balance(self) -> int:
+        return self.player.balance - self._debited + self._credited
+
+    @property
+    def experience(self) -> float:
+        return round(self.player.experience + self._exp_gained, 1)
+
+    @property
+    def level(self) -> int:
+        return level_after_gain(self.player.level, self.experience)
+
+    # ======================= ИЗМЕНЕНИЯ =======================
+
+    async def debit(self, amount: int) -> bool:
+        """Списание сразу в БД с проверкой баланса (False если не хватает средств)"""
+        amount = int(round(amount))
+        if not await adjust_balance(self.user.id, -amount):
+            return False
+
+        self._debited += amount
+        return True
+
+    def credit(self, amount: int) -> None:
+        """Начисление (записывается при выходе)"""
+        self._credited += int(round(amount))
+
+    def add_experience(self, amount: float) -> Dict[str, Any]:
+        """Начисление опыта, возвращает то же, что update_experience"""
+        level_before = self.level
+        self._exp_gained += amount
+
+        return {
+            'leveled_up': self.level > level_before,
+            'new_level': self.level,
+            'new_exp': self.experience
+        }
+
+    def touch(self, field: str) -> None:
+        """Отметка времени в поле users (last_lucky_wheel, last_steal, ...)"""
+        self._fields[field] = datetime.now()
+
+    def update(self, **fields) -> None:
+        """Произвольные поля users"""
+        self._fields.update(fields)
+
+    def rollback(self) -> None:
+        """Отменить все накопленные изменения и вернуть списанное"""
+        self._rolled_back = True
+
+    # ======================= ЗАПИСЬ =======================
+
+    async def flush(self) -> bool:
+        return await run_db(self._flush)
+
+    def _flush(self) -> bool:
+        # Списание уже прошло в debit(), здесь только начисления - проверка баланса не нужна
+        assignments = ["balance = balance + %s"]
+        params = [self._credited]
+
+        if self._exp_gained:
+            assignments += ["experience = ROUND(experience + %s, 1)", "level = GREATEST(level, %s)"]
+            params += [self._exp_gained, self.level]
+
+        for field, value in self._fields.items():
+            assignments.append(f"{field} = %s")
+            params.append(value)
+
+        params.append(self.user.id)
+
+        # Один UPDATE - одна транзакция и один commit на весь хэндлер
+        with db_session() as session:
+            session.execute(
+                f"UPDATE users SET {', '.join(assignments)} WHERE telegram_id = %s",
+                tuple(params)
+            )
+            session.commit()
+
+            if session.rowcount != 1:
+                logger.warning("Изменения игрока %s не записаны (%s): игрок не найден", self.user.id, self.label)
+                return False
+
+            return True
+
+
+def unit_of_work(user) -> UnitOfWork:
+    """Новый unit of work (использовать только через async with)"""
+    return UnitOfWork(user, caller_label())
+
+
+# ======================= ЭКСПОРТ =======================
+
+__all__ = [
+    'UnitOfWork',
+    'unit_of_work'
+]